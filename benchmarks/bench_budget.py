@@ -0,0 +1,95 @@
+"""Compare output-budget accounting by re-encoding with sizes taken from the raw read.
+
+Run from the repository root:
+
+    python benchmarks/bench_budget.py --mib 20
+
+``encode`` is what the serializer used to do: encode every decoded file to
+UTF-8 only to measure it. ``raw`` is the current accounting, which reads the
+size off the raw bytes and only encodes text whose bytes decoding changed.
+"Encoded" counts the temporary bytes allocated just for measuring.
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import patch
+
+from chareco.core import utils
+
+_ASCII_LINE = "def function_{index}(value):  # plain ASCII source\n"
+_UNICODE_LINE = "message_{index} = 'Grüße, naïve café — ✓'\n"
+
+
+def build_tree(root: Path, total_bytes: int, file_bytes: int = 64 * 1024) -> None:
+    """Write ``total_bytes`` of text: mostly ASCII, every tenth file with non-ASCII text."""
+    for index in range(max(total_bytes // file_bytes, 1)):
+        directory = root / f"pkg{index // 100:03d}"
+        directory.mkdir(exist_ok=True)
+        line = _UNICODE_LINE if index % 10 == 0 else _ASCII_LINE
+        text = "".join(line.format(index=row) for row in range(file_bytes // len(line)))
+        encoding = "utf-16" if index % 50 == 0 else "utf-8"
+        (directory / f"module{index:05d}.py").write_text(text, encoding=encoding)
+
+
+@contextmanager
+def encoding_mode(mode: str):
+    counter: Counter[str] = Counter()
+    original = utils.utf8_size
+
+    def encoded(text: str) -> int:
+        size = len(text.encode("utf-8"))
+        counter["calls"] += 1
+        counter["bytes"] += size
+        return size
+
+    def counted(text: str) -> int:
+        if not text.isascii():
+            return encoded(text)
+        return original(text)
+
+    if mode == "encode":
+        with patch.object(utils, "utf8_size", encoded), \
+                patch.object(utils, "_decoded_size", lambda _raw, text: encoded(text)):
+            yield counter
+    else:
+        with patch.object(utils, "utf8_size", counted):
+            yield counter
+
+
+def measure(mode: str, root: Path, max_total_bytes: int, repeat: int) -> None:
+    timings = []
+    for _ in range(repeat):
+        with encoding_mode(mode) as counter:
+            started = time.perf_counter()
+            content, positions, _files = utils.concatenate_files(root, max_total_bytes=max_total_bytes)
+            timings.append(time.perf_counter() - started)
+    print(
+        f"{mode:<7} {len(positions):>6,} files  {len(content.encode('utf-8')) / 2**20:6.1f} MiB out  "
+        f"{min(timings) * 1000:8.1f} ms  encoded {counter['bytes'] / 2**20:7.2f} MiB "
+        f"in {counter['calls']:,} calls"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mib", type=float, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    total_bytes = int(args.mib * 2**20)
+
+    with tempfile.TemporaryDirectory(prefix="chareco-bench-") as directory:
+        root = Path(directory)
+        print(f"Building {args.mib:g} MiB of text under {root}…")
+        build_tree(root, total_bytes)
+        for mode in ("encode", "raw"):
+            measure(mode, root, total_bytes * 2, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
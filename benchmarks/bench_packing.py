@@ -0,0 +1,61 @@
+"""Time relevance packing of many candidates under a byte budget.
+
+Run from the repository root:
+
+    python benchmarks/bench_packing.py --files 100000
+
+Candidates are synthetic, so only scoring and selection are timed; reading
+files for keyword hits or token counts is not included.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from chareco.core.models import PackingOptions
+from chareco.core.packing import Candidate, pack_files
+
+
+def build_candidates(count: int, seed: int = 7) -> list[Candidate]:
+    rng = random.Random(seed)
+    folders = ("src", "src/core", "tests", "docs", "scripts", "vendor/lib")
+    return [
+        Candidate(
+            relative_path=f"{rng.choice(folders)}/module{index:06d}.py",
+            size=int(rng.lognormvariate(8, 1.2)),
+            mtime_ns=rng.randrange(1_600_000_000, 1_700_000_000) * 1_000_000_000,
+            keyword_hits=rng.choice((0, 0, 0, 1, 4)),
+        )
+        for index in range(count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--budget-mib", type=float, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    candidates = build_candidates(args.files)
+    budget = int(args.budget_mib * 2**20)
+    for strategy in ("greedy", "knapsack"):
+        packing = PackingOptions(
+            path_weights=(("src/*", 2.0), ("src/core/*", 1.0), ("tests/*", -1.0), ("vendor/*", -2.0)),
+            keywords=("cache",),
+            recency_weight=0.5,
+            small_file_weight=0.5,
+            strategy=strategy,
+        )
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            selected = pack_files(candidates, packing, budget)
+            timings.append(time.perf_counter() - started)
+        print(f"{strategy:<9} {len(candidates):>8,} candidates  {len(selected):>7,} selected  {min(timings) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Compare the os.walk/Path scan with the scandir walker on a synthetic tree.
+
+Run from the repository root:
+
+    python benchmarks/bench_scan.py --files 100000
+
+Stat-family calls are counted through Python-level wrappers, so the numbers
+are the calls ChaReCo issues, not kernel-level ``strace`` totals. A
+``DirEntry.stat()`` is counted once per entry because its result is cached.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from chareco.core import utils
+from chareco.core.filters import FilterSpec
+
+
+class _CountingEntry:
+    """Proxy for ``os.DirEntry`` that records the first uncached ``stat``."""
+
+    __slots__ = ("_entry", "_counter", "_stat_seen")
+
+    def __init__(self, entry: os.DirEntry[str], counter: Counter[str]) -> None:
+        self._entry = entry
+        self._counter = counter
+        self._stat_seen = False
+
+    def __getattr__(self, name: str):
+        return getattr(self._entry, name)
+
+    def stat(self, *, follow_symlinks: bool = True) -> os.stat_result:
+        if not self._stat_seen:
+            self._counter["DirEntry.stat"] += 1
+            self._stat_seen = True
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+
+class _CountingScandir:
+    def __init__(self, iterator, counter: Counter[str]) -> None:
+        self._iterator = iterator
+        self._counter = counter
+
+    def __enter__(self) -> _CountingScandir:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._iterator.close()
+
+    def __iter__(self) -> _CountingScandir:
+        return self
+
+    def __next__(self) -> _CountingEntry:
+        return _CountingEntry(next(self._iterator), self._counter)
+
+    def close(self) -> None:
+        self._iterator.close()
+
+
+@contextmanager
+def count_calls():
+    counter: Counter[str] = Counter()
+    original_stat, original_lstat, original_scandir = os.stat, os.lstat, os.scandir
+
+    def counting_stat(path, *args, follow_symlinks=True, **kwargs):
+        counter["stat" if follow_symlinks else "lstat"] += 1
+        return original_stat(path, *args, follow_symlinks=follow_symlinks, **kwargs)
+
+    def counting_lstat(path, *args, **kwargs):
+        counter["lstat"] += 1
+        return original_lstat(path, *args, **kwargs)
+
+    def counting_scandir(path="."):
+        counter["scandir"] += 1
+        return _CountingScandir(original_scandir(path), counter)
+
+    os.stat, os.lstat, os.scandir = counting_stat, counting_lstat, counting_scandir
+    try:
+        yield counter
+    finally:
+        os.stat, os.lstat, os.scandir = original_stat, original_lstat, original_scandir
+
+
+def build_tree(root: Path, file_count: int, files_per_directory: int = 100) -> None:
+    for index in range(file_count):
+        directory = root / f"pkg{index // (files_per_directory * 10):04d}" / f"mod{index // files_per_directory:05d}"
+        if index % files_per_directory == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"file{index:06d}.py").write_bytes(b"x = 1\n")
+
+
+def legacy_walk(root: Path) -> int:
+    """The pre-scandir walk: ``Path`` objects and per-entry stat calls."""
+    count = 0
+    for current_root, directory_names, file_names in os.walk(root, topdown=True, followlinks=False):
+        current = Path(current_root)
+        utils._normalise_path(current.relative_to(root))
+        directory_names[:] = sorted(
+            name for name in directory_names if not (current / name).is_symlink()
+        )
+        for filename in sorted(file_names):
+            file_path = current / filename
+            if file_path.is_symlink():
+                continue
+            utils._normalise_path(file_path.relative_to(root))
+            file_path.stat()
+            count += 1
+    return count
+
+
+def scandir_walk(root: Path) -> int:
+    count = 0
+    for _relative_root, entries in utils._walk_tree(str(root), FilterSpec.compile()):
+        for entry in entries:
+            entry.stat(follow_symlinks=False)
+            count += 1
+    return count
+
+
+def measure(label: str, walk, root: Path, repeat: int) -> None:
+    with count_calls() as counter:
+        files = walk(root)
+    best = min(_timed(walk, root) for _ in range(repeat))
+    calls = ", ".join(f"{name}={value:,}" for name, value in sorted(counter.items()))
+    print(f"{label:<10} {files:>8,} files  {best * 1000:9.1f} ms  {sum(counter.values()):>9,} calls ({calls})")
+
+
+def _timed(walk, root: Path) -> float:
+    started = time.perf_counter()
+    walk(root)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="chareco-bench-") as directory:
+        root = Path(directory)
+        print(f"Building {args.files:,} files under {root}…")
+        build_tree(root, args.files)
+        measure("os.walk", legacy_walk, root, args.repeat)
+        measure("scandir", scandir_walk, root, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
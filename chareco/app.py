@@ -1,8 +1,10 @@
+import multiprocessing
 import sys
 from PyQt6.QtWidgets import QApplication
 from chareco.gui import App
 
 def main():
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setOrganizationName("ChaReCo")
     app.setApplicationName("ChaReCo")
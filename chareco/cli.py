@@ -6,12 +6,21 @@ import argparse
 import os
 import re
 import sys
+import tempfile
+from collections.abc import Callable
 from pathlib import Path
+from typing import TextIO, TypeVar
 
-from chareco.core.models import AnalysisOptions
+from chareco.core.cache import clear_cache, user_cache_dir
+from chareco.core.chunking import MIN_PART_TOKENS, part_header
+from chareco.core.models import AnalysisOptions, ContextPart, PackingOptions
+from chareco.core.packing import PACKING_STRATEGIES
 from chareco.core.service import run_analysis
 
 
+_T = TypeVar("_T")
+
+
 def _rules(value: str) -> tuple[str, ...]:
     return tuple(rule for rule in re.split(r"[,\s]+", value.strip()) if rule)
 
@@ -23,23 +32,172 @@ def _mib(value: str) -> int:
     return int(parsed * 1024 * 1024)
 
 
+def _tokens(value: str) -> int:
+    parsed = int(value)
+    if parsed < 1:
+        raise argparse.ArgumentTypeError("must be a positive number of tokens")
+    return parsed
+
+
+def _part_tokens(value: str) -> int:
+    parsed = int(value)
+    if parsed < MIN_PART_TOKENS:
+        raise argparse.ArgumentTypeError(f"must be at least {MIN_PART_TOKENS} tokens")
+    return parsed
+
+
+def _path_weight(value: str) -> tuple[str, float]:
+    pattern, separator, weight = value.rpartition("=")
+    if not separator or not pattern:
+        raise argparse.ArgumentTypeError("expected GLOB=WEIGHT, for example 'src/*=2'")
+    try:
+        return pattern, float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid weight: {weight}") from None
+
+
+def _workers(value: str) -> int:
+    parsed = int(value)
+    if parsed < 1 or parsed > 64:
+        raise argparse.ArgumentTypeError("must be between 1 and 64")
+    return parsed
+
+
+def _write_output(path: Path, produce: Callable[[TextIO], _T], newline: str | None = None) -> _T:
+    """Stream into a sibling temporary file so a failed run never leaves partial output."""
+    descriptor, temporary_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    umask = os.umask(0)
+    os.umask(umask)
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf-8", newline=newline) as stream:
+            os.chmod(temporary_path, 0o666 & ~umask)
+            produced = produce(stream)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    return produced
+
+
+def _part_path(path: Path, number: int, count: int) -> Path:
+    return path.with_name(f"{path.stem}.part{number:0{max(len(str(count)), 2)}d}{path.suffix}")
+
+
+def _write_parts(path: Path, parts: tuple[ContextPart, ...]) -> None:
+    """Copy each part out of the written output, one file per part.
+
+    Part offsets count characters, so the output is read back untranslated,
+    as it was written.
+    """
+    with path.open(encoding="utf-8", newline="") as source:
+        for number, part in enumerate(parts, start=1):
+            def produce(stream: TextIO) -> None:
+                stream.write(part_header(number, len(parts)) + part.continues)
+                stream.write(source.read(part.end - part.start))
+
+            _write_output(_part_path(path, number, len(parts)), produce, newline="")
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Create bounded, searchable-ready context from a repository or local folder."
     )
-    parser.add_argument("source", help="Repository URL or local folder path")
+    parser.add_argument("source", nargs="?", help="Repository URL or local folder path")
     parser.add_argument("--local", action="store_true", help="Treat source as a local folder")
     parser.add_argument("--branch", help="Remote branch or tag to clone")
+    parser.add_argument(
+        "--rev",
+        help="Read this commit, branch, or tag of a local folder's git repository instead of its working tree",
+    )
     parser.add_argument("--include", default="", help="Comma- or space-separated extensions to include")
     parser.add_argument("--exclude", default="", help="Comma- or space-separated extensions to exclude")
     parser.add_argument("--exclude-pattern", action="append", default=[], help="Glob pattern to exclude")
     parser.add_argument("--include-git", action="store_true", help="Include Git metadata files")
+    parser.add_argument(
+        "--gitignore",
+        action="store_true",
+        help="Skip paths ignored by .gitignore files and .git/info/exclude",
+    )
     parser.add_argument("--include-license", action="store_true", help="Include LICENSE files")
     parser.add_argument("--exclude-readme", action="store_true", help="Exclude README files")
     parser.add_argument("--structure-only", action="store_true", help="Do not concatenate file content")
     parser.add_argument("--snapshot", action="store_true", help="Analyze a temporary local-folder snapshot")
+    parser.add_argument(
+        "--tracked-only",
+        action="store_true",
+        help="List only files tracked in the local folder's git index, without walking untracked directories",
+    )
     parser.add_argument("--max-file-mib", type=_mib, default=1024 * 1024, help="Per-file limit (default: 1)")
     parser.add_argument("--max-output-mib", type=_mib, default=20 * 1024 * 1024, help="Total output limit (default: 20)")
+    parser.add_argument(
+        "--max-tokens",
+        type=_tokens,
+        help="Stop adding files at this many cl100k_base tokens of content (default: no limit)",
+    )
+    parser.add_argument(
+        "--max-part-tokens",
+        type=_part_tokens,
+        help="Also split the output into numbered part files of at most this many tokens (needs --output)",
+    )
+    parser.add_argument(
+        "--pack",
+        choices=PACKING_STRATEGIES,
+        help="Fill the budget with the most relevant files instead of stopping in path order",
+    )
+    parser.add_argument(
+        "--prefer",
+        action="append",
+        type=_path_weight,
+        default=[],
+        metavar="GLOB=WEIGHT",
+        help="Relevance weight for matching paths when packing; negative weights demote",
+    )
+    parser.add_argument("--keyword", action="append", default=[], help="Rank files mentioning this text higher when packing")
+    parser.add_argument("--prefer-recent", type=float, default=0.0, metavar="WEIGHT", help="Weight of modification time when packing")
+    parser.add_argument("--prefer-small", type=float, default=0.0, metavar="WEIGHT", help="Weight of small file size when packing")
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Write files identical to an earlier file as a one-line reference to it",
+    )
+    parser.add_argument(
+        "--strip-python",
+        action="store_true",
+        help="Remove comments and docstrings from .py files; files that do not parse are kept as they are",
+    )
+    parser.add_argument(
+        "--collapse-blank-lines",
+        action="store_true",
+        help="With --strip-python, also shrink runs of blank lines to one",
+    )
+    parser.add_argument(
+        "--outline",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Write matching .py files as outlines: imports, signatures, and docstring first lines",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write any on-disk cache")
+    parser.add_argument(
+        "--content-cache",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Reuse decoded file content for unchanged local files (default: off)",
+    )
+    parser.add_argument(
+        "--cache-max-mib",
+        type=_mib,
+        default=256 * 1024 * 1024,
+        help="Content cache size before least recently used entries are evicted (default: 256)",
+    )
+    parser.add_argument(
+        "--repo-cache-max-mib",
+        type=_mib,
+        default=1024 * 1024 * 1024,
+        help="Cached remote repositories before least recently used ones are deleted (default: 1024)",
+    )
+    parser.add_argument("--clear-cache", action="store_true", help="Delete ChaReCo's on-disk caches first")
+    parser.add_argument("--workers", type=_workers, default=4, help="Parallel file readers (default: 4)")
     parser.add_argument(
         "--pat-env",
         metavar="VARIABLE",
@@ -50,10 +208,34 @@ def build_parser() -> argparse.ArgumentParser:
 
 
 def main(argv: list[str] | None = None) -> int:
-    args = build_parser().parse_args(argv)
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.clear_cache:
+        clear_cache(user_cache_dir())
+        if args.source is None:
+            return 0
+    if args.source is None:
+        parser.error("the following arguments are required: source")
+    if args.max_part_tokens is not None and args.output is None:
+        parser.error("--max-part-tokens needs --output")
+    if args.collapse_blank_lines and not args.strip_python:
+        parser.error("--collapse-blank-lines needs --strip-python")
+    if args.rev is not None and (not args.local or args.snapshot):
+        parser.error("--rev needs --local and cannot be combined with --snapshot")
+    if args.tracked_only and (not args.local or args.snapshot):
+        parser.error("--tracked-only needs --local and cannot be combined with --snapshot")
     if args.local and not Path(args.source).is_dir():
         raise SystemExit(f"Not a directory: {args.source}")
     patterns = [pattern for value in args.exclude_pattern for pattern in _rules(value)]
+    packing = None
+    if args.pack or args.prefer or args.keyword or args.prefer_recent or args.prefer_small:
+        packing = PackingOptions(
+            path_weights=tuple(args.prefer),
+            keywords=tuple(args.keyword),
+            recency_weight=args.prefer_recent,
+            small_file_weight=args.prefer_small,
+            strategy=args.pack or "greedy",
+        )
     options = AnalysisOptions(
         source_path=args.source,
         is_local=args.local,
@@ -61,24 +243,47 @@ def main(argv: list[str] | None = None) -> int:
         exclude_extensions=_rules(args.exclude),
         exclude_patterns=tuple(patterns),
         include_git=args.include_git,
+        respect_gitignore=args.gitignore,
         include_license=args.include_license,
         exclude_readme=args.exclude_readme,
         concatenate=not args.structure_only,
         copy_local_folder=args.snapshot,
+        tracked_only=args.tracked_only,
         branch=args.branch,
+        revision=args.rev,
         max_file_bytes=args.max_file_mib,
         max_total_bytes=args.max_output_mib,
+        max_total_tokens=args.max_tokens,
+        max_part_tokens=args.max_part_tokens,
+        packing=packing,
+        deduplicate=args.dedupe,
+        strip_python=args.strip_python,
+        collapse_blank_lines=args.collapse_blank_lines,
+        python_skeleton=tuple(pattern for value in args.outline for pattern in _rules(value)),
+        read_workers=args.workers,
+        cache_dir=None if args.no_cache else str(user_cache_dir()),
+        content_cache=args.content_cache,
+        content_cache_max_bytes=args.cache_max_mib,
+        repository_cache_max_bytes=args.repo_cache_max_mib,
     )
     pat = os.environ.get(args.pat_env) if args.pat_env else None
 
     def progress(message: str, _percent: int) -> None:
         print(message, file=sys.stderr)
 
-    result = run_analysis(options, pat=pat, progress=progress)
     if args.output:
-        args.output.write_text(result.full_text, encoding="utf-8")
+        result = _write_output(
+            args.output,
+            lambda stream: run_analysis(options, pat=pat, progress=progress, output=stream),
+            # Untranslated newlines keep part offsets valid in the written file.
+            newline="" if args.max_part_tokens is not None else None,
+        )
+        if result.parts:
+            progress(f"Writing {len(result.parts)} part files…", 100)
+            _write_parts(args.output, result.parts)
     else:
-        print(result.full_text)
+        run_analysis(options, pat=pat, progress=progress, output=sys.stdout)
+        print()
     return 0
 
 
@@ -6,7 +6,7 @@ import logging
 
 from PyQt6.QtCore import QThread, pyqtSignal
 
-from chareco.core.models import AnalysisOptions
+from chareco.core.models import AnalysisOptions, AnalysisResult
 from chareco.core.service import AnalysisCancelled, run_analysis
 
 
@@ -21,9 +21,17 @@ class AnalysisThread(QThread):
     error_signal = pyqtSignal(str)
     cancelled_signal = pyqtSignal()
 
-    def __init__(self, options: AnalysisOptions, pat: str | None = None) -> None:
+    def __init__(
+        self,
+        options: AnalysisOptions,
+        pat: str | None = None,
+        previous: AnalysisResult | None = None,
+        changed_directories: frozenset[str] | None = None,
+    ) -> None:
         super().__init__()
         self.options = options
+        self.previous = previous
+        self.changed_directories = changed_directories
         self._pat = pat or None
 
     def request_cancel(self) -> None:
@@ -36,6 +44,8 @@ class AnalysisThread(QThread):
                 pat=self._pat,
                 progress=self.progress_signal.emit,
                 is_cancelled=self.isInterruptionRequested,
+                previous=self.previous,
+                changed_directories=self.changed_directories,
             )
         except AnalysisCancelled:
             self.cancelled_signal.emit()
@@ -46,3 +56,4 @@ class AnalysisThread(QThread):
             self.finished_signal.emit(result)
         finally:
             self._pat = None
+            self.previous = None
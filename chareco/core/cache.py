@@ -0,0 +1,386 @@
+"""Persistent caches stored under the user's cache directory."""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTENT_CACHE_BYTES = 256 * 1024 * 1024
+_CONTENT_DATABASE = "content.sqlite3"
+_CACHE_ENTRIES = (
+    _CONTENT_DATABASE,
+    f"{_CONTENT_DATABASE}-wal",
+    f"{_CONTENT_DATABASE}-shm",
+    "notebooks",
+    "python",
+    "repositories",
+)
+
+
+def user_cache_dir() -> Path:
+    """Return ChaReCo's per-user cache directory; ``CHARECO_CACHE_DIR`` overrides it."""
+    override = os.environ.get("CHARECO_CACHE_DIR")
+    if override:
+        return Path(override)
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+        return Path(base) / "ChaReCo" / "Cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / "ChaReCo"
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "chareco"
+
+
+class ConversionCache:
+    """Content-addressed text cache for expensive, deterministic conversions.
+
+    Entries live in ``<directory>/<namespace>/<key[:2]>/<key>.txt`` and are
+    written atomically, so concurrent processes may share one directory.
+    Instances are picklable and can be handed to process-pool workers.
+    """
+
+    def __init__(self, directory: str | Path, namespace: str) -> None:
+        self.directory = Path(directory) / namespace
+
+    @staticmethod
+    def key(content: bytes, *salt: str) -> str:
+        """Hash content together with anything that changes the conversion output."""
+        digest = hashlib.sha256()
+        for value in salt:
+            digest.update(value.encode("utf-8"))
+            digest.update(b"\0")
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.txt"
+
+    def get(self, key: str) -> str | None:
+        try:
+            return self._path(key).read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def put(self, key: str, text: str) -> None:
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            descriptor, temporary_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "w", encoding="utf-8", newline="") as handle:
+                    handle.write(text)
+                os.replace(temporary_path, path)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+        except OSError as error:
+            logger.warning("Could not write cache entry %s: %s", path, error)
+
+
+def clear_cache(directory: str | Path) -> None:
+    """Delete ChaReCo's cache entries without touching unrelated files."""
+    root = Path(directory)
+    for name in _CACHE_ENTRIES:
+        target = root / name
+        try:
+            if target.is_dir() and not target.is_symlink():
+                shutil.rmtree(target)
+            elif target.exists() or target.is_symlink():
+                target.unlink()
+        except OSError as error:
+            logger.warning("Could not remove cache entry %s: %s", target, error)
+
+
+StatKey = tuple[int, int, int, int]
+
+
+def stat_key(status: os.stat_result) -> StatKey | None:
+    """Identify one file version by ``(device, inode, size, mtime_ns)``.
+
+    Returns ``None`` where the platform reports no inode, because such a key
+    could not tell two files apart.
+    """
+    if not status.st_ino:
+        return None
+    return status.st_dev, status.st_ino, status.st_size, status.st_mtime_ns
+
+
+@dataclass(frozen=True, slots=True)
+class CachedFile:
+    """What is known about one file version; ``decoded`` says whether ``content`` is.
+
+    ``stored_bytes`` is the UTF-8 size of ``content``.
+    """
+
+    binary: bool | None
+    decoded: bool
+    content: str | None
+    token_counts: dict[str, int]
+    stored_bytes: int = 0
+
+
+class ContentCache:
+    """SQLite cache of binary verdicts, decoded text, and token counts.
+
+    Rows are addressed by ``(device, inode)`` and only returned when size and
+    mtime also match, so a changed file replaces its stale row. The total size
+    of stored text, plus ``_ROW_OVERHEAD_BYTES`` for every row, is capped;
+    least recently used rows are evicted first.
+    The cache is safe to share between threads and between ChaReCo processes:
+    writes are committed in small batches, at least every
+    ``_COMMIT_AFTER_SECONDS`` and on ``flush``, so another process only waits
+    briefly for the write lock. Any SQLite failure disables the cache for the
+    rest of the analysis.
+    """
+
+    _COMMIT_EVERY = 256
+    # Rough on-disk cost of a row apart from its text, so rows holding only a verdict count too.
+    _ROW_OVERHEAD_BYTES = 128
+    _COMMIT_AFTER_SECONDS = 0.25
+
+    def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_CONTENT_CACHE_BYTES) -> None:
+        self.path = Path(directory) / _CONTENT_DATABASE
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._touched: set[tuple[int, int]] = set()
+        self._pending_writes = 0
+        self._transaction_started: float | None = None
+        self._connection: sqlite3.Connection | None = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    device INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    binary INTEGER,
+                    decoded INTEGER NOT NULL DEFAULT 0,
+                    content TEXT,
+                    token_counts TEXT NOT NULL DEFAULT '',
+                    stored_bytes INTEGER NOT NULL DEFAULT 0,
+                    accessed INTEGER NOT NULL,
+                    PRIMARY KEY (device, inode)
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS files_accessed ON files (accessed)")
+            connection.commit()
+            self._connection = connection
+        except (OSError, sqlite3.Error) as error:
+            logger.warning("Content cache is unavailable (%s): %s", self.path, error)
+
+    def __enter__(self) -> ContentCache:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def _disable(self, error: Exception) -> None:
+        logger.warning("Disabling content cache after an error: %s", error)
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+
+    def get(self, key: StatKey | None) -> CachedFile | None:
+        if key is None:
+            return None
+        with self._lock:
+            if self._connection is None:
+                return None
+            try:
+                row = self._connection.execute(
+                    "SELECT binary, decoded, content, token_counts, stored_bytes FROM files "
+                    "WHERE device = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                    key,
+                ).fetchone()
+                self._commit_if_due()
+            except sqlite3.Error as error:
+                self._disable(error)
+                return None
+            if row is None:
+                return None
+            self._touched.add(key[:2])
+        binary, decoded, content, token_counts, stored_bytes = row
+        return CachedFile(
+            binary=None if binary is None else bool(binary),
+            decoded=bool(decoded),
+            content=content,
+            token_counts=_parse_token_counts(token_counts),
+            stored_bytes=stored_bytes,
+        )
+
+    def put_binary(self, key: StatKey | None, binary: bool) -> None:
+        self._write(
+            key,
+            "INSERT INTO files (device, inode, size, mtime_ns, binary, accessed) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (device, inode) DO UPDATE SET binary = excluded.binary, "
+            "accessed = excluded.accessed "
+            "WHERE files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns",
+            (int(binary),),
+            replace_stale=True,
+        )
+
+    def put_content(self, key: StatKey | None, content: str | None, stored_bytes: int) -> None:
+        """Store decoded text and its UTF-8 size; ``None`` records an undecodable file."""
+        self._write(
+            key,
+            "INSERT INTO files (device, inode, size, mtime_ns, binary, decoded, content, "
+            "stored_bytes, accessed) VALUES (?, ?, ?, ?, 0, 1, ?, ?, ?) "
+            "ON CONFLICT (device, inode) DO UPDATE SET binary = 0, decoded = 1, "
+            "content = excluded.content, stored_bytes = excluded.stored_bytes, "
+            "accessed = excluded.accessed "
+            "WHERE files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns",
+            (content, stored_bytes if content is not None else 0),
+            replace_stale=True,
+        )
+
+    def put_token_count(self, key: StatKey | None, encoding: str, count: int) -> None:
+        if key is None:
+            return
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                row = self._connection.execute(
+                    "SELECT token_counts FROM files "
+                    "WHERE device = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                    key,
+                ).fetchone()
+                if row is None:
+                    return
+                counts = _parse_token_counts(row[0])
+                counts[encoding] = count
+                self._connection.execute(
+                    "UPDATE files SET token_counts = ? WHERE device = ? AND inode = ?",
+                    (_format_token_counts(counts), *key[:2]),
+                )
+                self._after_write()
+            except sqlite3.Error as error:
+                self._disable(error)
+
+    def _write(
+        self,
+        key: StatKey | None,
+        statement: str,
+        values: tuple[object, ...],
+        *,
+        replace_stale: bool,
+    ) -> None:
+        if key is None:
+            return
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                if replace_stale:
+                    self._connection.execute(
+                        "DELETE FROM files WHERE device = ? AND inode = ? "
+                        "AND (size != ? OR mtime_ns != ?)",
+                        key,
+                    )
+                self._connection.execute(statement, (*key, *values, time.time_ns()))
+                self._after_write()
+            except sqlite3.Error as error:
+                self._disable(error)
+
+    def _after_write(self) -> None:
+        if self._transaction_started is None:
+            self._transaction_started = time.monotonic()
+        self._pending_writes += 1
+        self._commit_if_due()
+
+    def _commit_if_due(self) -> None:
+        # An open write transaction holds the database lock against other processes.
+        if self._transaction_started is None:
+            return
+        if (
+            self._pending_writes >= self._COMMIT_EVERY
+            or time.monotonic() - self._transaction_started >= self._COMMIT_AFTER_SECONDS
+        ):
+            self._commit()
+
+    def flush(self) -> None:
+        """Commit pending writes, for example before a long phase that does not use the cache."""
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._commit()
+            except sqlite3.Error as error:
+                self._disable(error)
+
+    def _commit(self) -> None:
+        connection = self._connection
+        if connection is None:
+            return
+        if self._touched:
+            connection.executemany(
+                "UPDATE files SET accessed = ? WHERE device = ? AND inode = ?",
+                [(time.time_ns(), *identity) for identity in self._touched],
+            )
+            self._touched.clear()
+        total = connection.execute(
+            "SELECT COALESCE(SUM(stored_bytes), 0) + COUNT(*) * ? FROM files",
+            (self._ROW_OVERHEAD_BYTES,),
+        ).fetchone()[0]
+        if total > self.max_bytes:
+            self._evict(total - int(self.max_bytes * 0.9))
+        connection.commit()
+        self._pending_writes = 0
+        self._transaction_started = None
+
+    def _evict(self, excess: int) -> None:
+        victims: list[tuple[int, int]] = []
+        for device, inode, stored_bytes in self._connection.execute(
+            "SELECT device, inode, stored_bytes FROM files ORDER BY accessed"
+        ):
+            victims.append((device, inode))
+            excess -= stored_bytes + self._ROW_OVERHEAD_BYTES
+            if excess <= 0:
+                break
+        self._connection.executemany("DELETE FROM files WHERE device = ? AND inode = ?", victims)
+        logger.info("Evicted %s least recently used content cache entries", len(victims))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self._commit()
+                self._connection.close()
+            except sqlite3.Error as error:
+                logger.warning("Could not save content cache: %s", error)
+            self._connection = None
+
+
+def _parse_token_counts(value: str) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for item in value.split(",") if value else ():
+        encoding, _separator, count = item.partition("=")
+        if count.isdigit():
+            counts[encoding] = int(count)
+    return counts
+
+
+def _format_token_counts(counts: dict[str, int]) -> str:
+    return ",".join(f"{encoding}={count}" for encoding, count in sorted(counts.items()))
@@ -0,0 +1,135 @@
+"""Token-bounded parts of the output, for pasting into size-limited chat messages."""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Sequence
+
+import tiktoken
+
+from chareco.core.models import ContextPart
+from chareco.core.tokens import count_tokens
+
+
+MIN_PART_TOKENS = 256
+# Header tokens are reserved for the widest part numbers a header could show.
+_WIDEST_HEADER = (99_999, 99_999)
+
+
+def part_header(number: int, count: int) -> str:
+    return f"[Context part {number} of {count}]\n"
+
+
+def render_part(text: str, parts: Sequence[ContextPart], index: int) -> str:
+    """Return part ``index`` of ``text``, counted from zero, with its header."""
+    part = parts[index]
+    return part_header(index + 1, len(parts)) + part.continues + text[part.start:part.end]
+
+
+class PartSplitter:
+    """Split output into parts of at most ``max_tokens`` tokens while it is written.
+
+    Text must arrive in output order: ``write`` for free text and
+    ``write_block`` for one file block, whose token count the writer usually
+    knows already. A part ends before a block that would overflow it; a block
+    larger than a part is split at line boundaries, and a line larger than a
+    part at token boundaries. Tokens are counted per block, or per line when
+    splitting, never over the whole text, and like the token budget they are
+    the sum of those counts. Everything is passed on to ``write`` unchanged.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        encoding: tiktoken.Encoding,
+        write: Callable[[str], object] | None = None,
+    ) -> None:
+        if max_tokens < MIN_PART_TOKENS:
+            raise ValueError(f"Parts must allow at least {MIN_PART_TOKENS} tokens.")
+        self._capacity = max_tokens - count_tokens(part_header(*_WIDEST_HEADER), encoding)
+        self._encoding = encoding
+        self._write = write
+        self._parts: list[ContextPart] = []
+        self._start = 0
+        self._position = 0
+        self._tokens = 0
+        self._continues = ""
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        if self._write is not None:
+            self._write(text)
+        self._add(text, count_tokens(text, self._encoding), "")
+
+    def write_block(self, header: str, content: str, tokens: int | None = None) -> None:
+        """Add one file block; ``tokens`` covers the header and the content."""
+        if self._write is not None:
+            self._write(header)
+            self._write(content)
+        if tokens is None:
+            tokens = count_tokens(header, self._encoding) + count_tokens(content, self._encoding)
+        if self._make_room(tokens):
+            self._advance(len(header) + len(content), tokens)
+            return
+        file_header = header.rstrip("\n").rpartition("\n")[2]
+        self._split(header, "")
+        self._split(content, f"\n{file_header} (continued)\n")
+
+    def finish(self) -> tuple[ContextPart, ...]:
+        """Close the last part and return all parts; empty output is one empty part."""
+        if self._position > self._start or not self._parts:
+            self._close("")
+        return tuple(self._parts)
+
+    def _add(self, text: str, tokens: int, continues: str) -> None:
+        if self._make_room(tokens):
+            self._advance(len(text), tokens)
+        else:
+            self._split(text, continues)
+
+    def _make_room(self, tokens: int) -> bool:
+        """Return whether ``tokens`` fit, starting a new part if that is enough."""
+        if self._tokens + tokens <= self._capacity:
+            return True
+        if tokens <= self._capacity and self._position > self._start:
+            self._close("")
+            return True
+        return False
+
+    def _advance(self, length: int, tokens: int) -> None:
+        self._position += length
+        self._tokens += tokens
+
+    def _close(self, continues: str) -> None:
+        self._parts.append(ContextPart(self._start, self._position, self._tokens, self._continues))
+        self._start = self._position
+        self._tokens = count_tokens(continues, self._encoding) if continues else 0
+        if self._tokens >= self._capacity:
+            continues, self._tokens = "", 0
+        self._continues = continues
+
+    def _split(self, text: str, continues: str) -> None:
+        lines = text.splitlines(keepends=True)
+        counts = [len(tokens) for tokens in self._encoding.encode_ordinary_batch(lines)]
+        for line, tokens in zip(lines, counts):
+            if self._tokens + tokens > self._capacity and self._position > self._start:
+                self._close(continues)
+            if self._tokens + tokens <= self._capacity:
+                self._advance(len(line), tokens)
+            else:
+                self._split_line(line, continues)
+
+    def _split_line(self, line: str, continues: str) -> None:
+        tokens = self._encoding.encode_ordinary(line)
+        # Offsets are character positions, so cuts never fall inside a character.
+        _, offsets = self._encoding.decode_with_offsets(tokens)
+        offsets.append(len(line))
+        index = 0
+        while index < len(tokens):
+            room = self._capacity - self._tokens
+            if room <= 0:
+                self._close(continues)
+                continue
+            end = min(index + room, len(tokens))
+            self._advance(offsets[end] - offsets[index], end - index)
+            index = end
@@ -0,0 +1,352 @@
+"""Include/exclude rules for scanned paths, compiled once per analysis."""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+
+from chareco.core.models import AnalysisOptions
+
+
+_GIT_FILENAMES = frozenset({".gitignore", ".gitattributes", ".gitmodules"})
+_LICENSE_NAMES = frozenset({"license", "license.txt", "license.md"})
+_README_NAMES = frozenset({"readme", "readme.txt", "readme.md"})
+_GLOB_MAGIC = re.compile(r"[*?[]")
+_TRANSLATED = re.compile(r"\(\?s:(.*)\)\\[Zz]", re.DOTALL)
+
+
+def _normalise_path(path: str | Path) -> str:
+    """Return a relative path in portable POSIX form."""
+    value = os.fspath(path).replace("\\", "/")
+    if value in {"", "."}:
+        return ""
+    return value[2:] if value.startswith("./") else value.strip("/")
+
+
+def _normalise_rules(rules: Sequence[str] | None) -> tuple[str, ...]:
+    """Accept both API sequences and the comma-separated form advertised by the UI."""
+    return tuple(
+        token
+        for rule in rules or ()
+        for token in re.split(r"[,\s]+", rule.strip())
+        if token
+    )
+
+
+def _matches_glob(relative_path: str, patterns: Sequence[str]) -> bool:
+    path = _normalise_path(relative_path)
+    name = PurePosixPath(path).name
+    for raw_pattern in patterns:
+        pattern = _normalise_path(raw_pattern)
+        if not pattern:
+            continue
+        if (
+            (pattern.endswith("/*") and path == pattern[:-2])
+            or
+            fnmatch.fnmatchcase(path, pattern)
+            or fnmatch.fnmatchcase(name, pattern)
+            or PurePosixPath(path).match(pattern)
+        ):
+            return True
+    return False
+
+
+def _matches_extension(filename: str, extensions: Sequence[str]) -> bool:
+    """Support .py, py, and *.py entries without making filtering surprising."""
+    lowered = filename.casefold()
+    for extension in extensions:
+        rule = extension.strip().casefold()
+        if not rule:
+            continue
+        if rule.startswith("*"):
+            if fnmatch.fnmatchcase(lowered, rule):
+                return True
+            continue
+        if not rule.startswith("."):
+            rule = f".{rule}"
+        if lowered.endswith(rule):
+            return True
+    return False
+
+
+def is_git_related(path: str | Path) -> bool:
+    """Match actual Git metadata names, not arbitrary paths containing '.git'."""
+    candidate = Path(path)
+    return candidate.name == ".git" or candidate.name.casefold() in _GIT_FILENAMES
+
+
+def should_exclude(
+    path: str | Path,
+    ignore_git: bool,
+    exclude_license: bool,
+    exclude_readme: bool,
+    exclude_folders: Sequence[str] | None = None,
+) -> bool:
+    """Compatibility helper used by callers that filter a relative file path."""
+    filename = Path(path).name
+    lowered = filename.casefold()
+    if ignore_git and is_git_related(filename):
+        return True
+    if exclude_license and lowered in _LICENSE_NAMES:
+        return True
+    if exclude_readme and lowered in _README_NAMES:
+        return True
+    return _matches_glob(_normalise_path(path), exclude_folders or ())
+
+
+def _passes_file_filters(
+    relative_path: str,
+    *,
+    include: Sequence[str],
+    exclude: Sequence[str],
+    ignore_git: bool,
+    exclude_license: bool,
+    exclude_readme: bool,
+    exclude_patterns: Sequence[str],
+) -> bool:
+    """Uncompiled reference for ``FilterSpec.includes_file``."""
+    if should_exclude(
+        relative_path,
+        ignore_git,
+        exclude_license,
+        exclude_readme,
+        exclude_patterns,
+    ):
+        return False
+    filename = PurePosixPath(relative_path).name
+    if exclude and _matches_extension(filename, exclude):
+        return False
+    return not include or _matches_extension(filename, include)
+
+
+def _translate_segment(pattern: str) -> str:
+    """Translate one path component like ``fnmatch`` without crossing ``/``."""
+    parts: list[str] = []
+    index, length = 0, len(pattern)
+    while index < length:
+        character = pattern[index]
+        index += 1
+        if character == "*":
+            parts.append("[^/]*")
+        elif character == "?":
+            parts.append("[^/]")
+        elif character == "[":
+            end = index
+            if end < length and pattern[end] == "!":
+                end += 1
+            if end < length and pattern[end] == "]":
+                end += 1
+            while end < length and pattern[end] != "]":
+                end += 1
+            if end >= length:
+                parts.append(re.escape(character))
+                continue
+            translated = _TRANSLATED.fullmatch(fnmatch.translate(pattern[index - 1:end + 1]))
+            parts.append(f"(?:(?!/){translated.group(1)})")
+            index = end + 1
+        else:
+            parts.append(re.escape(character))
+    return "".join(parts)
+
+
+def _union(expressions: Sequence[str]) -> re.Pattern[str] | None:
+    return re.compile("|".join(f"(?:{expression})" for expression in expressions)) if expressions else None
+
+
+class _GlobMatcher:
+    """All exclude globs folded into set lookups and two combined regexes.
+
+    A path matches a pattern when it equals ``pattern[:-2]`` for ``dir/*``
+    patterns, when ``fnmatch`` accepts the whole path or its basename, or when
+    ``PurePosixPath.match`` accepts it component-wise from the right.
+    """
+
+    __slots__ = ("_exact_paths", "_exact_names", "_path_suffixes", "_glob", "_tail")
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        exact_paths: set[str] = set()
+        exact_names: set[str] = set()
+        path_suffixes: set[str] = set()
+        glob_expressions: list[str] = []
+        tail_expressions: list[str] = []
+
+        for raw_pattern in patterns:
+            pattern = _normalise_path(raw_pattern)
+            if not pattern:
+                continue
+            if pattern.endswith("/*"):
+                exact_paths.add(pattern[:-2])
+            segments = [segment for segment in pattern.split("/") if segment not in {"", "."}]
+            if not _GLOB_MAGIC.search(pattern) and segments == pattern.split("/"):
+                if len(segments) == 1:
+                    exact_names.add(pattern)
+                else:
+                    exact_paths.add(pattern)
+                    path_suffixes.add(f"/{pattern}")
+                continue
+            glob_expressions.append(fnmatch.translate(pattern))
+            if segments:
+                tail_expressions.append("/".join(_translate_segment(segment) for segment in segments))
+
+        self._exact_paths = frozenset(exact_paths)
+        self._exact_names = frozenset(exact_names)
+        self._path_suffixes = tuple(sorted(path_suffixes))
+        self._glob = _union(glob_expressions)
+        self._tail = (
+            re.compile(rf"(?:^|/)(?:{'|'.join(tail_expressions)})\Z", re.DOTALL)
+            if tail_expressions
+            else None
+        )
+
+    def matches(self, path: str, name: str) -> bool:
+        if path in self._exact_paths or name in self._exact_names:
+            return True
+        if self._path_suffixes and path.endswith(self._path_suffixes):
+            return True
+        return bool(
+            (self._glob is not None and (self._glob.match(path) or self._glob.match(name)))
+            or (self._tail is not None and self._tail.search(path))
+        )
+
+
+class _SuffixTrie:
+    """Reversed-character trie answering ``name.endswith(any rule)``."""
+
+    __slots__ = ("_root",)
+    _TERMINAL = ""
+
+    def __init__(self, suffixes: Sequence[str]) -> None:
+        self._root: dict[str, dict] = {}
+        for suffix in suffixes:
+            node = self._root
+            for character in reversed(suffix):
+                node = node.setdefault(character, {})
+            node[self._TERMINAL] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._root)
+
+    def matches(self, text: str) -> bool:
+        node = self._root
+        for character in reversed(text):
+            node = node.get(character)
+            if node is None:
+                return False
+            if self._TERMINAL in node:
+                return True
+        return False
+
+
+class _ExtensionMatcher:
+    """Extension rules split into a last-suffix set, a suffix trie, and one regex."""
+
+    __slots__ = ("_simple", "_compound", "_wildcards", "_empty")
+
+    def __init__(self, rules: Sequence[str]) -> None:
+        simple: set[str] = set()
+        compound: list[str] = []
+        wildcards: list[str] = []
+        for extension in rules:
+            rule = extension.strip().casefold()
+            if not rule:
+                continue
+            if rule.startswith("*"):
+                wildcards.append(fnmatch.translate(rule))
+                continue
+            if not rule.startswith("."):
+                rule = f".{rule}"
+            if rule.count(".") == 1:
+                simple.add(rule)
+            else:
+                compound.append(rule)
+        self._simple = frozenset(simple)
+        self._compound = _SuffixTrie(compound)
+        self._wildcards = _union(wildcards)
+        self._empty = not (simple or compound or wildcards)
+
+    def __bool__(self) -> bool:
+        return not self._empty
+
+    def matches(self, lowered_name: str) -> bool:
+        dot = lowered_name.rfind(".")
+        if dot >= 0 and lowered_name[dot:] in self._simple:
+            return True
+        if self._compound and self._compound.matches(lowered_name):
+            return True
+        return self._wildcards is not None and self._wildcards.match(lowered_name) is not None
+
+
+@dataclass(frozen=True, slots=True)
+class FilterSpec:
+    """Compiled include/exclude rules for one analysis."""
+
+    ignore_git: bool
+    exclude_license: bool
+    exclude_readme: bool
+    has_include_rules: bool
+    include: _ExtensionMatcher
+    exclude: _ExtensionMatcher
+    globs: _GlobMatcher
+    respect_gitignore: bool = False
+
+    @classmethod
+    def compile(
+        cls,
+        include: Sequence[str] | None = None,
+        exclude: Sequence[str] | None = None,
+        ignore_git: bool = True,
+        exclude_license: bool = True,
+        exclude_readme: bool = False,
+        exclude_patterns: Sequence[str] | None = None,
+        respect_gitignore: bool = False,
+    ) -> FilterSpec:
+        include_rules = _normalise_rules(include)
+        return cls(
+            ignore_git=ignore_git,
+            exclude_license=exclude_license,
+            exclude_readme=exclude_readme,
+            has_include_rules=bool(include_rules),
+            include=_ExtensionMatcher(include_rules),
+            exclude=_ExtensionMatcher(_normalise_rules(exclude)),
+            globs=_GlobMatcher(_normalise_rules(exclude_patterns)),
+            respect_gitignore=respect_gitignore,
+        )
+
+    @classmethod
+    def from_options(cls, options: AnalysisOptions) -> FilterSpec:
+        return cls.compile(
+            include=options.include_extensions,
+            exclude=options.exclude_extensions,
+            ignore_git=not options.include_git,
+            exclude_license=not options.include_license,
+            exclude_readme=options.exclude_readme,
+            exclude_patterns=options.exclude_patterns,
+            respect_gitignore=options.respect_gitignore,
+        )
+
+    def excludes_directory(self, relative_path: str, name: str) -> bool:
+        """Return whether a directory should be pruned before it is listed."""
+        if self.ignore_git and name == ".git":
+            return True
+        return self.globs.matches(relative_path, name)
+
+    def includes_file(self, relative_path: str, name: str | None = None) -> bool:
+        """Return the same verdict as the uncompiled ``_passes_file_filters``."""
+        if name is None:
+            name = relative_path.rpartition("/")[2]
+        lowered = name.casefold()
+        if self.ignore_git and (name == ".git" or lowered in _GIT_FILENAMES):
+            return False
+        if self.exclude_license and lowered in _LICENSE_NAMES:
+            return False
+        if self.exclude_readme and lowered in _README_NAMES:
+            return False
+        if self.globs.matches(relative_path, name):
+            return False
+        if self.exclude and self.exclude.matches(lowered):
+            return False
+        return not self.has_include_rules or self.include.matches(lowered)
@@ -0,0 +1,266 @@
+"""Git ignore rules (.gitignore, .git/info/exclude) compiled per directory."""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+
+logger = logging.getLogger(__name__)
+
+IGNORE_FILENAME = ".gitignore"
+
+
+def _translate_segment(segment: str) -> str:
+    """Translate one wildmatch path component; ``*`` and ``?`` never match ``/``."""
+    parts: list[str] = []
+    index, length = 0, len(segment)
+    while index < length:
+        character = segment[index]
+        index += 1
+        if character == "\\" and index < length:
+            parts.append(re.escape(segment[index]))
+            index += 1
+        elif character == "*":
+            while index < length and segment[index] == "*":
+                index += 1
+            parts.append("[^/]*")
+        elif character == "?":
+            parts.append("[^/]")
+        elif character == "[":
+            end = index
+            if end < length and segment[end] in "!^":
+                end += 1
+            if end < length and segment[end] == "]":
+                end += 1
+            while end < length and segment[end] != "]":
+                end += 2 if segment[end] == "\\" else 1
+            if end >= length:
+                parts.append(re.escape(character))
+                continue
+            negated = segment[index] in "!^"
+            members: list[str] = []
+            position = index + 1 if negated else index
+            while position < end:
+                member = segment[position]
+                if member == "\\" and position + 1 < end:
+                    position += 1
+                    member = segment[position]
+                    members.append(f"\\{member}" if member in "\\[]^-" else member)
+                else:
+                    members.append(f"\\{member}" if member in "\\[]^" else member)
+                position += 1
+            body = "".join(members)
+            parts.append(f"[^/{body}]" if negated else f"(?!/)[{body}]")
+            index = end + 1
+        else:
+            parts.append(re.escape(character))
+    return "".join(parts)
+
+
+def _translate_path(pattern: str) -> str:
+    """Translate an anchored pattern, giving ``**`` components their gitignore meaning."""
+    segments = pattern.split("/")
+    if segments == ["**"]:
+        return ".*"
+    parts: list[str] = []
+    last = len(segments) - 1
+    for position, segment in enumerate(segments):
+        if segment == "**":
+            if position == 0:
+                parts.append("(?:.*/)?")
+            elif position == last:
+                parts.append("/.*")
+            else:
+                parts.append("(?:/.*)?")
+            continue
+        if parts and parts[-1] != "(?:.*/)?":
+            parts.append("/")
+        parts.append(_translate_segment(segment))
+    return "".join(parts)
+
+
+@dataclass(frozen=True, slots=True)
+class _Rule:
+    pattern: re.Pattern[str]
+    negated: bool
+    directory_only: bool
+    basename_only: bool
+
+    def matches(self, relative_path: str, name: str, is_directory: bool) -> bool:
+        if self.directory_only and not is_directory:
+            return False
+        return self.pattern.fullmatch(name if self.basename_only else relative_path) is not None
+
+
+def parse_rules(lines: Iterable[str]) -> tuple[_Rule, ...]:
+    """Compile gitignore lines in file order; later rules take precedence."""
+    rules: list[_Rule] = []
+    for raw_line in lines:
+        line = raw_line.rstrip("\r\n")
+        if not line or line.startswith("#"):
+            continue
+        stripped = line.rstrip(" ")
+        # A backslash keeps the space that follows it.
+        if stripped != line and stripped.endswith("\\"):
+            stripped += " "
+        line = stripped
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith(("\\!", "\\#")):
+            line = line[1:]
+        directory_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        basename_only = "/" not in line
+        if basename_only:
+            expression = ".*" if line == "**" else _translate_segment(line)
+        else:
+            expression = _translate_path(line.lstrip("/"))
+        try:
+            pattern = re.compile(expression, re.DOTALL)
+        except re.error:
+            logger.info("Skipping unsupported ignore pattern: %s", raw_line.strip())
+            continue
+        rules.append(_Rule(pattern, negated, directory_only, basename_only))
+    return tuple(rules)
+
+
+@dataclass(frozen=True, slots=True)
+class RuleSet:
+    """Rules from one ignore file, matched relative to the directory ``base``.
+
+    ``prefix`` locates the scan root inside the repository for ignore files
+    that live above it; ``base`` is then relative to the repository root.
+    """
+
+    base: str
+    rules: tuple[_Rule, ...]
+    combined: re.Pattern[str] | None = None
+    prefix: str = ""
+
+    @classmethod
+    def create(cls, base: str, rules: tuple[_Rule, ...], prefix: str = "") -> RuleSet:
+        # Without negations and directory-only rules, any match decides, so one regex suffices.
+        if rules and not any(rule.negated or rule.directory_only for rule in rules):
+            combined = re.compile(
+                "|".join(
+                    f"(?:(?:.*/)?{rule.pattern.pattern})" if rule.basename_only else f"(?:{rule.pattern.pattern})"
+                    for rule in rules
+                ),
+                re.DOTALL,
+            )
+            return cls(base, rules, combined, prefix)
+        return cls(base, rules, None, prefix)
+
+    def verdict(self, relative_path: str, name: str, is_directory: bool) -> bool | None:
+        """Return ``True`` (ignored), ``False`` (re-included), or ``None`` (no rule matched)."""
+        if self.prefix:
+            relative_path = f"{self.prefix}/{relative_path}"
+        if self.base:
+            relative_path = relative_path[len(self.base) + 1:]
+        if self.combined is not None:
+            return True if self.combined.fullmatch(relative_path) else None
+        for rule in reversed(self.rules):
+            if rule.matches(relative_path, name, is_directory):
+                return not rule.negated
+        return None
+
+
+RuleStack = tuple[RuleSet, ...]
+
+
+def is_ignored(stack: RuleStack, relative_path: str, name: str, is_directory: bool) -> bool:
+    """Deeper ignore files override shallower ones; within a file the last match wins."""
+    for rule_set in reversed(stack):
+        verdict = rule_set.verdict(relative_path, name, is_directory)
+        if verdict is not None:
+            return verdict
+    return False
+
+
+def _read_lines(path: str) -> list[str] | None:
+    try:
+        with open(path, "rb") as handle:
+            return handle.read().decode("utf-8", errors="replace").splitlines()
+    except OSError:
+        return None
+
+
+def _git_directory(worktree: str) -> str | None:
+    dot_git = os.path.join(worktree, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git
+    lines = _read_lines(dot_git) if os.path.isfile(dot_git) else None
+    if lines and lines[0].startswith("gitdir:"):
+        return os.path.normpath(os.path.join(worktree, lines[0][len("gitdir:"):].strip()))
+    return None
+
+
+class GitIgnore:
+    """Ignore rules for one scan root, including rules inherited from its repository.
+
+    ``.git/info/exclude`` and the ``.gitignore`` files between the repository
+    root and the scan root apply with their usual precedence; paths are still
+    relative to the scan root. Rule sets are compiled once per directory.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(root)
+        self._cache: dict[str, RuleSet | None] = {}
+        base: list[RuleSet] = []
+        repository = self.root
+        while _git_directory(repository) is None:
+            parent = os.path.dirname(repository)
+            if parent == repository:
+                repository = None
+                break
+            repository = parent
+        if repository is not None:
+            git_directory = _git_directory(repository)
+            exclude = _read_lines(os.path.join(git_directory, "info", "exclude"))
+            # Patterns from outside the scan root are rebased, so anchored ones keep their meaning.
+            prefix = os.path.relpath(self.root, repository).replace(os.sep, "/")
+            prefix = "" if prefix == "." else prefix
+            if exclude:
+                base.append(RuleSet.create("", parse_rules(exclude), prefix))
+            directory = repository
+            for component in prefix.split("/") if prefix else ():
+                lines = _read_lines(os.path.join(directory, IGNORE_FILENAME))
+                if lines:
+                    depth = os.path.relpath(directory, repository).replace(os.sep, "/")
+                    base.append(RuleSet.create("" if depth == "." else depth, parse_rules(lines), prefix))
+                directory = os.path.join(directory, component)
+        self.base: RuleStack = tuple(rule_set for rule_set in base if rule_set.rules)
+
+    def _load(self, relative_dir: str) -> RuleSet | None:
+        if relative_dir not in self._cache:
+            path = os.path.join(self.root, *relative_dir.split("/"), IGNORE_FILENAME)
+            lines = _read_lines(path) if os.path.isfile(path) else None
+            rules = parse_rules(lines) if lines else ()
+            self._cache[relative_dir] = RuleSet.create(relative_dir, rules) if rules else None
+        return self._cache[relative_dir]
+
+    def stack_above(self, relative_dir: str) -> RuleStack:
+        """Rules in effect for ``relative_dir`` itself, i.e. from its ancestors only."""
+        stack = self.base
+        if not relative_dir:
+            return stack
+        parts = relative_dir.split("/")
+        for depth in range(len(parts)):
+            rule_set = self._load("/".join(parts[:depth]))
+            if rule_set is not None:
+                stack += (rule_set,)
+        return stack
+
+    def stack_within(self, inherited: RuleStack, relative_dir: str, names: Iterable[str]) -> RuleStack:
+        """Extend ``inherited`` with the directory's own ignore file, if its listing has one."""
+        if IGNORE_FILENAME not in names:
+            return inherited
+        rule_set = self._load(relative_dir)
+        return inherited if rule_set is None else inherited + (rule_set,)
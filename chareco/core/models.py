@@ -2,10 +2,29 @@
 
 from __future__ import annotations
 
+import os
+from collections.abc import Callable, Iterator
 from dataclasses import dataclass, field
 from typing import Mapping
 
 
+@dataclass(frozen=True, slots=True)
+class PackingOptions:
+    """Relevance signals for packing files into the output budget.
+
+    ``path_weights`` pairs exclude-style globs with weights (negative ones
+    demote). Keyword hits, recency, and small size add weighted scores.
+    ``strategy`` is ``"greedy"`` or ``"knapsack"``.
+    """
+
+    path_weights: tuple[tuple[str, float], ...] = ()
+    keywords: tuple[str, ...] = ()
+    keyword_weight: float = 1.0
+    recency_weight: float = 0.0
+    small_file_weight: float = 0.0
+    strategy: str = "greedy"
+
+
 @dataclass(frozen=True, slots=True)
 class AnalysisOptions:
     """Immutable snapshot of the options for one analysis job."""
@@ -16,13 +35,146 @@ class AnalysisOptions:
     exclude_extensions: tuple[str, ...] = ()
     exclude_patterns: tuple[str, ...] = ()
     include_git: bool = False
+    respect_gitignore: bool = False
     include_license: bool = False
     exclude_readme: bool = False
     concatenate: bool = True
     copy_local_folder: bool = False
+    tracked_only: bool = False
     branch: str | None = None
+    revision: str | None = None
     max_file_bytes: int = 1_000_000
     max_total_bytes: int = 20_000_000
+    max_total_tokens: int | None = None
+    max_part_tokens: int | None = None
+    packing: PackingOptions | None = None
+    deduplicate: bool = False
+    strip_python: bool = False
+    collapse_blank_lines: bool = False
+    python_skeleton: tuple[str, ...] = ()
+    read_workers: int = 4
+    notebook_workers: int = 2
+    cache_dir: str | None = None
+    content_cache: bool = False
+    content_cache_max_bytes: int = 256 * 1024 * 1024
+    repository_cache_max_bytes: int = 1024 * 1024 * 1024
+
+
+@dataclass(slots=True)
+class ScannedFile:
+    """Stat metadata and filter verdict for one regular file seen by a scan.
+
+    ``binary`` is only sniffed for files that pass the filters and the size
+    limit; it is ``False`` for every other entry, and ``None`` while a scan
+    leaves sniffing to the reader. ``device`` and ``inode`` are ``0`` where
+    the platform does not report them. Files scanned from a git tree carry
+    their ``blob_id`` instead, and only included ones have a ``size``.
+    """
+
+    relative_path: str
+    size: int
+    mtime_ns: int
+    included: bool
+    binary: bool | None = False
+    device: int = 0
+    inode: int = 0
+    blob_id: str | None = None
+
+    def same_version(self, other: ScannedFile) -> bool:
+        """Return whether stat metadata says both entries hold the same bytes."""
+        return (
+            self.size == other.size
+            and self.mtime_ns == other.mtime_ns
+            and self.inode == other.inode
+            and self.device == other.device
+        )
+
+
+@dataclass(slots=True)
+class ScannedDirectory:
+    """One visited directory and its files, in deterministic order."""
+
+    relative_path: str
+    files: list[ScannedFile] = field(default_factory=list)
+
+    @property
+    def depth(self) -> int:
+        return self.relative_path.count("/") + 1 if self.relative_path else 0
+
+
+@dataclass(slots=True)
+class FileManifest:
+    """Result of one filesystem scan, shared by tree rendering and serialization.
+
+    A manifest scanned from a git tree has a ``read_blob`` callback that
+    returns a blob's bytes by id; its files are never on disk.
+    """
+
+    root: str
+    max_file_bytes: int
+    directories: list[ScannedDirectory] = field(default_factory=list)
+    read_blob: Callable[[str], bytes] | None = None
+
+    def files(self) -> Iterator[ScannedFile]:
+        for directory in self.directories:
+            yield from directory.files
+
+    def is_eligible(self, entry: ScannedFile) -> bool:
+        return entry.included and entry.size <= self.max_file_bytes and not entry.binary
+
+    def eligible_files(self) -> Iterator[ScannedFile]:
+        return (entry for entry in self.files() if self.is_eligible(entry))
+
+    def by_path(self) -> dict[str, ScannedFile]:
+        return {entry.relative_path: entry for entry in self.files()}
+
+    def absolute_path(self, entry: ScannedFile) -> str:
+        return os.path.join(self.root, *entry.relative_path.split("/"))
+
+
+@dataclass(frozen=True, slots=True)
+class ContextPart:
+    """One token-bounded part of the output: ``full_text[start:end]``.
+
+    ``continues`` repeats the header of a file that was split at the end of
+    the previous part; ``tokens`` counts it and the slice, not the part header.
+    """
+
+    start: int
+    end: int
+    tokens: int
+    continues: str = ""
+
+
+class FileContents(Mapping[str, str]):
+    """Read-only view of file contents stored as spans of one backing text.
+
+    ``spans`` maps each path to the ``(start, end)`` of its content in
+    ``text``, usually the full output, so contents are not held a second
+    time; looking a path up slices it out.
+    """
+
+    __slots__ = ("text", "spans")
+
+    def __init__(self, text: str = "", spans: dict[str, tuple[int, int]] | None = None) -> None:
+        self.text = text
+        self.spans = spans if spans is not None else {}
+
+    def __getitem__(self, path: str) -> str:
+        start, end = self.spans[path]
+        return self.text[start:end]
+
+    def __contains__(self, path: object) -> bool:
+        return path in self.spans
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.spans)
+
+    def __len__(self) -> int:
+        return len(self.spans)
+
+    def __repr__(self) -> str:
+        return f"FileContents({len(self.spans)} files)"
 
 
 @dataclass(slots=True)
@@ -32,6 +184,11 @@ class AnalysisResult:
     full_text: str
     folder_structure: str
     file_positions: dict[str, int]
-    file_contents: dict[str, str]
+    file_contents: Mapping[str, str]
     metadata: Mapping[str, str] = field(default_factory=dict)
     warnings: tuple[str, ...] = ()
+    manifest: FileManifest | None = None
+    token_counts: dict[str, int] = field(default_factory=dict)
+    parts: tuple[ContextPart, ...] = ()
+    # Python transforms applied to ``file_contents``, so a refresh only reuses contents made the same way.
+    transform_settings: tuple[object, ...] = ()
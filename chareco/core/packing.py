@@ -0,0 +1,182 @@
+"""Relevance-ranked selection of files that fit the output budgets."""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from chareco.core.filters import _GlobMatcher, _normalise_path
+from chareco.core.models import PackingOptions
+from chareco.core.utils import utf8_size
+
+
+PACKING_STRATEGIES = ("greedy", "knapsack")
+# Items on either side of the greedy break point that the knapsack re-optimises.
+_CORE_ITEMS = 128
+_CAPACITY_STEPS = 1_024
+
+
+@dataclass(frozen=True, slots=True)
+class Candidate:
+    """One eligible file as packing sees it; ``size`` is in UTF-8 bytes."""
+
+    relative_path: str
+    size: int
+    mtime_ns: int
+    tokens: int | None = None
+    keyword_hits: int = 0
+
+
+def score_candidates(candidates: Sequence[Candidate], packing: PackingOptions) -> list[float]:
+    """Combine path weights, keyword hits, recency, and smallness into one score per file.
+
+    Recency and smallness are normalised to ``0..1`` across the candidates, so
+    their weights are comparable with path weights.
+    """
+    if not candidates:
+        return []
+    scores = _path_scores(candidates, packing.path_weights)
+    oldest = min(candidate.mtime_ns for candidate in candidates)
+    age_span = max(candidate.mtime_ns for candidate in candidates) - oldest
+    largest = math.log1p(max(candidate.size for candidate in candidates)) or 1.0
+    keyword_weight = packing.keyword_weight
+    recency_weight = packing.recency_weight
+    small_file_weight = packing.small_file_weight
+    log1p = math.log1p
+
+    for position, candidate in enumerate(candidates):
+        score = scores[position]
+        if candidate.keyword_hits:
+            score += keyword_weight * log1p(candidate.keyword_hits)
+        if recency_weight:
+            score += recency_weight * ((candidate.mtime_ns - oldest) / age_span if age_span else 1.0)
+        if small_file_weight:
+            score += small_file_weight * (1.0 - log1p(candidate.size) / largest)
+        scores[position] = score
+    return scores
+
+
+def _path_scores(candidates: Sequence[Candidate], path_weights: Sequence[tuple[str, float]]) -> list[float]:
+    """Sum the weights of the patterns each path matches.
+
+    A ``dir/*`` pattern never looks past the last slash of a nested path, so
+    apart from a file whose path is ``dir`` itself, its verdict is cached per
+    parent directory.
+    """
+    scores = [0.0] * len(candidates)
+    if not path_weights:
+        return scores
+    split = [candidate.relative_path.rpartition("/") for candidate in candidates]
+    for raw_pattern, weight in path_weights:
+        pattern = _normalise_path(raw_pattern)
+        matches = _GlobMatcher((pattern,)).matches
+        per_directory = pattern.endswith("/*")
+        verdicts: dict[str, bool] = {}
+        for position, (directory, _, name) in enumerate(split):
+            path = candidates[position].relative_path
+            if per_directory and directory and path != pattern[:-2]:
+                verdict = verdicts.get(directory)
+                if verdict is None:
+                    verdict = verdicts[directory] = matches(path, name)
+            else:
+                verdict = matches(path, name)
+            if verdict:
+                scores[position] += weight
+    return scores
+
+
+def pack_files(
+    candidates: Sequence[Candidate],
+    packing: PackingOptions,
+    max_total_bytes: int,
+    max_total_tokens: int | None = None,
+) -> set[str]:
+    """Choose the files to write, most relevant per unit of budget first.
+
+    A file's cost is the larger of its byte and token shares of the budgets,
+    header included, so one capacity of ``1.0`` covers both. ``greedy`` takes
+    files in order of score per cost while they fit; ``knapsack`` also solves
+    the files around the first one that did not fit exactly, on a scaled
+    capacity. Files with a score of zero or less only fill what is left.
+    """
+    if packing.strategy not in PACKING_STRATEGIES:
+        raise ValueError(f"Unknown packing strategy: {packing.strategy}")
+    scores = score_candidates(candidates, packing)
+    costs = _costs(candidates, max_total_bytes, max_total_tokens)
+    # Sorting is stable, so ties keep path order.
+    positive = [index for index, score in enumerate(scores) if score > 0]
+    positive.sort(key=lambda index: -scores[index] / costs[index])
+    rest = [index for index, score in enumerate(scores) if score <= 0]
+    rest.sort(key=lambda index: costs[index])
+    rest.sort(key=lambda index: -scores[index])
+    order = positive + rest
+    chosen: set[int] = set()
+    used = 0.0
+    if packing.strategy == "knapsack":
+        prefix, filled = 0, 0.0
+        while prefix < len(positive) and filled + costs[positive[prefix]] <= 1.0:
+            filled += costs[positive[prefix]]
+            prefix += 1
+        start = max(prefix - _CORE_ITEMS, 0)
+        chosen.update(positive[:start])
+        used = sum(costs[index] for index in chosen)
+        for index in _solve_core(positive[start:prefix + _CORE_ITEMS], scores, costs, 1.0 - used):
+            chosen.add(index)
+            used += costs[index]
+
+    for index in order:
+        if index not in chosen and used + costs[index] <= 1.0:
+            chosen.add(index)
+            used += costs[index]
+    return {candidates[index].relative_path for index in chosen}
+
+
+def _costs(
+    candidates: Sequence[Candidate],
+    max_total_bytes: int,
+    max_total_tokens: int | None,
+) -> list[float]:
+    byte_budget = max(max_total_bytes, 1)
+    token_budget = max(max_total_tokens, 1) if max_total_tokens is not None else None
+    costs: list[float] = []
+    for candidate in candidates:
+        header = utf8_size(candidate.relative_path) + 6
+        cost = (candidate.size + header) / byte_budget
+        if token_budget is not None and candidate.tokens is not None:
+            # Headers are short and mostly path pieces; a token per four bytes is close.
+            cost = max(cost, (candidate.tokens + header / 4) / token_budget)
+        costs.append(cost)
+    return costs
+
+
+def _solve_core(
+    core: Sequence[int],
+    scores: Sequence[float],
+    costs: Sequence[float],
+    capacity: float,
+) -> list[int]:
+    """0/1 knapsack over ``core`` with costs rounded up to ``capacity / _CAPACITY_STEPS``."""
+    if not core or capacity <= 0:
+        return []
+    step = capacity / _CAPACITY_STEPS
+    weights = [math.ceil(costs[index] / step) for index in core]
+    best = [0.0] * (_CAPACITY_STEPS + 1)
+    taken: list[bytearray] = []
+    for position, index in enumerate(core):
+        weight, value = weights[position], scores[index]
+        row = bytearray(_CAPACITY_STEPS + 1)
+        for remaining in range(_CAPACITY_STEPS, weight - 1, -1):
+            candidate = best[remaining - weight] + value
+            if candidate > best[remaining]:
+                best[remaining] = candidate
+                row[remaining] = 1
+        taken.append(row)
+
+    selected: list[int] = []
+    remaining = _CAPACITY_STEPS
+    for position in range(len(core) - 1, -1, -1):
+        if taken[position][remaining]:
+            selected.append(core[position])
+            remaining -= weights[position]
+    return selected
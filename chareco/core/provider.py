@@ -0,0 +1,125 @@
+"""Memory-bounded, on-demand file contents for analyses that do not concatenate."""
+
+from __future__ import annotations
+
+import logging
+import os
+import stat
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from chareco.core.utils import convert_notebook_to_markdown, read_text_file
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+
+
+class ContentProvider:
+    """Load the contents of files under ``root`` on demand, holding at most ``max_bytes``.
+
+    Contents are evicted least recently used first, and a cached file is read
+    again once its size or modification time changes. ``prefetch`` loads
+    files on background threads so that a later ``get`` finds them ready; a
+    new ``prefetch`` drops queued loads from the previous one. Every method
+    is safe to call from any thread.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_file_bytes: int,
+        max_bytes: int = DEFAULT_MEMORY_BYTES,
+        workers: int = 2,
+    ) -> None:
+        self.root = os.path.abspath(root)
+        self.max_file_bytes = max_file_bytes
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[str, tuple[int, int], int]] = OrderedDict()
+        self._memory = 0
+        self._queued: dict[str, Future[str | None]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chareco-prefetch")
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate memory held by cached contents."""
+        return self._memory
+
+    def get(self, relative_path: str) -> str | None:
+        """Return a file's text, or ``None`` for missing, unsafe, binary, or oversized files."""
+        absolute_path = os.path.abspath(os.path.join(self.root, relative_path))
+        try:
+            if os.path.commonpath([self.root, absolute_path]) != self.root:
+                return None
+            status = os.lstat(absolute_path)
+        except (OSError, ValueError):
+            return None
+        if not stat.S_ISREG(status.st_mode):
+            return None
+        version = (status.st_size, status.st_mtime_ns)
+        with self._lock:
+            cached = self._entries.get(relative_path)
+            if cached is not None and cached[1] == version:
+                self._entries.move_to_end(relative_path)
+                return cached[0]
+
+        if relative_path.casefold().endswith(".ipynb"):
+            if status.st_size > self.max_file_bytes:
+                return None
+            content = convert_notebook_to_markdown(absolute_path)
+        else:
+            content = read_text_file(absolute_path, self.max_file_bytes)
+        if content is not None:
+            self._store(relative_path, content, version)
+        return content
+
+    def prefetch(self, relative_paths: Iterable[str]) -> None:
+        """Load these files in the background, replacing any earlier prefetch still queued."""
+        with self._lock:
+            for future in self._queued.values():
+                future.cancel()
+            self._queued = {
+                path: self._executor.submit(self._prefetch_one, path)
+                for path in relative_paths
+                if path not in self._entries
+            }
+
+    def cached(self) -> dict[str, str]:
+        """Return the contents loaded so far, without loading anything."""
+        with self._lock:
+            return {path: entry[0] for path, entry in self._entries.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._memory = 0
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.clear()
+
+    def _prefetch_one(self, relative_path: str) -> str | None:
+        try:
+            return self.get(relative_path)
+        except Exception as error:  # A failed prefetch leaves the file to a later get.
+            logger.info("Could not prefetch %s: %s", relative_path, error)
+            return None
+
+    def _store(self, relative_path: str, content: str, version: tuple[int, int]) -> None:
+        size = sys.getsizeof(content)
+        with self._lock:
+            previous = self._entries.pop(relative_path, None)
+            if previous is not None:
+                self._memory -= previous[2]
+            if size > self.max_bytes:
+                return
+            while self._entries and self._memory + size > self.max_bytes:
+                _path, evicted = self._entries.popitem(last=False)
+                self._memory -= evicted[2]
+            self._entries[relative_path] = (content, version, size)
+            self._memory += size
@@ -0,0 +1,245 @@
+"""Git revisions read without a checkout: local repositories, and a size-capped clone cache."""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+from dulwich.client import get_transport_and_path
+from dulwich.errors import NotGitRepository
+from dulwich.objects import Commit, Tag
+from dulwich.objectspec import parse_commit
+from dulwich.repo import Repo
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPOSITORY_CACHE_BYTES = 1024 * 1024 * 1024
+# Fetched commits are kept under this prefix so later fetches can offer them as "have"s.
+_LOCAL_REFS = b"refs/heads/chareco/"
+
+
+def normalize_url(url: str) -> str:
+    """Return the form of a repository URL that identifies its cache entry.
+
+    Scheme and host are case-folded, and a trailing slash or ``.git`` is
+    dropped, so ``https://GitHub.com/org/repo.git/`` and
+    ``https://github.com/org/repo`` share one entry. User info is dropped.
+    """
+    url = url.strip()
+    parsed = urlsplit(url)
+    if parsed.scheme and parsed.netloc:
+        netloc = (parsed.hostname or "") + (f":{parsed.port}" if parsed.port else "")
+        url = urlunsplit((parsed.scheme.casefold(), netloc, parsed.path, parsed.query, ""))
+    url = url.rstrip("/")
+    return url[: -len(".git")] if url.endswith(".git") else url
+
+
+@contextmanager
+def _file_lock(path: Path, blocking: bool = True) -> Iterator[bool]:
+    """Hold an exclusive lock on ``path`` across processes; yield whether it was taken.
+
+    The holder may delete ``path``; a process that was waiting on the deleted
+    file notices and locks the file now at ``path`` instead.
+    """
+    while True:
+        with open(path, "a+b") as handle:
+            if os.name == "nt":
+                import msvcrt
+
+                while True:
+                    try:
+                        msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            yield False
+                            return
+                        time.sleep(0.1)
+            else:
+                import fcntl
+
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+            try:
+                current = os.path.samestat(os.fstat(handle.fileno()), os.stat(path))
+            except FileNotFoundError:
+                current = False
+            if current:
+                yield True
+                return
+
+
+@contextmanager
+def local_revision(folder: str | Path, revision: str) -> Iterator[tuple[Repo, Commit, str]]:
+    """Yield the repository containing ``folder``, the commit ``revision`` names, and the folder's path in it.
+
+    ``revision`` is anything that names a commit: a branch, a tag, ``HEAD``,
+    or a full or abbreviated commit id.
+    """
+    try:
+        repository = Repo.discover(os.fspath(folder))
+    except NotGitRepository:
+        raise ValueError(f"Not inside a git repository: {folder}") from None
+    try:
+        try:
+            commit = parse_commit(repository, revision.encode("utf-8"))
+        except KeyError:
+            raise ValueError(f"Revision not found: {revision}") from None
+        prefix = os.path.relpath(os.path.realpath(folder), os.path.realpath(repository.path))
+        yield repository, commit, "" if prefix == "." else prefix.replace(os.sep, "/")
+    finally:
+        repository.close()
+
+
+def info_exclude(repository: Repo) -> list[str]:
+    """Lines of the repository's ``.git/info/exclude``, if it has one."""
+    handle = repository.get_named_file("info/exclude")
+    if handle is None:
+        return []
+    with handle:
+        return handle.read().decode("utf-8", errors="replace").splitlines()
+
+
+class RepositoryCache:
+    """Shallow bare repositories under ``<directory>/repositories``, one per normalized URL.
+
+    ``revision`` fetches only the objects of the requested ref that the
+    cached repository lacks and hands out its commit, whose tree is then
+    read from the object store. Each repository has a lock file, so the GUI
+    and the CLI can share the cache; once the cache grows past
+    ``max_bytes``, the least recently used repositories that no one holds
+    are deleted.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_REPOSITORY_CACHE_BYTES) -> None:
+        self.directory = Path(directory) / "repositories"
+        self.max_bytes = max_bytes
+
+    def path(self, url: str) -> Path:
+        key = hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()[:32]
+        return self.directory / f"{key}.git"
+
+    @contextmanager
+    def revision(
+        self,
+        url: str,
+        branch: str | None = None,
+        username: str | None = None,
+        password: str | None = None,
+    ) -> Iterator[tuple[Repo, Commit]]:
+        """Fetch ``branch``, or the remote ``HEAD``, and yield the repository and its commit.
+
+        The repository stays locked until the context exits. Credentials are
+        used for the fetch only and never stored; every use fetches, so
+        access is checked each time.
+        """
+        path = self.path(url)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with _file_lock(path.with_suffix(".lock")):
+            repository = self._open(path)
+            try:
+                commit = self._fetch(repository, url, branch, username, password)
+                os.utime(path)
+                yield repository, commit
+            finally:
+                repository.close()
+        self.evict(keep=path)
+
+    def evict(self, keep: Path | None = None) -> None:
+        """Delete least recently used repositories until the cache fits ``max_bytes``."""
+        if not self.directory.is_dir():
+            return
+        with _file_lock(self.directory / ".lock"):
+            entries = []
+            for path in self.directory.glob("*.git"):
+                try:
+                    entries.append((path.stat().st_mtime_ns, _tree_size(path), path))
+                except OSError:
+                    continue
+            total = sum(size for _mtime, size, _path in entries)
+            for _mtime, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                lock_path = path.with_suffix(".lock")
+                with _file_lock(lock_path, blocking=False) as locked:
+                    if not locked:
+                        continue  # Another process is using this repository.
+                    try:
+                        lock_path.unlink()
+                        removed = True
+                    except OSError:
+                        removed = False  # Windows cannot delete a file that is still open.
+                    shutil.rmtree(path, ignore_errors=True)
+                if not removed:
+                    # Deletion fails again if another process has opened the file meanwhile.
+                    with suppress(OSError):
+                        lock_path.unlink()
+                total -= size
+
+    @staticmethod
+    def _open(path: Path) -> Repo:
+        if path.is_dir():
+            try:
+                return Repo(str(path))
+            except NotGitRepository:
+                logger.warning("Replacing damaged cached repository %s", path)
+                shutil.rmtree(path, ignore_errors=True)
+        return Repo.init_bare(str(path), mkdir=True)
+
+    @staticmethod
+    def _fetch(
+        repository: Repo,
+        url: str,
+        branch: str | None,
+        username: str | None,
+        password: str | None,
+    ) -> Commit:
+        client, remote_path = get_transport_and_path(url, quiet=True, username=username, password=password)
+        chosen: list[bytes] = []
+
+        def determine_wants(refs: dict[bytes, bytes], depth: int | None = None) -> list[bytes]:
+            names = [b"HEAD"] if branch is None else [
+                f"refs/heads/{branch}".encode("utf-8"),
+                f"refs/tags/{branch}".encode("utf-8"),
+            ]
+            for name in names:
+                if refs.get(name):
+                    chosen[:] = [name, refs[name]]
+                    break
+            else:
+                raise ValueError(f"Remote branch or tag not found: {branch or 'HEAD'}")
+            return [] if chosen[1] in repository.object_store else [chosen[1]]
+
+        client.fetch(remote_path, repository, determine_wants=determine_wants, depth=1)
+        name, target = chosen
+        obj = repository[target]
+        while isinstance(obj, Tag):
+            obj = repository[obj.object[1]]
+        if not isinstance(obj, Commit):
+            raise ValueError(f"{name.decode('utf-8', 'replace')} does not point to a commit.")
+        repository.refs[_LOCAL_REFS + name.removeprefix(b"refs/")] = obj.id
+        return obj
+
+
+def _tree_size(path: Path) -> int:
+    total = 0
+    for directory, _directories, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                continue
+    return total
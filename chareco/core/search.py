@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import re
+from collections.abc import Mapping, Sequence
 from threading import Event
 
 from PyQt6.QtCore import QObject, QRunnable, pyqtSignal
@@ -16,12 +17,19 @@ class WorkerSignals(QObject):
 
 
 class SearchWorker(QRunnable):
+    """Search ``paths`` of ``files``, all of them by default.
+
+    Contents are looked up one file at a time, so a lazy view such as
+    ``FileContents`` only materialises the file being searched.
+    """
+
     def __init__(
         self,
         job_id: int,
-        files: list[tuple[str, str]],
+        files: Mapping[str, str],
         search_text: str,
         *,
+        paths: Sequence[str] | None = None,
         case_sensitive: bool = False,
         whole_word: bool = False,
         use_regex: bool = False,
@@ -30,6 +38,7 @@ class SearchWorker(QRunnable):
         super().__init__()
         self.job_id = job_id
         self.files = files
+        self.paths = list(files) if paths is None else paths
         self.search_text = search_text
         self.case_sensitive = case_sensitive
         self.whole_word = whole_word
@@ -50,11 +59,11 @@ class SearchWorker(QRunnable):
                 return
 
             results: list[tuple[str, list[re.Match[str]]]] = []
-            total_files = len(self.files)
-            for index, (file_path, content) in enumerate(self.files, start=1):
+            total_files = len(self.paths)
+            for index, file_path in enumerate(self.paths, start=1):
                 if self.cancel_event.is_set():
                     return
-                matches = list(pattern.finditer(content))
+                matches = list(pattern.finditer(self.files[file_path]))
                 if matches:
                     results.append((file_path, matches))
                 self.signals.progress.emit(self.job_id, index, total_files)
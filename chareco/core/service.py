@@ -2,16 +2,44 @@
 
 from __future__ import annotations
 
-import shutil
 import tempfile
-from collections.abc import Callable
+from collections.abc import Callable, Collection, Iterator, Mapping
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
+from typing import TextIO
 from urllib.parse import urlsplit, urlunsplit
 
+import tiktoken
 from dulwich import porcelain
+from dulwich.objects import Commit
+from dulwich.repo import Repo
 
-from chareco.core.models import AnalysisOptions, AnalysisResult
-from chareco.core.utils import concatenate_files, get_structure, safe_remove
+from chareco.core.cache import ContentCache, ConversionCache
+from chareco.core.chunking import PartSplitter
+from chareco.core.filters import FilterSpec
+from chareco.core.models import AnalysisOptions, AnalysisResult, FileContents, FileManifest
+from chareco.core.packing import Candidate, pack_files
+from chareco.core.repositories import RepositoryCache, info_exclude, local_revision
+from chareco.core.tokens import TOKEN_ENCODING, get_encoding
+from chareco.core.transforms import PARALLEL_TRANSFORM_BYTES, PythonTransformer
+from chareco.core.utils import (
+    FileMeasure,
+    WrittenFiles,
+    copy_snapshot,
+    measure_files,
+    render_structure,
+    rescan_tree,
+    resolve_binary_flags,
+    reusable_contents,
+    safe_remove,
+    scan_git_tree,
+    scan_index,
+    scan_tree,
+    write_manifest,
+)
+
+
+_MIB = 1024 * 1024
 
 
 class AnalysisCancelled(Exception):
@@ -28,7 +56,14 @@ def display_source(source: str) -> str:
     return urlunsplit((parsed.scheme, netloc, parsed.path, parsed.query, ""))
 
 
-def _clone_repository(options: AnalysisOptions, destination: str, pat: str | None) -> str:
+@contextmanager
+def _remote_revision(options: AnalysisOptions, pat: str | None) -> Iterator[tuple[Repo, Commit]]:
+    """Yield a bare repository holding the requested revision, and its commit.
+
+    With a ``cache_dir`` the objects come from a cached bare repository that
+    only fetches what changed; otherwise from a fresh shallow clone that is
+    deleted afterwards. Nothing is checked out.
+    """
     source = options.source_path.strip()
     clone_kwargs: dict[str, object] = {"depth": 1}
     parsed = urlsplit(source)
@@ -42,8 +77,141 @@ def _clone_repository(options: AnalysisOptions, destination: str, pat: str | Non
             raise ValueError("A Personal Access Token may only be used with an HTTPS github.com URL.")
         clone_kwargs.update({"username": "x-access-token", "password": pat})
 
-    repository = porcelain.clone(source, destination, **clone_kwargs)
-    return repository.head().hex()
+    if options.cache_dir:
+        repositories = RepositoryCache(options.cache_dir, options.repository_cache_max_bytes)
+        with repositories.revision(
+            source,
+            branch=options.branch,
+            username=clone_kwargs.get("username"),
+            password=clone_kwargs.get("password"),
+        ) as revision:
+            yield revision
+        return
+    directory = tempfile.mkdtemp(prefix="chareco-")
+    try:
+        repository = porcelain.clone(source, directory, bare=True, **clone_kwargs)
+        try:
+            yield repository, repository[repository.get_peeled(b"HEAD")]
+        finally:
+            repository.close()
+    finally:
+        safe_remove(directory)
+
+
+def _manifest_text(metadata: dict[str, str]) -> str:
+    return "Context manifest:\n" + "\n".join(f"- {name}: {value}" for name, value in metadata.items())
+
+
+def _token_total(written: WrittenFiles) -> str:
+    return f"{written.total_tokens:,} in concatenated content"
+
+
+def _duplicate_savings(written: WrittenFiles) -> str:
+    saved = f"{written.saved_bytes:,} bytes"
+    if written.total_tokens is not None:
+        saved += f" and {written.saved_tokens:,} tokens"
+    if len(written.duplicates) == 1:
+        return f"1 file identical to an earlier one, {saved} saved"
+    return f"{len(written.duplicates):,} files identical to earlier ones, {saved} saved"
+
+
+_TRANSFORM_LABELS = {"strip": "Python stripping", "skeleton": "Python outlines"}
+
+
+def _transform_reductions(written: WrittenFiles) -> dict[str, str]:
+    reductions = {}
+    for transform, (files, before, after) in sorted(written.transformed.items(), reverse=True):
+        reduction = 1 - after / before if before else 0.0
+        counted = "1 Python file" if files == 1 else f"{files:,} Python files"
+        reductions[_TRANSFORM_LABELS[transform]] = (
+            f"{counted}, {before:,} → {after:,} bytes ({reduction:.1%} smaller)"
+        )
+    return reductions
+
+
+def _transform_settings(options: AnalysisOptions) -> tuple[object, ...]:
+    """The Python transform settings that shape a run's contents; empty when none apply."""
+    if not options.concatenate or not (options.strip_python or options.python_skeleton):
+        return ()
+    return (options.strip_python, options.collapse_blank_lines, options.python_skeleton)
+
+
+def _python_transformer(manifest: FileManifest, options: AnalysisOptions) -> PythonTransformer | None:
+    """Return the transformer for the output's Python files, with workers when there is enough Python."""
+    if not options.concatenate or not (options.strip_python or options.python_skeleton):
+        return None
+    python = PythonTransformer(
+        options.python_skeleton,
+        strip=options.strip_python,
+        collapse_blank_lines=options.collapse_blank_lines,
+        cache=ConversionCache(options.cache_dir, "python") if options.cache_dir else None,
+    )
+    python_bytes = sum(entry.size for entry in manifest.eligible_files() if python.mode(entry.relative_path))
+    if python_bytes >= PARALLEL_TRANSFORM_BYTES:
+        python.start_workers(options.read_workers)
+    return python
+
+
+_Piece = str | tuple[str, str, int | None]
+
+
+def _joined(pieces: list[_Piece], splitter: PartSplitter | None) -> str:
+    """Join buffered text and file blocks, feeding them to ``splitter`` in output order."""
+    if splitter is not None:
+        for piece in pieces:
+            if isinstance(piece, str):
+                splitter.write(piece)
+            else:
+                splitter.write_block(*piece)
+    return "".join(text for piece in pieces for text in ((piece,) if isinstance(piece, str) else piece[:2]))
+
+
+def _pack_manifest(
+    manifest: FileManifest,
+    options: AnalysisOptions,
+    encoding: tiktoken.Encoding | None,
+    serialize_options: dict[str, object],
+) -> tuple[set[str], dict[str, int], int]:
+    """Return the packed selection, token counts measured on the way, and the candidate count.
+
+    Files are only read up front when keyword hits or token costs are needed.
+    """
+    packing = options.packing
+    measures: dict[str, FileMeasure] | None = None
+    if packing.keywords or encoding is not None:
+        measures = measure_files(
+            manifest,
+            encoding=encoding,
+            keywords=packing.keywords,
+            read_workers=options.read_workers,
+            notebook_workers=options.notebook_workers,
+            notebook_cache=serialize_options["notebook_cache"],
+            content_cache=serialize_options["content_cache"],
+            python=serialize_options["python"],
+        )
+    candidates: list[Candidate] = []
+    for entry in manifest.eligible_files():
+        if measures is None:
+            candidates.append(Candidate(entry.relative_path, entry.size, entry.mtime_ns))
+            continue
+        measure = measures.get(entry.relative_path)
+        if measure is not None:
+            candidates.append(
+                Candidate(
+                    entry.relative_path,
+                    measure.size,
+                    entry.mtime_ns,
+                    measure.tokens,
+                    measure.keyword_hits,
+                )
+            )
+    selection = pack_files(candidates, packing, options.max_total_bytes, options.max_total_tokens)
+    tokens = {
+        path: measure.tokens
+        for path, measure in (measures or {}).items()
+        if measure.tokens is not None
+    }
+    return selection, tokens, len(candidates)
 
 
 def run_analysis(
@@ -52,11 +220,42 @@ def run_analysis(
     pat: str | None = None,
     progress: Callable[[str, int], None] | None = None,
     is_cancelled: Callable[[], bool] | None = None,
+    previous: AnalysisResult | None = None,
+    changed_directories: Collection[str] | None = None,
+    output: TextIO | None = None,
 ) -> AnalysisResult:
-    """Run one bounded analysis without any Qt dependency."""
+    """Run one bounded analysis without any Qt dependency.
+
+    With ``options.revision`` a local folder is read at that commit of its
+    git repository, straight from the object store, like a remote one.
+
+    Passing the ``previous`` result of the same live local folder turns the
+    run into a refresh: files whose stat metadata is unchanged keep their
+    binary verdicts and loaded contents, and only added or changed files are
+    read again. When the caller also knows which directories changed, for
+    example from a filesystem watcher, only those are listed again.
+
+    With an ``output`` stream the text is written there piece by piece as it
+    is produced, and the result carries no ``full_text`` or ``file_contents``;
+    memory then stays proportional to the largest files being read. Without
+    one, ``file_contents`` is a ``FileContents`` view into ``full_text``, so
+    each file is held once.
+
+    With ``options.max_total_tokens`` every file's tokens are counted as it is
+    read and the manifest records the total. A streamed manifest is already
+    written by then, so there the total follows the content instead.
+
+    With ``options.max_part_tokens`` the result's ``parts`` split the output
+    into pieces of at most that many tokens, one chat message each. Their
+    boundaries are found as the output is produced, from the same per-file
+    token counts.
+    """
     progress = progress or (lambda _message, _value: None)
     is_cancelled = is_cancelled or (lambda: False)
     temporary_directory: str | None = None
+    repository_context = ExitStack()
+    content_cache: ContentCache | None = None
+    python: PythonTransformer | None = None
 
     def check_cancelled() -> None:
         if is_cancelled():
@@ -64,57 +263,122 @@ def run_analysis(
 
     try:
         check_cancelled()
-        if options.is_local:
+        prefix = ""
+        exclude_lines: list[str] = []
+        if options.is_local and options.revision is not None:
+            repository, commit, prefix = repository_context.enter_context(
+                local_revision(options.source_path, options.revision)
+            )
+            exclude_lines = info_exclude(repository)
             folder_path = options.source_path
+            revision = commit.id.decode("ascii")
+        elif options.is_local:
+            folder_path = options.source_path
+            if options.copy_local_folder and options.tracked_only:
+                raise ValueError("Tracked files are read from the git index, which a snapshot does not have.")
             if options.copy_local_folder:
                 temporary_directory = tempfile.mkdtemp(prefix="chareco-")
                 source_folder = Path(folder_path)
                 folder_path = str(Path(temporary_directory) / source_folder.name)
                 progress("Creating local snapshot…", 10)
-                shutil.copytree(
+                reported = 10
+
+                def snapshot_progress(copied: int, total: int) -> None:
+                    nonlocal reported
+                    check_cancelled()
+                    value = 10 + 25 * copied // max(total, 1)
+                    if value != reported or copied == total:
+                        reported = value
+                        progress(f"Creating local snapshot… {copied / _MIB:,.1f} of {total / _MIB:,.1f} MiB", value)
+
+                # Only files that pass the filters and limits are copied.
+                copy_snapshot(
                     source_folder,
                     folder_path,
-                    symlinks=True,
-                    ignore=shutil.ignore_patterns(".git"),
-                    dirs_exist_ok=True,
+                    FilterSpec.from_options(options),
+                    max_file_bytes=options.max_file_bytes,
+                    workers=options.read_workers,
+                    progress=snapshot_progress,
                 )
             revision = "local working tree"
         else:
-            temporary_directory = tempfile.mkdtemp(prefix="chareco-")
-            folder_path = temporary_directory
-            progress("Cloning repository…", 10)
-            revision = _clone_repository(options, folder_path, pat)
+            progress("Fetching repository…" if options.cache_dir else "Cloning repository…", 10)
+            repository, commit = repository_context.enter_context(_remote_revision(options, pat))
+            revision = commit.id.decode("ascii")
 
         check_cancelled()
-        progress("Generating folder structure…", 45)
-        structure = get_structure(
-            folder_path,
-            exclude=options.exclude_extensions,
-            include=options.include_extensions,
-            ignore_git=not options.include_git,
-            exclude_license=not options.include_license,
-            exclude_readme=options.exclude_readme,
-            exclude_folders=options.exclude_patterns,
-            max_file_bytes=options.max_file_bytes,
-        )
-
-        check_cancelled()
-        progress("Scanning files…", 70)
-        retain_snapshot_content = options.is_local and options.copy_local_folder
-        concatenated_content, file_positions, file_contents = concatenate_files(
-            folder_path,
-            exclude=options.exclude_extensions,
-            include=options.include_extensions,
-            ignore_git=not options.include_git,
-            exclude_license=not options.include_license,
-            exclude_readme=options.exclude_readme,
-            exclude_folders=options.exclude_patterns,
-            read_files=options.concatenate or retain_snapshot_content,
-            max_file_bytes=options.max_file_bytes,
-            max_total_bytes=options.max_total_bytes,
+        # Snapshots and clones get fresh inodes every run, so only live folders are cached.
+        live_folder = options.is_local and not options.copy_local_folder and options.revision is None
+        if options.content_cache and options.cache_dir and live_folder:
+            content_cache = ContentCache(options.cache_dir, options.content_cache_max_bytes)
+        previous_manifest = previous.manifest if previous is not None and live_folder else None
+        if previous_manifest is not None and previous_manifest.root != str(Path(folder_path).resolve()):
+            previous_manifest = None
+        streaming = output is not None
+        retain_snapshot_content = options.is_local and options.copy_local_folder and not streaming
+        read_files = options.concatenate or retain_snapshot_content
+        progress("Scanning files…", 40)
+        if not options.is_local or options.revision is not None:
+            # Revisions are read straight from the object store, never checked out.
+            manifest = scan_git_tree(
+                repository.object_store,
+                commit.tree,
+                FilterSpec.from_options(options),
+                max_file_bytes=options.max_file_bytes,
+                root=str(Path(folder_path).resolve()) if options.is_local else display_source(options.source_path),
+                mtime_ns=commit.commit_time * 1_000_000_000,
+                prefix=prefix,
+                exclude_lines=exclude_lines,
+                # Blobs inflated for sniffing are kept for the reader, up to what the output can hold.
+                retain_bytes=options.max_total_bytes if read_files and not streaming else 0,
+            )
+            # Runs before the repository closes, so the result does not keep its object store.
+            repository_context.callback(setattr, manifest, "read_blob", None)
+        elif options.tracked_only:
+            # The index lists every tracked file, so there are no directories to rescan.
+            manifest = scan_index(
+                folder_path,
+                FilterSpec.from_options(options),
+                max_file_bytes=options.max_file_bytes,
+                content_cache=content_cache,
+                previous=previous_manifest,
+                sniff_binary=streaming or not read_files,
+            )
+        elif previous_manifest is not None and changed_directories is not None:
+            manifest = rescan_tree(
+                previous_manifest,
+                FilterSpec.from_options(options),
+                changed_directories,
+                content_cache=content_cache,
+                sniff_binary=streaming or not read_files,
+            )
+        else:
+            manifest = scan_tree(
+                folder_path,
+                FilterSpec.from_options(options),
+                max_file_bytes=options.max_file_bytes,
+                content_cache=content_cache,
+                previous=previous_manifest,
+                sniff_binary=streaming or not read_files,
+            )
+        if content_cache is not None:
+            # Verdicts stored while scanning must not keep the database locked while files are read.
+            content_cache.flush()
+        python = _python_transformer(manifest, options)
+        # Transforms only apply to the output, and their savings are measured per run.
+        # Contents the previous run transformed differently are never reused.
+        transform_settings = _transform_settings(options)
+        known_contents = (
+            reusable_contents(previous_manifest, manifest, previous.file_contents)
+            if previous_manifest is not None
+            and python is None
+            and previous.transform_settings == transform_settings
+            else {}
         )
 
         check_cancelled()
+        counting = options.max_total_tokens is not None or options.max_part_tokens is not None
+        encoding = get_encoding() if counting else None
         metadata = {
             "Source": display_source(options.source_path),
             "Revision": revision,
@@ -122,20 +386,131 @@ def run_analysis(
             "File limit": f"{options.max_file_bytes:,} bytes per file",
             "Output limit": f"{options.max_total_bytes:,} bytes",
         }
-        manifest = "Context manifest:\n" + "\n".join(
-            f"- {name}: {value}" for name, value in metadata.items()
+        if options.max_total_tokens is not None:
+            metadata["Token limit"] = f"{options.max_total_tokens:,} {TOKEN_ENCODING} tokens"
+        if options.max_part_tokens is not None:
+            metadata["Part limit"] = f"{options.max_part_tokens:,} {TOKEN_ENCODING} tokens per part"
+        serialize_options = {
+            "max_total_bytes": options.max_total_bytes,
+            "read_workers": options.read_workers,
+            "notebook_workers": options.notebook_workers,
+            "notebook_cache": (
+                ConversionCache(options.cache_dir, "notebooks") if options.cache_dir else None
+            ),
+            "content_cache": content_cache,
+            "known_contents": known_contents,
+            "max_total_tokens": options.max_total_tokens,
+            "encoding": encoding,
+            # Counts are only trusted for the unchanged files whose contents are reused.
+            "known_tokens": {
+                path: count for path, count in previous.token_counts.items() if path in known_contents
+            } if known_contents else None,
+            "deduplicate": options.deduplicate,
+            "python": python,
+        }
+        if options.packing is not None and options.concatenate:
+            check_cancelled()
+            progress("Ranking files…", 55)
+            selection, measured_tokens, candidate_count = _pack_manifest(
+                manifest, options, encoding, serialize_options
+            )
+            serialize_options["selection"] = selection
+            serialize_options["known_tokens"] = {
+                **(serialize_options["known_tokens"] or {}),
+                **measured_tokens,
+            }
+            metadata["Packing"] = (
+                f"{options.packing.strategy} by relevance, "
+                f"{len(selection):,} of {candidate_count:,} files selected"
+            )
+        written = WrittenFiles({entry.relative_path: 0 for entry in manifest.eligible_files()}, {}, {})
+        file_contents: Mapping[str, str] = dict(known_contents)
+
+        splitter = (
+            PartSplitter(options.max_part_tokens, encoding, output.write if streaming else None)
+            if options.max_part_tokens is not None
+            else None
         )
-        full_text = f"{manifest}\n\nFolder structure:\n{structure}\n"
-        if options.concatenate:
-            full_text += f"\nConcatenated content:\n{concatenated_content}"
+        if streaming:
+            write = output.write if splitter is None else splitter.write
+            # The structure comes first in the output, so binary flags were sniffed while scanning.
+            progress("Generating folder structure…", 60)
+            structure = render_structure(manifest)
+            write(f"{_manifest_text(metadata)}\n\nFolder structure:\n{structure}\n")
+            if options.concatenate:
+                check_cancelled()
+                progress("Reading files…", 70)
+                write("\nConcatenated content:\n")
+                written = write_manifest(
+                    manifest,
+                    write,
+                    write_block=splitter.write_block if splitter is not None else None,
+                    **serialize_options,
+                )
+                # The manifest is already written, so totals follow the content.
+                totals = []
+                if written.total_tokens is not None:
+                    totals.append(f"- Tokens: {_token_total(written)}")
+                if written.duplicates:
+                    totals.append(f"- Duplicates: {_duplicate_savings(written)}")
+                totals.extend(f"- {name}: {value}" for name, value in _transform_reductions(written).items())
+                if totals:
+                    write("\nContext totals:\n" + "\n".join(totals) + "\n")
+                file_contents = {}
+            full_text = ""
+        else:
+            progress("Reading files…", 60)
+            pieces: list[_Piece] = []
+            if read_files:
+                # Files are sniffed as they are read, so the structure is rendered afterwards.
+                written = write_manifest(
+                    manifest,
+                    pieces.append,
+                    write_block=(lambda *block: pieces.append(block)) if splitter is not None else None,
+                    **serialize_options,
+                )
+
+            check_cancelled()
+            progress("Generating folder structure…", 85)
+            resolve_binary_flags(manifest, content_cache, options.read_workers)
+            structure = render_structure(manifest)
+            if options.concatenate and written.total_tokens is not None:
+                metadata["Tokens"] = _token_total(written)
+            if options.concatenate and written.duplicates:
+                metadata["Duplicates"] = _duplicate_savings(written)
+            metadata.update(_transform_reductions(written))
+            preamble = f"{_manifest_text(metadata)}\n\nFolder structure:\n{structure}\n"
+            if options.concatenate:
+                heading = f"{preamble}\nConcatenated content:\n"
+                full_text = _joined([heading, *pieces], splitter)
+                # File contents are views into the output rather than a second copy.
+                offset = len(heading)
+                spans = {path: (start + offset, end + offset) for path, (start, end) in written.spans.items()}
+                file_contents = FileContents(full_text, spans)
+            else:
+                full_text = _joined([preamble], splitter)
+                if read_files:
+                    # Snapshot contents outlive the temporary copy without being part of the output.
+                    file_contents = FileContents(_joined(pieces, None), written.spans)
+
+        check_cancelled()
         progress("Finalizing results…", 95)
         return AnalysisResult(
             full_text=full_text,
             folder_structure=structure,
-            file_positions=file_positions,
+            file_positions=written.positions,
             file_contents=file_contents,
             metadata=metadata,
+            manifest=manifest,
+            token_counts=written.token_counts,
+            parts=splitter.finish() if splitter is not None else (),
+            transform_settings=transform_settings,
         )
     finally:
+        if python is not None:
+            python.close()
+        if content_cache is not None:
+            content_cache.close()
+        repository_context.close()
         if temporary_directory:
             safe_remove(temporary_directory)
@@ -0,0 +1,24 @@
+"""Token counting with tiktoken, shared by the analysis service and the GUI."""
+
+from __future__ import annotations
+
+import functools
+
+import tiktoken
+
+
+TOKEN_ENCODING = "cl100k_base"
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(name: str = TOKEN_ENCODING) -> tiktoken.Encoding:
+    """Load a tiktoken encoding once per process; the first load may download it."""
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as error:  # tiktoken raises network, file, and lookup errors
+        raise RuntimeError(f"Could not load the {name} tokenizer: {error}") from error
+
+
+def count_tokens(text: str, encoding: tiktoken.Encoding) -> int:
+    """Count tokens with special-token text treated as ordinary text, as a model sees a file."""
+    return len(encoding.encode_ordinary(text))
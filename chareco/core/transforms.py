@@ -0,0 +1,292 @@
+"""Content transforms that shrink source files before they are serialized."""
+
+from __future__ import annotations
+
+import ast
+import bisect
+import io
+import itertools
+import logging
+import multiprocessing
+import re
+import sys
+import tokenize
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+from chareco.core.cache import ConversionCache
+from chareco.core.filters import _GlobMatcher
+
+
+logger = logging.getLogger(__name__)
+
+# Below this much Python the process pool costs more to start than it saves.
+PARALLEL_TRANSFORM_BYTES = 1024 * 1024
+_CODING_COMMENT = re.compile(r"^[ \t\f]*#.*?coding[:=]")
+_PARSE_ERRORS = (SyntaxError, ValueError, RecursionError, MemoryError, tokenize.TokenError)
+_DOCUMENTED = (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+_BLOCK_FIELDS = ("body", "orelse", "finalbody", "handlers", "cases")
+_FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef)
+_TRY = (ast.Try, ast.TryStar) if hasattr(ast, "TryStar") else (ast.Try,)
+_SKELETON_NOTICE = "# Outline only: function bodies are elided.\n"
+# Bump when skeleton or stripping output changes, so cached results are not reused.
+_TRANSFORM_VERSION = "1"
+# Tokens whose lines after the first are string contents that must stay as they are.
+_STRING_TOKENS = {tokenize.STRING} | (
+    {tokenize.FSTRING_START, tokenize.FSTRING_MIDDLE} if hasattr(tokenize, "FSTRING_START") else set()
+)
+
+
+def is_python(relative_path: str) -> bool:
+    return relative_path.casefold().endswith(".py")
+
+
+def strip_python(text: str, collapse_blank_lines: bool = False) -> str:
+    """Remove comments and docstrings from Python source, keeping it valid.
+
+    A docstring that is the only statement of its body becomes ``...``. The
+    shebang and encoding lines are kept. With ``collapse_blank_lines`` runs
+    of blank lines shrink to one, except inside multi-line strings. Text that
+    does not parse, before or after stripping, is returned unchanged.
+    """
+    try:
+        tree = ast.parse(text)
+        tokens = list(tokenize.generate_tokens(io.StringIO(text, newline="").readline))
+    except _PARSE_ERRORS:
+        return text
+    # Lines end as the parser sees them: at \n, \r\n, or \r only.
+    lines = io.StringIO(text, newline="").readlines()
+    starts = list(itertools.accumulate((len(line) for line in lines), initial=0))
+
+    def offset(line_number: int, byte_column: int) -> int:
+        line = lines[line_number - 1]
+        if not line.isascii():
+            byte_column = len(line.encode("utf-8")[:byte_column].decode("utf-8", "ignore"))
+        return starts[line_number - 1] + byte_column
+
+    cuts: list[tuple[int, int, str]] = []
+    for node in _definitions(tree):
+        statement = node.body[0]
+        if not (
+            isinstance(statement, ast.Expr)
+            and isinstance(statement.value, ast.Constant)
+            and isinstance(statement.value.value, str)
+        ):
+            continue
+        start = offset(statement.lineno, statement.col_offset)
+        end = offset(statement.end_lineno, statement.end_col_offset)
+        line_start, line_end = starts[statement.lineno - 1], starts[statement.end_lineno]
+        rest = text[end:line_end].strip()
+        if len(node.body) == 1 and not isinstance(node, ast.Module):
+            cuts.append((start, end, "..."))
+        elif not text[line_start:start].strip() and (not rest or rest.startswith("#")):
+            cuts.append((line_start, line_end, ""))
+        else:
+            cuts.append((start, end, "..."))
+
+    for token in tokens:
+        if token.type != tokenize.COMMENT:
+            continue
+        line_number, column = token.start
+        line = lines[line_number - 1]
+        if (line_number == 1 and line.startswith("#!")) or (line_number <= 2 and _CODING_COMMENT.match(line)):
+            continue
+        line_start = starts[line_number - 1]
+        code = line[:column].rstrip()
+        if code:
+            cuts.append((line_start + len(code), line_start + len(line.rstrip("\r\n")), ""))
+        else:
+            cuts.append((line_start, starts[line_number], ""))
+
+    cuts.sort()
+    applied: list[tuple[int, int, str]] = []
+    pieces: list[str] = []
+    position = 0
+    for cut in cuts:
+        start, end, replacement = cut
+        if start < position:
+            continue  # A comment after a docstring whose lines were already removed.
+        pieces.append(text[position:start])
+        pieces.append(replacement)
+        applied.append(cut)
+        position = end
+    pieces.append(text[position:])
+    stripped = "".join(pieces)
+
+    if collapse_blank_lines:
+        # Other strings are never cut, so their lines keep their text and only shift.
+        ends = [end for _, end, _ in applied]
+        shifts = list(itertools.accumulate(
+            (len(replacement) - (end - start) for start, end, replacement in applied), initial=0
+        ))
+        protected = set()
+        for token in tokens:
+            if token.type not in _STRING_TOKENS or token.end[0] == token.start[0]:
+                continue
+            for line_number in range(token.start[0] + 1, token.end[0] + 1):
+                start = starts[line_number - 1]
+                index = bisect.bisect_right(ends, start)
+                if index == len(applied) or applied[index][0] > start:
+                    protected.add(start + shifts[index])
+        stripped = _collapse_blank_lines(stripped, protected)
+    try:
+        ast.parse(stripped)
+    except _PARSE_ERRORS:
+        logger.info("Kept Python source unchanged because stripping did not round-trip.")
+        return text
+    return stripped
+
+
+def _definitions(tree: ast.Module) -> list[ast.AST]:
+    """Return the module, classes, and functions, visiting statements only."""
+    found: list[ast.AST] = []
+    pending: list[ast.AST] = [tree]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, _DOCUMENTED) and node.body:
+            found.append(node)
+        for name in _BLOCK_FIELDS:
+            pending.extend(getattr(node, name, ()))
+    return found
+
+
+def _collapse_blank_lines(text: str, protected: set[int]) -> str:
+    """Drop blank lines that follow a blank line, unless they start at a ``protected`` offset."""
+    kept: list[str] = []
+    position = 0
+    previous_blank = False
+    for line in io.StringIO(text, newline="").readlines():
+        blank = not line.strip() and position not in protected
+        if not (blank and previous_blank):
+            kept.append(line)
+        previous_blank = blank
+        position += len(line)
+    return "".join(kept)
+
+
+def python_skeleton(text: str) -> str:
+    """Outline Python source: imports, classes, and signatures with docstring first lines.
+
+    Function bodies become ``...``, and definitions inside ``if`` and ``try``
+    blocks are outlined in place of the blocks. Text that does not parse is
+    returned unchanged.
+    """
+    try:
+        tree = ast.parse(text)
+        outline = ast.unparse(ast.Module(body=_outline(tree), type_ignores=[]))
+    except _PARSE_ERRORS:
+        return text
+    return f"{_SKELETON_NOTICE}{outline}\n" if outline else _SKELETON_NOTICE
+
+
+def _outline(node: ast.Module | ast.ClassDef) -> list[ast.stmt]:
+    outlined = _summary(node)
+    for statement in _flattened(node.body):
+        if isinstance(statement, (ast.Import, ast.ImportFrom)):
+            outlined.append(statement)
+        elif isinstance(statement, ast.AnnAssign):
+            statement.value = None
+            outlined.append(statement)
+        elif isinstance(statement, ast.ClassDef):
+            statement.body = _outline(statement) or [ast.Expr(ast.Constant(...))]
+            outlined.append(statement)
+        elif isinstance(statement, _FUNCTIONS):
+            statement.body = [*_summary(statement), ast.Expr(ast.Constant(...))]
+            outlined.append(statement)
+    return outlined
+
+
+def _flattened(body: list[ast.stmt]) -> list[ast.stmt]:
+    statements: list[ast.stmt] = []
+    for statement in body:
+        if isinstance(statement, ast.If):
+            statements.extend(_flattened(statement.body + statement.orelse))
+        elif isinstance(statement, _TRY):
+            blocks = [statement.body, *(handler.body for handler in statement.handlers)]
+            blocks += [statement.orelse, statement.finalbody]
+            statements.extend(_flattened([line for block in blocks for line in block]))
+        else:
+            statements.append(statement)
+    return statements
+
+
+def _summary(node: ast.AST) -> list[ast.stmt]:
+    """The first line of a docstring, as a docstring, or nothing."""
+    docstring = ast.get_docstring(node)
+    first_line = docstring.strip().partition("\n")[0].strip() if docstring else ""
+    return [ast.Expr(ast.Constant(first_line))] if first_line else []
+
+
+def _transform(text: str, mode: str, collapse_blank_lines: bool) -> str:
+    if mode == "skeleton":
+        return python_skeleton(text)
+    return strip_python(text, collapse_blank_lines)
+
+
+class PythonTransformer:
+    """Outline ``.py`` files matching ``skeleton_patterns`` and strip the rest when ``strip``.
+
+    Results are cached by content hash when a ``cache`` is given. After
+    ``start_workers`` the parsing runs on a process pool: ``apply`` may be
+    called from several reader threads at once, and each call waits for its
+    own file, so one file per worker is transformed in parallel.
+    """
+
+    def __init__(
+        self,
+        skeleton_patterns: Sequence[str] = (),
+        strip: bool = False,
+        collapse_blank_lines: bool = False,
+        cache: ConversionCache | None = None,
+    ) -> None:
+        self.strip = strip
+        self.collapse_blank_lines = collapse_blank_lines
+        self._skeleton = _GlobMatcher(tuple(skeleton_patterns)).matches if skeleton_patterns else None
+        self._cache = cache
+        self._executor: ProcessPoolExecutor | None = None
+
+    def mode(self, relative_path: str) -> str | None:
+        """Return ``"skeleton"``, ``"strip"``, or ``None`` for a file left as it is."""
+        if not is_python(relative_path):
+            return None
+        if self._skeleton is not None and self._skeleton(relative_path, relative_path.rpartition("/")[2]):
+            return "skeleton"
+        return "strip" if self.strip else None
+
+    def start_workers(self, workers: int) -> None:
+        if workers > 1 and self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    def apply(self, mode: str, text: str) -> str:
+        collapse = self.collapse_blank_lines and mode == "strip"
+        key = None
+        if self._cache is not None:
+            key = ConversionCache.key(
+                text.encode("utf-8", "surrogatepass"),
+                mode,
+                str(collapse),
+                _TRANSFORM_VERSION,
+                # ast.unparse output may change between Python versions.
+                f"{sys.version_info[0]}.{sys.version_info[1]}",
+            )
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+        if self._executor is None:
+            transformed = _transform(text, mode, collapse)
+        else:
+            try:
+                transformed = self._executor.submit(_transform, text, mode, collapse).result()
+            except Exception as error:  # A crashed worker must not abort the analysis.
+                logger.warning("Could not transform Python source in a worker: %s", error)
+                return text
+        if key is not None:
+            self._cache.put(key, transformed)
+        return transformed
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
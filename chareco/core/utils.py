@@ -2,21 +2,58 @@
 
 from __future__ import annotations
 
-import fnmatch
+import codecs
+import hashlib
 import logging
+import multiprocessing
 import os
-import re
 import shutil
+import stat
+import sys
+import threading
 import time
-from collections.abc import Iterator, Sequence
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence, Set as AbstractSet
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from itertools import islice
 from pathlib import Path, PurePosixPath
+from typing import BinaryIO, TypeVar
+
+import tiktoken
+from dulwich.errors import NotGitRepository
+from dulwich.object_store import BaseObjectStore
+from dulwich.repo import Repo
+
+from chareco.core.cache import ContentCache, ConversionCache, StatKey, stat_key
+from chareco.core.filters import (  # noqa: F401 - re-exported for existing callers
+    FilterSpec,
+    _matches_extension,
+    _matches_glob,
+    _normalise_path,
+    _normalise_rules,
+    _passes_file_filters,
+    is_git_related,
+    should_exclude,
+)
+from chareco.core.gitignore import IGNORE_FILENAME, GitIgnore, RuleSet, RuleStack, is_ignored, parse_rules
+from chareco.core.models import FileContents, FileManifest, ScannedDirectory, ScannedFile
+from chareco.core.tokens import count_tokens
+from chareco.core.transforms import PythonTransformer
 
 
 logger = logging.getLogger(__name__)
 
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
 DEFAULT_MAX_FILE_BYTES = 1_000_000
 DEFAULT_MAX_TOTAL_BYTES = 20_000_000
 _SAMPLE_SIZE = 8_192
+# Below this much notebook JSON to convert the process pool costs more to start than it saves.
+PARALLEL_NOTEBOOK_BYTES = 1024 * 1024
+# Linux ioctl that makes the destination share the source's extents on copy-on-write filesystems.
+_FICLONE = 0x40049409
 
 _BINARY_SUFFIXES = frozenset({
     ".7z", ".avi", ".bin", ".bmp", ".bz2", ".class", ".db", ".dll", ".doc",
@@ -26,194 +63,185 @@ _BINARY_SUFFIXES = frozenset({
     ".so", ".sqlite", ".tar", ".tif", ".tiff", ".ttf", ".wav", ".webp", ".wmv",
     ".woff", ".woff2", ".xls", ".xlsx", ".xz", ".zip",
 })
-_GIT_FILENAMES = frozenset({".gitignore", ".gitattributes", ".gitmodules"})
 _TEXT_BOMS = (b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff", b"\xff\xfe\x00\x00", b"\x00\x00\xfe\xff")
 
 
-def _normalise_path(path: str | Path) -> str:
-    """Return a relative path in portable POSIX form."""
-    value = os.fspath(path).replace("\\", "/")
-    if value in {"", "."}:
-        return ""
-    return value[2:] if value.startswith("./") else value.strip("/")
-
-
-def _matches_glob(relative_path: str, patterns: Sequence[str]) -> bool:
-    path = _normalise_path(relative_path)
-    name = PurePosixPath(path).name
-    for raw_pattern in patterns:
-        pattern = _normalise_path(raw_pattern)
-        if not pattern:
-            continue
-        if (
-            (pattern.endswith("/*") and path == pattern[:-2])
-            or
-            fnmatch.fnmatchcase(path, pattern)
-            or fnmatch.fnmatchcase(name, pattern)
-            or PurePosixPath(path).match(pattern)
-        ):
-            return True
-    return False
-
-
-def _matches_extension(filename: str, extensions: Sequence[str]) -> bool:
-    """Support .py, py, and *.py entries without making filtering surprising."""
-    lowered = filename.casefold()
-    for extension in extensions:
-        rule = extension.strip().casefold()
-        if not rule:
-            continue
-        if rule.startswith("*"):
-            if fnmatch.fnmatchcase(lowered, rule):
-                return True
-            continue
-        if not rule.startswith("."):
-            rule = f".{rule}"
-        if lowered.endswith(rule):
-            return True
-    return False
-
-
-def _normalise_rules(rules: Sequence[str] | None) -> tuple[str, ...]:
-    """Accept both API sequences and the comma-separated form advertised by the UI."""
-    return tuple(
-        token
-        for rule in rules or ()
-        for token in re.split(r"[,\s]+", rule.strip())
-        if token
-    )
+def is_binary(file_path: str | Path, cache: ContentCache | None = None) -> bool:
+    """Use a suffix fast path and a small byte sample for unknown formats."""
+    if _has_binary_name(os.path.basename(os.fspath(file_path))):
+        return True
+    if cache is None:
+        return _sniff_binary(file_path)
+    try:
+        key = stat_key(os.stat(file_path))
+    except OSError:
+        return True
+    return _cached_binary(file_path, key, cache)
 
 
-def is_git_related(path: str | Path) -> bool:
-    """Match actual Git metadata names, not arbitrary paths containing '.git'."""
-    candidate = Path(path)
-    return candidate.name == ".git" or candidate.name.casefold() in _GIT_FILENAMES
+def _has_binary_name(name: str) -> bool:
+    return os.path.splitext(name)[1].casefold() in _BINARY_SUFFIXES or name == ".DS_Store"
 
 
-def is_binary(file_path: str | Path) -> bool:
-    """Use a suffix fast path and a small byte sample for unknown formats."""
-    path = Path(file_path)
-    if path.suffix.casefold() in _BINARY_SUFFIXES or path.name == ".DS_Store":
-        return True
+def _sniff_binary(file_path: str | Path) -> bool:
     try:
-        with path.open("rb") as handle:
+        with open(file_path, "rb") as handle:
             sample = handle.read(_SAMPLE_SIZE)
     except OSError:
         return True
+    return _looks_binary(sample)
+
+
+def _looks_binary(sample: bytes) -> bool:
     if not sample or sample.startswith(_TEXT_BOMS):
         return False
     return b"\x00" in sample
 
 
-def _should_skip_directory(
-    directory: Path,
-    relative_path: str,
-    *,
-    ignore_git: bool,
-    exclude_patterns: Sequence[str],
-) -> bool:
-    if directory.is_symlink():
-        return True
-    if ignore_git and directory.name == ".git":
-        return True
-    return _matches_glob(relative_path, exclude_patterns)
-
-
-def _iter_files(
-    root_path: str | Path,
-    *,
-    ignore_git: bool,
-    exclude_patterns: Sequence[str],
-) -> Iterator[tuple[Path, str]]:
-    """Yield safe regular files deterministically while pruning excluded trees."""
-    root = Path(root_path).resolve()
-    if ignore_git and root.name == ".git":
-        return
-    for current_root, directory_names, file_names in os.walk(root, topdown=True, followlinks=False):
-        current = Path(current_root)
-        relative_root = _normalise_path(current.relative_to(root))
-
-        directory_names[:] = sorted(
-            name
-            for name in directory_names
-            if not _should_skip_directory(
-                current / name,
-                f"{relative_root}/{name}" if relative_root else name,
-                ignore_git=ignore_git,
-                exclude_patterns=exclude_patterns,
-            )
+def _cached_binary(file_path: str | Path, key: StatKey | None, cache: ContentCache) -> bool:
+    cached = cache.get(key)
+    if cached is not None and cached.binary is not None:
+        return cached.binary
+    binary = _sniff_binary(file_path)
+    cache.put_binary(key, binary)
+    return binary
+
+
+def _scandir_sorted(directory: str) -> list[os.DirEntry[str]] | None:
+    try:
+        with os.scandir(directory) as iterator:
+            return sorted(iterator, key=lambda entry: entry.name)
+    except OSError as error:
+        logger.warning("Could not list %s: %s", directory, error)
+        return None
+
+
+def _split_entries(
+    relative_root: str,
+    entries: list[os.DirEntry[str]],
+    filters: FilterSpec,
+    ignore_rules: RuleStack = (),
+) -> tuple[list[os.DirEntry[str]], list[tuple[str, str]]]:
+    """Split one listing into non-symlink files and unpruned ``(relative, absolute)`` subdirectories.
+
+    Entries matched by ``ignore_rules`` are dropped as if they did not exist.
+    """
+    files: list[os.DirEntry[str]] = []
+    subdirectories: list[tuple[str, str]] = []
+    for entry in entries:
+        try:
+            is_directory = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            is_directory = False
+        if entry.is_symlink():
+            continue
+        relative_path = f"{relative_root}/{entry.name}" if relative_root else entry.name
+        if ignore_rules and is_ignored(ignore_rules, relative_path, entry.name, is_directory):
+            continue
+        if not is_directory:
+            files.append(entry)
+        elif not filters.excludes_directory(relative_path, entry.name):
+            subdirectories.append((relative_path, entry.path))
+    return files, subdirectories
+
+
+def _walk_tree(
+    root: str,
+    filters: FilterSpec,
+    start: str = "",
+    ignores: GitIgnore | None = None,
+) -> Iterator[tuple[str, list[os.DirEntry[str]]]]:
+    """Yield ``(relative_dir, file_entries)`` in ``os.walk`` top-down order.
+
+    Directory entries come straight from ``os.scandir`` so symlink and type
+    checks use the cached ``d_type`` instead of extra ``lstat`` calls.
+    Symlinks are never yielded or followed. ``start`` walks only the subtree
+    at that relative path. With ``filters.respect_gitignore`` each directory
+    carries its ignore rule stack, so ignored directories are never listed.
+    """
+    if ignores is None and filters.respect_gitignore:
+        ignores = GitIgnore(root)
+    inherited = ignores.stack_above(start) if ignores is not None else ()
+    pending = [(start, os.path.join(root, *start.split("/")) if start else root, inherited)]
+    while pending:
+        relative_root, current, inherited = pending.pop()
+        entries = _scandir_sorted(current)
+        if entries is None:
+            continue
+        rules = (
+            ignores.stack_within(inherited, relative_root, (entry.name for entry in entries))
+            if ignores is not None
+            else ()
         )
+        files, subdirectories = _split_entries(relative_root, entries, filters, rules)
+        yield relative_root, files
+        pending.extend((relative, absolute, rules) for relative, absolute in reversed(subdirectories))
 
-        for filename in sorted(file_names):
-            file_path = current / filename
-            if file_path.is_symlink():
-                continue
-            relative_path = _normalise_path(file_path.relative_to(root))
-            if ignore_git and is_git_related(filename):
-                continue
-            if _matches_glob(relative_path, exclude_patterns):
-                continue
-            yield file_path, relative_path
 
+def _directory_order(relative_path: str) -> tuple[str, ...]:
+    # Sorting by components reproduces the top-down walk order of sorted listings.
+    return tuple(relative_path.split("/")) if relative_path else ()
 
-def should_exclude(
-    path: str | Path,
-    ignore_git: bool,
-    exclude_license: bool,
-    exclude_readme: bool,
-    exclude_folders: Sequence[str] | None = None,
-) -> bool:
-    """Compatibility helper used by callers that filter a relative file path."""
-    filename = Path(path).name
-    lowered = filename.casefold()
-    if ignore_git and is_git_related(filename):
-        return True
-    if exclude_license and lowered in {"license", "license.txt", "license.md"}:
-        return True
-    if exclude_readme and lowered in {"readme", "readme.txt", "readme.md"}:
-        return True
-    return _matches_glob(_normalise_path(path), exclude_folders or ())
 
+@dataclass(frozen=True, slots=True)
+class _FileRead:
+    """Outcome of ``_read_file``; ``binary`` is ``None`` when it was not sniffed."""
 
-def _passes_file_filters(
-    relative_path: str,
-    *,
-    include: Sequence[str],
-    exclude: Sequence[str],
-    ignore_git: bool,
-    exclude_license: bool,
-    exclude_readme: bool,
-    exclude_patterns: Sequence[str],
-) -> bool:
-    if should_exclude(
-        relative_path,
-        ignore_git,
-        exclude_license,
-        exclude_readme,
-        exclude_patterns,
-    ):
-        return False
-    filename = PurePosixPath(relative_path).name
-    if exclude and _matches_extension(filename, exclude):
-        return False
-    return not include or _matches_extension(filename, include)
+    status: os.stat_result | None
+    binary: bool | None
+    raw: bytes | None
 
 
-def read_text_file(file_path: str | Path, max_file_bytes: int = DEFAULT_MAX_FILE_BYTES) -> str | None:
-    """Read a bounded text file using supported Unicode encodings."""
-    file_path = Path(file_path)
+def _read_file(file_path: str | Path, max_file_bytes: int, sniff: bool = True) -> _FileRead:
+    """Open a file once: ``fstat`` the handle, sniff the first block, then read the rest.
+
+    Binary files, files over ``max_file_bytes``, and anything but regular files
+    are abandoned before the rest is read. Reading stops at the ``fstat`` size,
+    so ``status`` describes exactly the bytes returned.
+    """
+    if sniff and _has_binary_name(os.path.basename(os.fspath(file_path))):
+        return _FileRead(None, True, None)
     try:
-        if file_path.stat().st_size > max_file_bytes or is_binary(file_path):
-            return None
-        with file_path.open("rb") as handle:
-            raw = handle.read(max_file_bytes + 1)
-        if len(raw) > max_file_bytes:
-            logger.info("Skipping file that exceeded the size limit while reading: %s", file_path)
-            return None
+        with open(file_path, "rb", buffering=0) as handle:
+            status = os.fstat(handle.fileno())
+            if not stat.S_ISREG(status.st_mode):
+                return _FileRead(status, None, None)
+            if status.st_size > max_file_bytes:
+                logger.info("Skipping file that exceeded the size limit while reading: %s", file_path)
+                return _FileRead(status, None, None)
+            sample = handle.read(_SAMPLE_SIZE)
+            if sniff and _looks_binary(sample):
+                return _FileRead(status, True, None)
+            chunks = [sample]
+            total = len(sample)
+            while total < status.st_size:
+                chunk = handle.read(status.st_size - total)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                total += len(chunk)
     except OSError as error:
         logger.warning("Could not read %s: %s", file_path, error)
-        return None
+        return _FileRead(None, None, None)
+    if total > max_file_bytes:
+        logger.info("Skipping file that exceeded the size limit while reading: %s", file_path)
+        return _FileRead(status, None, None)
+    return _FileRead(status, False if sniff else None, b"".join(chunks))
+
+
+def utf8_size(text: str) -> int:
+    """Return ``len(text.encode("utf-8"))``, without encoding ASCII-only text."""
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
 
+def _decoded_size(raw: bytes, text: str) -> int:
+    """UTF-8 size of ``text`` decoded from ``raw``, read off ``raw`` where decoding kept its bytes."""
+    if raw.startswith((b"\xff\xfe", b"\xfe\xff", b"\x00\x00\xfe\xff")):
+        return utf8_size(text)
+    return len(raw) - 3 if raw.startswith(codecs.BOM_UTF8) else len(raw)
+
+
+def _decode_text(raw: bytes, file_path: str | Path) -> str | None:
     if raw.startswith((b"\xff\xfe\x00\x00", b"\x00\x00\xfe\xff")):
         encodings = ("utf-32", "utf-8-sig")
     elif raw.startswith((b"\xff\xfe", b"\xfe\xff")):
@@ -229,82 +257,1168 @@ def read_text_file(file_path: str | Path, max_file_bytes: int = DEFAULT_MAX_FILE
     return None
 
 
-def convert_notebook_to_markdown(file_path: str | Path) -> str | None:
+@dataclass(frozen=True, slots=True)
+class _LoadedText:
+    """Outcome of ``_load_text``; ``size`` is the UTF-8 size of ``text``.
+
+    ``original_size`` is the size before the ``transform`` that shrank
+    ``text``, ``"strip"`` or ``"skeleton"``, and ``None`` when none did.
+    """
+
+    binary: bool | None
+    text: str | None = None
+    size: int = 0
+    tokens: int | None = None
+    digest: bytes | None = None
+    original_size: int | None = None
+    transform: str | None = None
+
+
+def _load_text(
+    file_path: str | Path,
+    max_file_bytes: int,
+    key: StatKey | None,
+    cache: ContentCache | None,
+    sniff: bool = True,
+    encoding: tiktoken.Encoding | None = None,
+) -> _LoadedText:
+    """Load one file, opening it at most once; with an ``encoding`` also count its tokens."""
+    known_binary: bool | None = None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            if cached.binary:
+                return _LoadedText(True)
+            if cached.decoded:
+                if cached.content is None or encoding is None:
+                    return _LoadedText(False, cached.content, cached.stored_bytes)
+                tokens = cached.token_counts.get(encoding.name)
+                if tokens is None:
+                    tokens = count_tokens(cached.content, encoding)
+                    cache.put_token_count(key, encoding.name, tokens)
+                return _LoadedText(False, cached.content, cached.stored_bytes, tokens)
+            # A verdict stored without content skips the sniff but still belongs to the result.
+            known_binary = cached.binary
+            sniff = sniff and known_binary is None
+    result = _read_file(file_path, max_file_bytes, sniff)
+    if result.binary is None and known_binary is not None:
+        result = _FileRead(result.status, known_binary, result.raw)
+    fresh_key = stat_key(result.status) if cache is not None and result.status is not None else None
+    if result.binary:
+        if fresh_key is not None:
+            cache.put_binary(fresh_key, True)
+        return _LoadedText(True)
+    if result.raw is None:
+        return _LoadedText(result.binary)
+    text = _decode_text(result.raw, file_path)
+    if text is None:
+        loaded = _LoadedText(result.binary)
+    else:
+        loaded = _LoadedText(
+            result.binary,
+            text,
+            _decoded_size(result.raw, text),
+            count_tokens(text, encoding) if encoding is not None else None,
+        )
+    # A length mismatch means the file changed while it was read.
+    if fresh_key is not None and len(result.raw) == result.status.st_size:
+        cache.put_content(fresh_key, text, loaded.size)
+        if loaded.tokens is not None:
+            cache.put_token_count(fresh_key, encoding.name, loaded.tokens)
+    return loaded
+
+
+def read_text_file(
+    file_path: str | Path,
+    max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+    cache: ContentCache | None = None,
+) -> str | None:
+    """Read a bounded text file using supported Unicode encodings."""
+    key: StatKey | None = None
+    if cache is not None:
+        try:
+            key = stat_key(os.stat(file_path))
+        except OSError as error:
+            logger.warning("Could not read %s: %s", file_path, error)
+            return None
+    return _load_text(file_path, max_file_bytes, key, cache).text
+
+
+def _entry_key(entry: ScannedFile) -> StatKey | None:
+    if not entry.inode:
+        return None
+    return entry.device, entry.inode, entry.size, entry.mtime_ns
+
+
+def convert_notebook_to_markdown(
+    file_path: str | Path,
+    cache: ConversionCache | None = None,
+) -> str | None:
+    """Convert a notebook with jupytext, reusing cached Markdown for identical content."""
     try:
         import jupytext
 
-        notebook = jupytext.read(file_path)
-        return jupytext.writes(notebook, fmt="md")
+        if cache is None:
+            notebook = jupytext.read(file_path)
+            return jupytext.writes(notebook, fmt="md")
+        with open(file_path, "rb") as handle:
+            raw = handle.read()
     except Exception as error:  # jupytext provides several exception types
         logger.warning("Could not convert notebook %s: %s", file_path, error)
         return None
+    return notebook_bytes_to_markdown(raw, file_path, cache)
 
 
-def get_structure(
+def notebook_bytes_to_markdown(
+    raw: bytes,
+    label: str | Path,
+    cache: ConversionCache | None = None,
+) -> str | None:
+    """Convert notebook JSON already in memory, such as a git blob, to Markdown."""
+    try:
+        import jupytext
+
+        key = ConversionCache.key(raw, jupytext.__version__) if cache is not None else None
+        markdown = cache.get(key) if key is not None else None
+        if markdown is None:
+            notebook = jupytext.reads(raw.decode("utf-8-sig"), fmt="ipynb")
+            markdown = jupytext.writes(notebook, fmt="md")
+            if key is not None:
+                cache.put(key, markdown)
+        return markdown
+    except Exception as error:  # jupytext provides several exception types
+        logger.warning("Could not convert notebook %s: %s", label, error)
+        return None
+
+
+def _cached_notebook(file_path: str, cache: ConversionCache) -> str | None:
+    """Return cached Markdown for a notebook, or ``None`` when it must be converted."""
+    try:
+        import jupytext
+
+        with open(file_path, "rb") as handle:
+            raw = handle.read()
+    except (ImportError, OSError):
+        return None
+    return cache.get(ConversionCache.key(raw, jupytext.__version__))
+
+
+class _NotebookConverter:
+    """Converts a manifest's notebooks, on a process pool when there is enough to convert.
+
+    Cached conversions are looked up first; the remaining notebooks are
+    submitted up front, so they run while the serializer is still reading
+    ordinary files, and ``result`` then waits for one notebook. A notebook
+    whose worker fails is converted in-process instead. Notebooks of a git
+    manifest are converted from their blobs as they are read, so no blob is
+    inflated before it is needed.
+    """
+
+    def __init__(
+        self,
+        manifest: FileManifest,
+        workers: int,
+        cache: ConversionCache | None,
+        skip: Iterable[str] = (),
+    ) -> None:
+        self._cache = cache
+        self._executor: ProcessPoolExecutor | None = None
+        self._futures: dict[str, Future[str | None]] = {}
+        self._cached: dict[str, str] = {}
+        if manifest.read_blob is not None or workers <= 1:
+            return
+        skipped = frozenset(skip)
+        sizes = {
+            manifest.absolute_path(entry): entry.size
+            for entry in manifest.eligible_files()
+            if entry.relative_path.casefold().endswith(".ipynb")
+            and entry.relative_path not in skipped
+        }
+        if sum(sizes.values()) < PARALLEL_NOTEBOOK_BYTES:
+            return
+        if cache is not None:
+            for path in list(sizes):
+                markdown = _cached_notebook(path, cache)
+                if markdown is not None:
+                    self._cached[path] = markdown
+                    del sizes[path]
+        if len(sizes) > 1 and sum(sizes.values()) >= PARALLEL_NOTEBOOK_BYTES:
+            self._executor = ProcessPoolExecutor(
+                max_workers=min(workers, len(sizes)),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self._futures = {
+                path: self._executor.submit(convert_notebook_to_markdown, path, cache)
+                for path in sizes
+            }
+
+    def from_bytes(self, raw: bytes, label: str) -> str | None:
+        return notebook_bytes_to_markdown(raw, label, self._cache)
+
+    def result(self, file_path: str) -> str | None:
+        markdown = self._cached.pop(file_path, None)
+        if markdown is not None:
+            return markdown
+        future = self._futures.get(file_path)
+        if future is not None:
+            try:
+                return future.result()
+            except Exception as error:  # A broken pool must not drop the notebook from the output.
+                logger.warning("Notebook worker failed for %s, converting in-process: %s", file_path, error)
+        return convert_notebook_to_markdown(file_path, self._cache)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def scan_tree(
     path: str | Path,
-    only_dirs: bool = False,
-    exclude: Sequence[str] | None = None,
-    include: Sequence[str] | None = None,
-    ignore_git: bool = True,
-    exclude_license: bool = True,
-    exclude_readme: bool = False,
-    exclude_folders: Sequence[str] | None = None,
+    filters: FilterSpec,
     max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
-) -> str:
-    """Return a deterministic, filtered directory tree without following symlinks."""
+    list_files: bool = True,
+    content_cache: ContentCache | None = None,
+    previous: FileManifest | None = None,
+    sniff_binary: bool = True,
+) -> FileManifest:
+    """Walk a tree once and record stat metadata, filter verdicts, and binary flags.
+
+    Binary verdicts of files whose stat metadata is unchanged since a
+    ``previous`` scan of the same root are reused; with a ``content_cache``
+    they are looked up by ``(device, inode, size, mtime_ns)`` instead of being
+    sniffed again. With ``sniff_binary=False`` unknown verdicts are left
+    ``None`` for the reader, which sniffs the first block it reads anyway;
+    ``resolve_binary_flags`` settles whatever it did not reach.
+    """
     root = Path(path).resolve()
-    exclude = _normalise_rules(exclude)
-    include = _normalise_rules(include)
-    patterns = _normalise_rules(exclude_folders)
-    structure: list[str] = []
+    manifest = FileManifest(root=str(root), max_file_bytes=max_file_bytes)
+    known = previous.by_path() if previous is not None and previous.root == manifest.root else {}
+
+    if filters.ignore_git and root.name == ".git":
+        return manifest
 
-    if ignore_git and root.name == ".git":
-        return ""
-
-    for current_root, directory_names, file_names in os.walk(root, topdown=True, followlinks=False):
-        current = Path(current_root)
-        relative_root = _normalise_path(current.relative_to(root))
-        level = 0 if not relative_root else len(PurePosixPath(relative_root).parts)
-        indent = "│   " * max(level - 1, 0) + "├── "
-        structure.append(f"{indent}{current.name}/")
-
-        directory_names[:] = sorted(
-            name
-            for name in directory_names
-            if not _should_skip_directory(
-                current / name,
-                f"{relative_root}/{name}" if relative_root else name,
-                ignore_git=ignore_git,
-                exclude_patterns=patterns,
+    for relative_root, file_entries in _walk_tree(str(root), filters):
+        directory = ScannedDirectory(relative_root)
+        manifest.directories.append(directory)
+        if list_files:
+            _scan_files(
+                directory, file_entries, filters, max_file_bytes, content_cache, known, sniff_binary
             )
-        )
-        if only_dirs:
+    return manifest
+
+
+def _scan_files(
+    directory: ScannedDirectory,
+    file_entries: list[os.DirEntry[str]],
+    filters: FilterSpec,
+    max_file_bytes: int,
+    content_cache: ContentCache | None,
+    known: Mapping[str, ScannedFile],
+    sniff_binary: bool = True,
+) -> None:
+    relative_root = directory.relative_path
+    for file_entry in file_entries:
+        try:
+            status = file_entry.stat(follow_symlinks=False)
+        except OSError:
             continue
+        filename = file_entry.name
+        entry = _scanned_file(
+            f"{relative_root}/{filename}" if relative_root else filename,
+            filename,
+            file_entry.path,
+            status,
+            filters,
+            max_file_bytes,
+            content_cache,
+            known,
+            sniff_binary,
+        )
+        if entry is not None:
+            directory.files.append(entry)
 
-        subindent = "│   " * level + "├── "
-        for filename in sorted(file_names):
-            file_path = current / filename
-            relative_path = _normalise_path(file_path.relative_to(root))
-            if file_path.is_symlink() or not _passes_file_filters(
-                relative_path,
-                include=include,
-                exclude=exclude,
-                ignore_git=ignore_git,
-                exclude_license=exclude_license,
-                exclude_readme=exclude_readme,
-                exclude_patterns=patterns,
-            ):
+
+class _SnapshotCopier:
+    """Copies files by reflink, then ``copy_file_range``, then plain reads and writes.
+
+    A mechanism that fails once is not tried again, since the snapshot
+    stays on one filesystem.
+    """
+
+    def __init__(self) -> None:
+        self.reflink = sys.platform.startswith("linux")
+        self.copy_range = hasattr(os, "copy_file_range")
+
+    def copy(self, source: str, destination: str, status: os.stat_result) -> None:
+        try:
+            with open(source, "rb") as reader, open(destination, "wb") as writer:
+                if not (self._clone(reader.fileno(), writer.fileno()) or self._copy_range(reader, writer)):
+                    shutil.copyfileobj(reader, writer, 1024 * 1024)
+            os.utime(destination, ns=(status.st_atime_ns, status.st_mtime_ns))
+        except OSError as error:
+            logger.warning("Could not copy %s: %s", source, error)
+
+    def _clone(self, reader: int, writer: int) -> bool:
+        if not self.reflink:
+            return False
+        import fcntl
+
+        try:
+            fcntl.ioctl(writer, _FICLONE, reader)
+            return True
+        except OSError:
+            self.reflink = False
+            return False
+
+    def _copy_range(self, reader: BinaryIO, writer: BinaryIO) -> bool:
+        if not self.copy_range:
+            return False
+        try:
+            # Copies until the end of the file, even if it grew since it was listed.
+            while os.copy_file_range(reader.fileno(), writer.fileno(), 1 << 30):
+                pass
+            return True
+        except OSError:
+            self.copy_range = False
+            reader.seek(0)
+            writer.seek(0)
+            writer.truncate()
+            return False
+
+
+def copy_snapshot(
+    source: str | Path,
+    destination: str | Path,
+    filters: FilterSpec,
+    max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+    workers: int = 1,
+    progress: Callable[[int, int], None] | None = None,
+) -> int:
+    """Copy into ``destination`` only the files a scan of ``source`` could read; return the bytes copied.
+
+    Directories are walked with the scan's pruning and every one is created,
+    so the copy scans to the same structure. Files are copied only if they
+    pass ``filters``, fit ``max_file_bytes``, and have no binary extension.
+    Git metadata directories are never copied. ``progress`` receives the
+    bytes copied so far and the total after each file.
+    """
+    destination = os.fspath(destination)
+    walk_filters = replace(filters, ignore_git=True)
+    pending: list[tuple[str, str, os.stat_result]] = []
+    for relative_root, file_entries in _walk_tree(os.fspath(Path(source).resolve()), walk_filters):
+        target = os.path.join(destination, *relative_root.split("/")) if relative_root else destination
+        os.makedirs(target, exist_ok=True)
+        for file_entry in file_entries:
+            relative_path = f"{relative_root}/{file_entry.name}" if relative_root else file_entry.name
+            if not filters.includes_file(relative_path, file_entry.name) or _has_binary_name(file_entry.name):
                 continue
             try:
-                oversized = file_path.stat().st_size > max_file_bytes
+                status = file_entry.stat(follow_symlinks=False)
             except OSError:
                 continue
-            if oversized or is_binary(file_path):
+            if stat.S_ISREG(status.st_mode) and status.st_size <= max_file_bytes:
+                pending.append((file_entry.path, os.path.join(target, file_entry.name), status))
+
+    total = sum(status.st_size for _source, _destination, status in pending)
+    copier = _SnapshotCopier()
+    copied = 0
+    for (_source, _destination, status), _ in _iter_loaded(pending, lambda item: copier.copy(*item), workers):
+        copied += status.st_size
+        if progress is not None:
+            progress(copied, total)
+    return copied
+
+
+def _scanned_file(
+    relative_path: str,
+    filename: str,
+    file_path: str,
+    status: os.stat_result,
+    filters: FilterSpec,
+    max_file_bytes: int,
+    content_cache: ContentCache | None,
+    known: Mapping[str, ScannedFile],
+    sniff_binary: bool = True,
+) -> ScannedFile | None:
+    """Record one file from its ``lstat`` result; ``None`` for anything but a regular file."""
+    if not stat.S_ISREG(status.st_mode):
+        return None
+    entry = ScannedFile(
+        relative_path=relative_path,
+        size=status.st_size,
+        mtime_ns=status.st_mtime_ns,
+        included=filters.includes_file(relative_path, filename),
+        device=status.st_dev,
+        inode=status.st_ino,
+    )
+    earlier = known.get(relative_path)
+    if entry.included:
+        if entry.size > max_file_bytes:
+            logger.info("Skipping oversized file: %s", relative_path)
+        elif earlier is not None and earlier.included and earlier.same_version(entry):
+            entry.binary = earlier.binary
+        elif _has_binary_name(filename):
+            entry.binary = True
+        elif not sniff_binary:
+            entry.binary = None
+        elif content_cache is None:
+            entry.binary = _sniff_binary(file_path)
+        else:
+            entry.binary = _cached_binary(file_path, _entry_key(entry), content_cache)
+    return entry
+
+
+def scan_index(
+    path: str | Path,
+    filters: FilterSpec,
+    max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+    content_cache: ContentCache | None = None,
+    previous: FileManifest | None = None,
+    sniff_binary: bool = True,
+) -> FileManifest:
+    """Scan only the files tracked in the git index of the repository containing ``path``.
+
+    Paths come from ``.git/index`` instead of directory listings, so
+    untracked trees such as ``node_modules`` are never listed. Each tracked
+    file under ``path`` that passes the directory and ignore filters is
+    ``lstat``-ed once and recorded as by ``scan_tree``; files missing from
+    the working tree, symlinks, and submodules are skipped. Only directories
+    holding tracked files are listed. Raises ``ValueError`` outside a
+    repository.
+    """
+    root = Path(path).resolve()
+    manifest = FileManifest(root=str(root), max_file_bytes=max_file_bytes)
+    known = previous.by_path() if previous is not None and previous.root == manifest.root else {}
+    if filters.ignore_git and root.name == ".git":
+        return manifest
+    try:
+        repository = Repo.discover(str(root))
+    except NotGitRepository:
+        raise ValueError(f"Not inside a git repository: {path}") from None
+    with repository:
+        index = repository.open_index()
+        prefix = root.relative_to(Path(repository.path).resolve()).as_posix()
+    prefix = "" if prefix == "." else f"{prefix}/"
+    ignores = GitIgnore(str(root)) if filters.respect_gitignore else None
+    directories: dict[str, ScannedDirectory | None] = {"": ScannedDirectory("")}
+    rule_stacks: dict[str, RuleStack] = {}
+
+    def rules(relative_dir: str) -> RuleStack:
+        if relative_dir not in rule_stacks:
+            above = ignores.stack_above(relative_dir)
+            rule_stacks[relative_dir] = ignores.stack_within(above, relative_dir, (IGNORE_FILENAME,))
+        return rule_stacks[relative_dir]
+
+    def directory(relative_dir: str) -> ScannedDirectory | None:
+        """The listing for ``relative_dir``, or ``None`` if it or a parent is pruned."""
+        if relative_dir not in directories:
+            parent, _, name = relative_dir.rpartition("/")
+            pruned = directory(parent) is None or filters.excludes_directory(relative_dir, name)
+            if not pruned and ignores is not None:
+                pruned = is_ignored(rules(parent), relative_dir, name, True)
+            directories[relative_dir] = None if pruned else ScannedDirectory(relative_dir)
+        return directories[relative_dir]
+
+    for tracked in index.paths():
+        relative_path = tracked.decode("utf-8", "surrogateescape")
+        if not relative_path.startswith(prefix):
+            continue
+        relative_path = relative_path[len(prefix):]
+        relative_dir, _, filename = relative_path.rpartition("/")
+        listing = directory(relative_dir)
+        if listing is None:
+            continue
+        if ignores is not None and is_ignored(rules(relative_dir), relative_path, filename, False):
+            continue
+        file_path = os.path.join(root, *relative_path.split("/"))
+        try:
+            status = os.lstat(file_path)
+        except OSError:
+            continue
+        entry = _scanned_file(
+            relative_path,
+            filename,
+            file_path,
+            status,
+            filters,
+            max_file_bytes,
+            content_cache,
+            known,
+            sniff_binary,
+        )
+        if entry is not None:
+            listing.files.append(entry)
+
+    for listing in directories.values():
+        if listing is not None:
+            listing.files.sort(key=lambda entry: entry.relative_path)
+            manifest.directories.append(listing)
+    manifest.directories.sort(key=lambda listing: _directory_order(listing.relative_path))
+    return manifest
+
+
+def scan_git_tree(
+    object_store: BaseObjectStore,
+    tree_id: bytes,
+    filters: FilterSpec,
+    max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+    root: str = "",
+    mtime_ns: int = 0,
+    prefix: str = "",
+    exclude_lines: Sequence[str] = (),
+    retain_bytes: int = 0,
+) -> FileManifest:
+    """Walk a commit tree in ``object_store`` the way ``scan_tree`` walks a checkout of it.
+
+    Trees of pruned directories are never read, and only the blobs of
+    included files without a binary extension are inflated, to size and
+    sniff them. Up to ``retain_bytes`` of those blobs are kept until the
+    manifest's ``read_blob`` hands them to the serializer, which reads the
+    rest again. Symlinks and submodules are skipped like symlinks on disk,
+    and every file gets the commit time ``mtime_ns``.
+
+    ``prefix`` scans only that subdirectory of the tree. With
+    ``filters.respect_gitignore`` the ``.gitignore`` files above it and the
+    repository's ``exclude_lines`` apply as they do to a working tree.
+    """
+    lock = threading.Lock()
+    retained: dict[str, bytes] = {}
+
+    def read_blob(blob_id: str) -> bytes:
+        raw = retained.pop(blob_id, None)
+        if raw is not None:
+            return raw
+        # Pack files are read through shared handles, so reader threads take turns.
+        with lock:
+            return object_store[blob_id.encode("ascii")].as_raw_string()
+
+    manifest = FileManifest(root=root, max_file_bytes=max_file_bytes, read_blob=read_blob)
+    if filters.ignore_git and PurePosixPath(root).name == ".git":
+        return manifest
+
+    def ignore_rules(entries: list[tuple[str, int, bytes]], base: str, prefix: str = "") -> RuleStack:
+        for name, mode, sha in entries:
+            if name == IGNORE_FILENAME and stat.S_ISREG(mode):
+                lines = read_blob(sha.decode("ascii")).decode("utf-8", errors="replace").splitlines()
+                parsed = parse_rules(lines)
+                return (RuleSet.create(base, parsed, prefix),) if parsed else ()
+        return ()
+
+    base_rules: RuleStack = ()
+    if filters.respect_gitignore and exclude_lines:
+        parsed = parse_rules(exclude_lines)
+        base_rules = (RuleSet.create("", parsed, prefix),) if parsed else ()
+    depth = ""
+    for component in prefix.split("/") if prefix else ():
+        if filters.respect_gitignore:
+            base_rules += ignore_rules(_tree_entries(object_store, tree_id), depth, prefix)
+        try:
+            mode, tree_id = object_store[tree_id][component.encode("utf-8", "surrogateescape")]
+        except KeyError:
+            mode = 0
+        if not stat.S_ISDIR(mode):
+            raise ValueError(f"{prefix} is not a directory in this revision.")
+        depth = f"{depth}/{component}" if depth else component
+
+    pending: list[tuple[str, bytes, RuleStack]] = [("", tree_id, base_rules)]
+    while pending:
+        relative_root, current, rules = pending.pop()
+        entries = _tree_entries(object_store, current)
+        if filters.respect_gitignore:
+            rules += ignore_rules(entries, relative_root)
+        directory = ScannedDirectory(relative_root)
+        manifest.directories.append(directory)
+        subdirectories: list[tuple[str, bytes, RuleStack]] = []
+        for name, mode, sha in entries:
+            is_directory = stat.S_ISDIR(mode)
+            if not (is_directory or stat.S_ISREG(mode)):
+                continue
+            relative_path = f"{relative_root}/{name}" if relative_root else name
+            if rules and is_ignored(rules, relative_path, name, is_directory):
                 continue
-            structure.append(f"{subindent}{filename}")
+            if is_directory:
+                if not filters.excludes_directory(relative_path, name):
+                    subdirectories.append((relative_path, sha, rules))
+                continue
+            entry = ScannedFile(
+                relative_path=relative_path,
+                size=0,
+                mtime_ns=mtime_ns,
+                included=filters.includes_file(relative_path, name),
+                blob_id=sha.decode("ascii"),
+            )
+            if entry.included:
+                if _has_binary_name(name):
+                    entry.binary = True
+                else:
+                    raw = read_blob(entry.blob_id)
+                    entry.size = len(raw)
+                    if entry.size > max_file_bytes:
+                        logger.info("Skipping oversized file: %s", relative_path)
+                    else:
+                        entry.binary = _looks_binary(raw[:_SAMPLE_SIZE])
+                        if not entry.binary and entry.size <= retain_bytes:
+                            retained[entry.blob_id] = raw
+                            retain_bytes -= entry.size
+            directory.files.append(entry)
+        pending.extend(reversed(subdirectories))
+    return manifest
+
+
+def _tree_entries(object_store: BaseObjectStore, tree_id: bytes) -> list[tuple[str, int, bytes]]:
+    """``(name, mode, id)`` of a tree's entries, sorted by name like ``_scandir_sorted``."""
+    return sorted(
+        (name.decode("utf-8", "surrogateescape"), mode, sha)
+        for name, mode, sha in object_store[tree_id].iteritems()
+    )
+
+
+def rescan_tree(
+    previous: FileManifest,
+    filters: FilterSpec,
+    changed_directories: Iterable[str],
+    content_cache: ContentCache | None = None,
+    sniff_binary: bool = True,
+) -> FileManifest:
+    """Rescan only ``changed_directories`` of a previous scan, e.g. after watcher events.
+
+    Other listings are reused as they are. Subdirectories that appeared are
+    walked in full, and vanished ones are dropped with everything below them.
+    The result is ordered exactly like a fresh ``scan_tree``.
+    """
+    root = previous.root
+    directories = {directory.relative_path: directory for directory in previous.directories}
+    known = previous.by_path()
+    ignores = GitIgnore(root) if filters.respect_gitignore else None
+
+    def drop_subtree(relative_path: str) -> None:
+        prefix = f"{relative_path}/"
+        for path in [path for path in directories if path == relative_path or path.startswith(prefix)]:
+            del directories[path]
+
+    def walk_subtree(relative_path: str) -> None:
+        for relative_root, file_entries in _walk_tree(root, filters, relative_path, ignores):
+            directory = ScannedDirectory(relative_root)
+            directories[relative_root] = directory
+            _scan_files(
+                directory,
+                file_entries,
+                filters,
+                previous.max_file_bytes,
+                content_cache,
+                known,
+                sniff_binary,
+            )
+
+    for relative_root in sorted(set(changed_directories), key=_directory_order):
+        if relative_root not in directories:
+            continue
+        current = os.path.join(root, *relative_root.split("/")) if relative_root else root
+        entries = _scandir_sorted(current) if os.path.isdir(current) else None
+        if entries is None:
+            drop_subtree(relative_root)
+            continue
+        rules = (
+            ignores.stack_within(
+                ignores.stack_above(relative_root), relative_root, (entry.name for entry in entries)
+            )
+            if ignores is not None
+            else ()
+        )
+        file_entries, subdirectories = _split_entries(relative_root, entries, filters, rules)
+        directory = ScannedDirectory(relative_root)
+        _scan_files(
+            directory, file_entries, filters, previous.max_file_bytes, content_cache, known, sniff_binary
+        )
+        directories[relative_root] = directory
+
+        present = {relative_path for relative_path, _absolute in subdirectories}
+        prefix = f"{relative_root}/" if relative_root else ""
+        for path in list(directories):
+            child = path[len(prefix):] if path.startswith(prefix) and path != relative_root else None
+            if child is not None and "/" not in child and path not in present:
+                drop_subtree(path)
+        for relative_path in present:
+            if relative_path not in directories:
+                walk_subtree(relative_path)
+
+    manifest = FileManifest(root=root, max_file_bytes=previous.max_file_bytes)
+    manifest.directories = sorted(
+        directories.values(), key=lambda directory: _directory_order(directory.relative_path)
+    )
+    return manifest
+
+
+def reusable_contents(
+    previous: FileManifest,
+    current: FileManifest,
+    contents: Mapping[str, str],
+) -> dict[str, str]:
+    """Return the loaded contents of files that are unchanged between two scans."""
+    if previous.root != current.root:
+        return {}
+    known = previous.by_path()
+    reusable: dict[str, str] = {}
+    for entry in current.eligible_files():
+        earlier = known.get(entry.relative_path)
+        content = contents.get(entry.relative_path)
+        if content is not None and earlier is not None and earlier.same_version(entry):
+            reusable[entry.relative_path] = content
+    return reusable
+
+
+def render_structure(manifest: FileManifest, only_dirs: bool = False) -> str:
+    """Render a scanned manifest as the deterministic folder tree shown to users."""
+    root_name = Path(manifest.root).name
+    structure: list[str] = []
+    for directory in manifest.directories:
+        level = directory.depth
+        name = PurePosixPath(directory.relative_path).name if level else root_name
+        structure.append(f"{'│   ' * max(level - 1, 0)}├── {name}/")
+        if only_dirs:
+            continue
+        subindent = "│   " * level + "├── "
+        structure.extend(
+            f"{subindent}{PurePosixPath(entry.relative_path).name}"
+            for entry in directory.files
+            if manifest.is_eligible(entry)
+        )
     return "\n".join(structure)
 
 
+def _load_entry(
+    manifest: FileManifest,
+    entry: ScannedFile,
+    notebooks: _NotebookConverter,
+    content_cache: ContentCache | None = None,
+    encoding: tiktoken.Encoding | None = None,
+    python: PythonTransformer | None = None,
+) -> _LoadedText:
+    mode = python.mode(entry.relative_path) if python is not None else None
+    if mode is not None:
+        # Tokens are counted on the transformed text, so not while loading.
+        loaded = _load_entry(manifest, entry, notebooks, content_cache)
+        if loaded.text is None:
+            return loaded
+        text = python.apply(mode, loaded.text)
+        tokens = count_tokens(text, encoding) if encoding is not None else None
+        return _LoadedText(loaded.binary, text, utf8_size(text), tokens, None, loaded.size, mode)
+    if entry.blob_id is not None:
+        return _load_blob(manifest, entry, notebooks, encoding)
+    file_path = manifest.absolute_path(entry)
+    if entry.relative_path.casefold().endswith(".ipynb"):
+        markdown = notebooks.result(file_path)
+        if markdown is None:
+            return _LoadedText(None)
+        # The notebook parsed as JSON, so it is text; ``resolve_binary_flags`` need not reopen it.
+        if entry.binary is None:
+            entry.binary = False
+        tokens = count_tokens(markdown, encoding) if encoding is not None else None
+        return _LoadedText(False, markdown, utf8_size(markdown), tokens)
+    key = _entry_key(entry) if content_cache is not None else None
+    loaded = _load_text(
+        file_path,
+        manifest.max_file_bytes,
+        key,
+        content_cache,
+        sniff=entry.binary is None,
+        encoding=encoding,
+    )
+    if entry.binary is None and loaded.binary is not None:
+        entry.binary = loaded.binary
+    return loaded
+
+
+def _load_blob(
+    manifest: FileManifest,
+    entry: ScannedFile,
+    notebooks: _NotebookConverter,
+    encoding: tiktoken.Encoding | None = None,
+) -> _LoadedText:
+    """Decode a file of a git manifest from its blob, which the scan already sized and sniffed."""
+    raw = manifest.read_blob(entry.blob_id)
+    if entry.relative_path.casefold().endswith(".ipynb"):
+        text = notebooks.from_bytes(raw, entry.relative_path)
+        size = utf8_size(text) if text is not None else 0
+    else:
+        text = _decode_text(raw, entry.relative_path)
+        size = _decoded_size(raw, text) if text is not None else 0
+    if text is None:
+        return _LoadedText(entry.binary)
+    tokens = count_tokens(text, encoding) if encoding is not None else None
+    return _LoadedText(entry.binary, text, size, tokens)
+
+
+def resolve_binary_flags(
+    manifest: FileManifest,
+    content_cache: ContentCache | None = None,
+    workers: int = 1,
+) -> None:
+    """Sniff the files a ``sniff_binary=False`` scan left undecided and nothing read.
+
+    Those are typically files past the output budget and notebooks; their
+    verdicts are needed before the folder structure can be rendered.
+    """
+    pending = [entry for entry in manifest.eligible_files() if entry.binary is None]
+
+    def sniff(entry: ScannedFile) -> bool:
+        file_path = manifest.absolute_path(entry)
+        if content_cache is None:
+            return _sniff_binary(file_path)
+        return _cached_binary(file_path, _entry_key(entry), content_cache)
+
+    for entry, binary in _iter_loaded(pending, sniff, workers):
+        entry.binary = binary
+
+
+def _iter_loaded(
+    entries: Iterable[_T],
+    load: Callable[[_T], _R],
+    workers: int,
+) -> Iterator[tuple[_T, _R]]:
+    """Yield ``(entry, load(entry))`` in input order, prefetching on a thread pool.
+
+    At most ``2 * workers`` loads are in flight, so memory stays bounded; when
+    the consumer stops early, queued loads are cancelled.
+    """
+    if workers <= 1:
+        for entry in entries:
+            yield entry, load(entry)
+        return
+
+    iterator = iter(entries)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chareco-read")
+    pending: deque[tuple[_T, Future[_R]]] = deque(
+        (entry, executor.submit(load, entry)) for entry in islice(iterator, workers * 2)
+    )
+    try:
+        while pending:
+            entry, future = pending.popleft()
+            for upcoming in islice(iterator, 1):
+                pending.append((upcoming, executor.submit(load, upcoming)))
+            yield entry, future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def serialize_manifest(
+    manifest: FileManifest,
+    read_files: bool = True,
+    max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+    read_workers: int = 1,
+    notebook_workers: int = 1,
+    notebook_cache: ConversionCache | None = None,
+    content_cache: ContentCache | None = None,
+    known_contents: Mapping[str, str] | None = None,
+) -> tuple[str, dict[str, int], Mapping[str, str]]:
+    """Serialize the eligible files of a manifest with a bounded output size.
+
+    With ``read_workers > 1`` files are read and decoded ahead of the
+    serializer on a thread pool, and with ``notebook_workers > 1`` uncached
+    notebooks past ``PARALLEL_NOTEBOOK_BYTES`` are converted on a process pool;
+    output and the budget cutoff are unchanged.
+    Unchanged files are served from ``content_cache`` when one is given.
+    Paths in ``known_contents`` are not read again; without ``read_files``
+    they are returned as the only loaded contents. Otherwise the contents
+    are a ``FileContents`` view into the returned text.
+    """
+    known_contents = known_contents or {}
+    if not read_files:
+        return (
+            "",
+            {entry.relative_path: 0 for entry in manifest.eligible_files()},
+            dict(known_contents),
+        )
+
+    content: list[str] = []
+    written = write_manifest(
+        manifest,
+        content.append,
+        max_total_bytes=max_total_bytes,
+        read_workers=read_workers,
+        notebook_workers=notebook_workers,
+        notebook_cache=notebook_cache,
+        content_cache=content_cache,
+        known_contents=known_contents,
+    )
+    text = "".join(content)
+    return text, written.positions, FileContents(text, written.spans)
+
+
+@dataclass(slots=True)
+class WrittenFiles:
+    """What ``write_manifest`` wrote, with the totals its budgets were checked against.
+
+    ``positions`` are offsets of file headers and ``spans`` the offsets of file
+    contents in the written text. ``total_tokens`` and ``token_counts`` are
+    only filled in when tokens were counted; ``token_counts`` holds each
+    file's content tokens. ``duplicates`` maps files written as a reference
+    to the earlier identical file, and the ``saved_`` totals are what the
+    references saved. ``transformed`` maps each Python transform to the
+    number of written files it changed and their sizes before and after.
+    """
+
+    positions: dict[str, int]
+    spans: dict[str, tuple[int, int]]
+    token_counts: dict[str, int]
+    total_bytes: int = 0
+    total_tokens: int | None = None
+    duplicates: dict[str, str] = field(default_factory=dict)
+    saved_bytes: int = 0
+    saved_tokens: int = 0
+    transformed: dict[str, tuple[int, int, int]] = field(default_factory=dict)
+
+
+_BUDGET_MARKER = "\n[Output limit reached; remaining files were skipped.]\n"
+_PACKING_MARKER = "\n[Output limit reached; lower-ranked files were skipped.]\n"
+
+
+def _content_digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+
+def write_manifest(
+    manifest: FileManifest,
+    write: Callable[[str], object],
+    max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+    read_workers: int = 1,
+    notebook_workers: int = 1,
+    notebook_cache: ConversionCache | None = None,
+    content_cache: ContentCache | None = None,
+    known_contents: Mapping[str, str] | None = None,
+    max_total_tokens: int | None = None,
+    encoding: tiktoken.Encoding | None = None,
+    known_tokens: Mapping[str, int] | None = None,
+    selection: AbstractSet[str] | None = None,
+    write_block: Callable[[str, str, int | None], object] | None = None,
+    deduplicate: bool = False,
+    python: PythonTransformer | None = None,
+) -> WrittenFiles:
+    """Pass each directory header and file block to ``write`` as soon as it is loaded.
+
+    No more than the read-ahead window of files is held in memory at once;
+    callers that keep the text find each file in it through
+    ``WrittenFiles.spans``. With an ``encoding`` each file's tokens are
+    counted by the reader threads, and ``max_total_tokens`` bounds the tokens
+    of everything written, headers and the cutoff notice included, as the sum
+    of per-block counts. Counts in ``known_tokens`` are trusted instead of
+    counting again.
+
+    With a ``selection``, for example from relevance packing, only those
+    files are written, still in manifest order, and a file that does not fit
+    after all is skipped instead of ending the output.
+
+    A ``write_block`` callback receives each file block whole instead, as
+    its headers, its content, and its token count when tokens are counted,
+    so that a caller such as ``PartSplitter`` can keep blocks together.
+
+    With ``deduplicate`` the reader threads hash each file's content, and a
+    file identical to one already written becomes a one-line reference to
+    it wherever that is shorter. Its span then points at the first copy.
+
+    A ``python`` transformer strips or outlines ``.py`` files before they
+    are measured against the budgets; files in ``known_contents`` are
+    written as they are.
+    """
+    if max_total_tokens is not None and encoding is None:
+        raise ValueError("A token budget needs a token encoding.")
+    known_contents = known_contents or {}
+    known_tokens = known_tokens or {}
+    written = WrittenFiles({}, {}, {}, total_tokens=0 if encoding is not None else None)
+    marker = _BUDGET_MARKER if selection is None else _PACKING_MARKER
+    marker_tokens = count_tokens(marker, encoding) if encoding is not None else 0
+    current_position = 0
+    current_directory: str | None = None
+
+    first_copies: dict[bytes, str] = {}
+
+    def load(entry: ScannedFile) -> _LoadedText:
+        tokens = known_tokens.get(entry.relative_path)
+        known = known_contents.get(entry.relative_path)
+        if known is None:
+            loaded = _load_entry(
+                manifest, entry, notebooks, content_cache, encoding if tokens is None else None, python
+            )
+            if loaded.text is None:
+                return loaded
+            if tokens is not None:
+                loaded = replace(loaded, tokens=tokens)
+        else:
+            if tokens is None and encoding is not None:
+                tokens = count_tokens(known, encoding)
+            loaded = _LoadedText(False, known, utf8_size(known), tokens)
+        if deduplicate:
+            loaded = replace(loaded, digest=_content_digest(loaded.text))
+        return loaded
+
+    entries = list(manifest.eligible_files())
+    skip = set(known_contents)
+    left_out = 0
+    if selection is not None:
+        chosen = [entry for entry in entries if entry.relative_path in selection]
+        skip.update(entry.relative_path for entry in entries if entry.relative_path not in selection)
+        left_out = len(entries) - len(chosen)
+        entries = chosen
+    notebooks = _NotebookConverter(manifest, notebook_workers, notebook_cache, skip=skip)
+    loaded = _iter_loaded(entries, load, read_workers)
+    try:
+        for entry, file in loaded:
+            file_content = file.text
+            if file_content is None:
+                continue
+            relative_path = entry.relative_path
+
+            directory = PurePosixPath(relative_path).parent.as_posix()
+            if directory == ".":
+                directory = ""
+            header = ""
+            if directory != current_directory:
+                header = f"\n---{directory + '/' if directory else '/'}---\n"
+            file_header = f"\n--{relative_path}--\n"
+            size, content_tokens = file.size, file.tokens
+            first_copy = first_copies.get(file.digest) if file.digest is not None else None
+            if first_copy is not None:
+                reference = f"[Identical to {first_copy}]\n"
+                if utf8_size(reference) < size:
+                    file_content, size = reference, utf8_size(reference)
+                    if encoding is not None:
+                        content_tokens = count_tokens(reference, encoding)
+                else:
+                    first_copy = None
+            block_tokens = 0
+            if encoding is not None:
+                block_tokens = content_tokens + count_tokens(header + file_header, encoding)
+
+            # Room for the cutoff notice is kept unless no other file could follow.
+            reserve = marker_tokens if left_out or entry is not entries[-1] else 0
+            over_tokens = (
+                max_total_tokens is not None
+                and written.total_tokens + block_tokens + reserve > max_total_tokens
+            )
+            if written.total_bytes + size > max_total_bytes or over_tokens:
+                if selection is not None:
+                    left_out += 1
+                    continue
+                logger.info("Reached output budget; remaining files were skipped.")
+                write(marker)
+                if encoding is not None:
+                    written.total_tokens += marker_tokens
+                break
+
+            if write_block is not None:
+                write_block(header + file_header, file_content, block_tokens if encoding is not None else None)
+            else:
+                if header:
+                    write(header)
+                write(file_header)
+                write(file_content)
+            if header:
+                current_position += len(header)
+                current_directory = directory
+            written.positions[relative_path] = current_position
+            current_position += len(file_header)
+            if first_copy is None:
+                written.spans[relative_path] = (current_position, current_position + len(file_content))
+                if file.digest is not None:
+                    first_copies.setdefault(file.digest, relative_path)
+            else:
+                written.spans[relative_path] = written.spans[first_copy]
+                written.duplicates[relative_path] = first_copy
+                written.saved_bytes += file.size - size
+                if encoding is not None:
+                    written.saved_tokens += file.tokens - content_tokens
+            current_position += len(file_content)
+            written.total_bytes += size
+            if file.transform is not None:
+                files, before, after = written.transformed.get(file.transform, (0, 0, 0))
+                written.transformed[file.transform] = (files + 1, before + file.original_size, after + file.size)
+            if encoding is not None:
+                written.token_counts[relative_path] = file.tokens
+                written.total_tokens += block_tokens
+        if left_out:
+            logger.info("Packed the output budget; %s lower-ranked files were skipped.", left_out)
+            write(marker)
+            if encoding is not None:
+                written.total_tokens += marker_tokens
+    finally:
+        loaded.close()
+        notebooks.close()
+
+    return written
+
+
+@dataclass(frozen=True, slots=True)
+class FileMeasure:
+    """Exact output size, tokens, and keyword hits of one loaded file."""
+
+    size: int
+    tokens: int | None
+    keyword_hits: int = 0
+
+
+def measure_files(
+    manifest: FileManifest,
+    encoding: tiktoken.Encoding | None = None,
+    keywords: Sequence[str] = (),
+    read_workers: int = 1,
+    notebook_workers: int = 1,
+    notebook_cache: ConversionCache | None = None,
+    content_cache: ContentCache | None = None,
+    python: PythonTransformer | None = None,
+) -> dict[str, FileMeasure]:
+    """Load every eligible file once and keep only its measurements.
+
+    Keyword hits are case-insensitive substring counts. Files that cannot be
+    loaded are left out of the result. Python files are measured as the
+    ``python`` transformer leaves them.
+    """
+    folded = tuple(keyword.casefold() for keyword in keywords if keyword)
+
+    def measure(entry: ScannedFile) -> FileMeasure | None:
+        loaded = _load_entry(manifest, entry, notebooks, content_cache, encoding, python)
+        if loaded.text is None:
+            return None
+        text = loaded.text.casefold() if folded else ""
+        return FileMeasure(loaded.size, loaded.tokens, sum(text.count(keyword) for keyword in folded))
+
+    notebooks = _NotebookConverter(manifest, notebook_workers, notebook_cache)
+    measured = _iter_loaded(list(manifest.eligible_files()), measure, read_workers)
+    try:
+        return {entry.relative_path: value for entry, value in measured if value is not None}
+    finally:
+        measured.close()
+        notebooks.close()
+
+
+def get_structure(
+    path: str | Path,
+    only_dirs: bool = False,
+    exclude: Sequence[str] | None = None,
+    include: Sequence[str] | None = None,
+    ignore_git: bool = True,
+    exclude_license: bool = True,
+    exclude_readme: bool = False,
+    exclude_folders: Sequence[str] | None = None,
+    max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+) -> str:
+    """Return a deterministic, filtered directory tree without following symlinks."""
+    filters = FilterSpec.compile(
+        include=include,
+        exclude=exclude,
+        ignore_git=ignore_git,
+        exclude_license=exclude_license,
+        exclude_readme=exclude_readme,
+        exclude_patterns=exclude_folders,
+    )
+    manifest = scan_tree(
+        path,
+        filters,
+        max_file_bytes=max_file_bytes,
+        list_files=not only_dirs,
+    )
+    return render_structure(manifest, only_dirs=only_dirs)
+
+
 def concatenate_files(
     path: str | Path,
     exclude: Sequence[str] | None = None,
@@ -316,91 +1430,53 @@ def concatenate_files(
     read_files: bool = True,
     max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
     max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
-) -> tuple[str, dict[str, int], dict[str, str]]:
+    read_workers: int = 1,
+    notebook_workers: int = 1,
+    notebook_cache: ConversionCache | None = None,
+    content_cache: ContentCache | None = None,
+) -> tuple[str, dict[str, int], Mapping[str, str]]:
     """Serialize eligible files, with bounded output and deterministic ordering."""
-    exclude = _normalise_rules(exclude)
-    include = _normalise_rules(include)
-    patterns = _normalise_rules(exclude_folders)
-    content: list[str] = []
-    file_positions: dict[str, int] = {}
-    file_contents: dict[str, str] = {}
-    current_position = 0
-    total_bytes = 0
-    current_directory: str | None = None
-
-    for file_path, relative_path in _iter_files(
-        path, ignore_git=ignore_git, exclude_patterns=patterns
-    ):
-        if not _passes_file_filters(
-            relative_path,
-            include=include,
-            exclude=exclude,
-            ignore_git=ignore_git,
-            exclude_license=exclude_license,
-            exclude_readme=exclude_readme,
-            exclude_patterns=patterns,
-        ):
-            continue
-
-        try:
-            oversized = file_path.stat().st_size > max_file_bytes
-        except OSError:
-            continue
-        if oversized:
-            logger.info("Skipping oversized file: %s", relative_path)
-            continue
+    filters = FilterSpec.compile(
+        include=include,
+        exclude=exclude,
+        ignore_git=ignore_git,
+        exclude_license=exclude_license,
+        exclude_readme=exclude_readme,
+        exclude_patterns=exclude_folders,
+    )
+    manifest = scan_tree(
+        path,
+        filters,
+        max_file_bytes=max_file_bytes,
+        content_cache=content_cache,
+        sniff_binary=not read_files,
+    )
+    return serialize_manifest(
+        manifest,
+        read_files=read_files,
+        max_total_bytes=max_total_bytes,
+        read_workers=read_workers,
+        notebook_workers=notebook_workers,
+        notebook_cache=notebook_cache,
+        content_cache=content_cache,
+    )
 
-        if not read_files:
-            if not is_binary(file_path):
-                file_positions[relative_path] = 0
-            continue
 
-        if file_path.suffix.casefold() == ".ipynb":
-            file_content = convert_notebook_to_markdown(file_path)
-        else:
-            file_content = read_text_file(file_path, max_file_bytes)
-        if file_content is None:
-            continue
+def concatenate_folder_files(folder_path: str, file_contents: Mapping[str, str]) -> str:
+    """Concatenate a folder and all descendants, preserving relative paths.
 
-        encoded_size = len(file_content.encode("utf-8"))
-        if total_bytes + encoded_size > max_total_bytes:
-            logger.info("Reached output budget; remaining files were skipped.")
-            content.append("\n[Output limit reached; remaining files were skipped.]\n")
-            break
-
-        directory = PurePosixPath(relative_path).parent.as_posix()
-        if directory == ".":
-            directory = ""
-        if directory != current_directory:
-            header = f"\n---{directory + '/' if directory else '/'}---\n"
-            content.append(header)
-            current_position += len(header)
-            current_directory = directory
-
-        filename = PurePosixPath(relative_path).name
-        file_header = f"\n--{relative_path}--\n"
-        content.append(file_header)
-        file_positions[relative_path] = current_position
-        current_position += len(file_header)
-        content.append(file_content)
-        file_contents[relative_path] = file_content
-        current_position += len(file_content)
-        total_bytes += encoded_size
-
-    return "".join(content), file_positions, file_contents
-
-
-def concatenate_folder_files(folder_path: str, file_contents: dict[str, str]) -> str:
-    """Concatenate a folder and all descendants, preserving relative paths."""
+    Paths are matched first, so a lazy ``file_contents`` view only loads the
+    selected files.
+    """
     folder = _normalise_path(folder_path)
     selected = [
-        (path, content)
-        for path, content in sorted(file_contents.items())
+        path
+        for path in sorted(file_contents)
         if not folder or path == folder or path.startswith(f"{folder}/")
     ]
     if not selected:
         return "No text files in this folder."
-    return "\n\n".join(f"--{path}--\n{content}" for path, content in selected)
+    return "\n\n".join(f"--{path}--\n{file_contents[path]}" for path in selected)
 
 
 def safe_remove(path: str | Path) -> None:
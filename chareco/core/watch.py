@@ -0,0 +1,132 @@
+"""Qt filesystem watcher that turns bursts of changes into refresh requests."""
+
+from __future__ import annotations
+
+import logging
+import os
+
+from PyQt6.QtCore import QElapsedTimer, QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+from chareco.core.models import FileManifest
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WATCHES = 4_096
+
+
+class FolderWatcher(QObject):
+    """Watch a scanned tree and report changed directories once events settle.
+
+    Directories are watched first, shallowest first, so additions, deletions,
+    and renames are seen everywhere the budget reaches; eligible files are
+    then watched for in-place edits with whatever budget is left. Changes
+    outside the budget are only picked up by a manual refresh.
+
+    ``changed`` carries a ``frozenset`` of relative directory paths and fires
+    ``delay_ms`` after the last event, or ``max_delay_ms`` after the first one
+    while events keep arriving.
+    """
+
+    changed = pyqtSignal(object)
+
+    def __init__(
+        self,
+        parent: QObject | None = None,
+        *,
+        max_watches: int = DEFAULT_MAX_WATCHES,
+        delay_ms: int = 250,
+        max_delay_ms: int = 1_000,
+    ) -> None:
+        super().__init__(parent)
+        self.max_watches = max_watches
+        self.delay_ms = delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.truncated = False
+        self._root: str | None = None
+        self._pending: set[str] = set()
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._directory_changed)
+        self._watcher.fileChanged.connect(self._file_changed)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._flush)
+        self._first_event = QElapsedTimer()
+
+    def watch(self, manifest: FileManifest) -> None:
+        """Watch ``manifest``'s tree, adding and removing paths since the last call."""
+        if manifest.root != self._root:
+            self.stop()
+            self._root = manifest.root
+
+        wanted = [
+            os.path.join(manifest.root, *directory.relative_path.split("/"))
+            if directory.relative_path
+            else manifest.root
+            for directory in sorted(manifest.directories, key=lambda directory: directory.depth)
+        ]
+        wanted.extend(manifest.absolute_path(entry) for entry in manifest.eligible_files())
+        self.truncated = len(wanted) > self.max_watches
+        if self.truncated:
+            logger.info(
+                "Watching %s of %s paths under %s; raise the budget or refresh manually",
+                self.max_watches,
+                len(wanted),
+                manifest.root,
+            )
+            wanted = wanted[:self.max_watches]
+
+        current = set(self._watcher.directories()) | set(self._watcher.files())
+        wanted_set = set(wanted)
+        stale = [path for path in current if path not in wanted_set]
+        if stale:
+            self._watcher.removePaths(stale)
+        added = [path for path in wanted if path not in current]
+        if added:
+            failed = self._watcher.addPaths(added)
+            if failed:
+                logger.warning("Could not watch %s paths under %s", len(failed), manifest.root)
+
+    def stop(self) -> None:
+        watched = self._watcher.directories() + self._watcher.files()
+        if watched:
+            self._watcher.removePaths(watched)
+        self._timer.stop()
+        self._pending.clear()
+        self._root = None
+        self.truncated = False
+
+    def _relative(self, path: str) -> str | None:
+        if self._root is None:
+            return None
+        relative = os.path.relpath(path, self._root)
+        if relative == ".":
+            return ""
+        if relative == ".." or relative.startswith(f"..{os.sep}"):
+            return None
+        return relative.replace(os.sep, "/")
+
+    def _directory_changed(self, path: str) -> None:
+        self._record(self._relative(path))
+
+    def _file_changed(self, path: str) -> None:
+        self._record(self._relative(os.path.dirname(path)))
+
+    def _record(self, relative_directory: str | None) -> None:
+        if relative_directory is None:
+            return
+        self._pending.add(relative_directory)
+        if not self._timer.isActive():
+            self._first_event.start()
+        remaining = self.max_delay_ms - self._first_event.elapsed()
+        if remaining <= 0:
+            self._timer.stop()
+            self._flush()
+        else:
+            self._timer.start(min(self.delay_ms, remaining))
+
+    def _flush(self) -> None:
+        if self._pending:
+            changed = frozenset(self._pending)
+            self._pending.clear()
+            self.changed.emit(changed)
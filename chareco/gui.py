@@ -1,12 +1,11 @@
 import os
 import logging
 import re
-from collections import deque
+from collections import ChainMap, deque
 from threading import Event
 from pathlib import PurePosixPath
 from urllib.parse import urlsplit, urlunsplit
 
-import tiktoken
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QPushButton, QLabel, QLineEdit,
     QCheckBox, QVBoxLayout, QHBoxLayout, QFileDialog, QTreeWidget,
@@ -23,11 +22,19 @@ from PyQt6.QtGui import (
 
 from chareco import __version__
 from chareco.core.analysis import AnalysisThread
+from chareco.core.cache import clear_cache, user_cache_dir
+from chareco.core.chunking import MIN_PART_TOKENS, render_part
 from chareco.core.models import AnalysisOptions, AnalysisResult
+from chareco.core.provider import DEFAULT_MEMORY_BYTES, ContentProvider
 from chareco.core.search import SearchWorker
-from chareco.core.utils import convert_notebook_to_markdown, read_text_file
+from chareco.core.tokens import count_tokens, get_encoding
+from chareco.core.watch import FolderWatcher
 
 class App(QMainWindow):
+    # Structure-only views load file contents on demand within this budget.
+    content_memory_limit = DEFAULT_MEMORY_BYTES
+    prefetch_radius = 8
+
     def __init__(self):
         super().__init__()
 
@@ -76,6 +83,7 @@ class App(QMainWindow):
         self.file_positions = {}
         self.file_contents = {}
         self.file_token_counts = {}
+        self.content_provider = None
         self.current_result = None
         self.current_options = None
         self.pending_options = None
@@ -97,6 +105,12 @@ class App(QMainWindow):
         self.search_total_files = 0
         self.thread_pool = QThreadPool(self)
         self.paths_to_restore = None
+        self.pending_refresh = False
+        self.pending_quiet = False
+        self.pending_watch_changes = set()
+        self.displayed_view = None
+        self.folder_watcher = FolderWatcher(self)
+        self.folder_watcher.changed.connect(self._on_folder_changed)
         self.path_to_item_map = {}
         self.repo_history = []
         self.local_history = []
@@ -107,14 +121,15 @@ class App(QMainWindow):
         splitter_state = self.settings.value("splitter_state")
         if splitter_state is not None:
             self.splitter.restoreState(splitter_state)
+        self.use_cache_checkbox.setChecked(self.settings.value("use_cache", True, type=bool))
 
         # A local, bounded pool avoids starving the GUI or unrelated Qt users.
         self.max_threads = min(8, max(1, QThread.idealThreadCount()))
         self.thread_pool.setMaxThreadCount(self.max_threads)
 
         try:
-            self._token_encoding = tiktoken.get_encoding("cl100k_base")
-        except Exception:
+            self._token_encoding = get_encoding()
+        except RuntimeError:
             self._token_encoding = None
         self._counts_timer = QTimer(self)
         self._counts_timer.setSingleShot(True)
@@ -461,6 +476,15 @@ class App(QMainWindow):
         self.copy_local_folder_checkbox = QCheckBox("Copy local folder to temporary location (safer)")
         self.local_input_layout.addWidget(self.copy_local_folder_checkbox)
 
+        self.tracked_only_checkbox = QCheckBox("Only files tracked by git")
+        self.tracked_only_checkbox.setToolTip("Reads paths from the git index; not available with a temporary copy")
+        self.local_input_layout.addWidget(self.tracked_only_checkbox)
+
+        self.watch_folder_checkbox = QCheckBox("Watch folder and refresh on changes")
+        self.watch_folder_checkbox.setToolTip("Not available with a temporary copy")
+        self.watch_folder_checkbox.toggled.connect(self._update_folder_watch)
+        self.local_input_layout.addWidget(self.watch_folder_checkbox)
+
         # Add repository input to source container (default view)
         self.source_layout.addWidget(self.repo_input_widget)
         self.local_input_widget.hide()  # Initially hide the local input widget
@@ -485,6 +509,22 @@ class App(QMainWindow):
 
         self.line_numbers_checkbox = QCheckBox("Add line numbers to copied files")
         self.left_layout.addWidget(self.line_numbers_checkbox)
+
+        self.deduplicate_checkbox = QCheckBox("Write identical files once, then refer to them")
+        self.left_layout.addWidget(self.deduplicate_checkbox)
+
+        self.strip_python_checkbox = QCheckBox("Strip Python comments, docstrings, and extra blank lines")
+        self.left_layout.addWidget(self.strip_python_checkbox)
+
+        self.use_cache_checkbox = QCheckBox("Keep fetched repositories and file contents in a disk cache")
+        self.use_cache_checkbox.setToolTip("When off, nothing is read from or written to the cache")
+        self.use_cache_checkbox.setChecked(True)
+        self.left_layout.addWidget(self.use_cache_checkbox)
+
+        self.clear_cache_button = QPushButton("Clear Cache")
+        self.clear_cache_button.setToolTip("Delete cached repositories, file contents, and conversions")
+        self.clear_cache_button.clicked.connect(self.clear_disk_cache)
+        self.left_layout.addWidget(self.clear_cache_button)
         self.left_layout.addSpacing(5)
 
         # Separator
@@ -503,6 +543,9 @@ class App(QMainWindow):
         self.ignore_git_checkbox.setChecked(True)
         self.left_layout.addWidget(self.ignore_git_checkbox)
 
+        self.respect_gitignore_checkbox = QCheckBox("Skip files ignored by .gitignore")
+        self.left_layout.addWidget(self.respect_gitignore_checkbox)
+
         self.ignore_readme_checkbox = QCheckBox("Ignore README files")
         self.left_layout.addWidget(self.ignore_readme_checkbox)
 
@@ -572,6 +615,16 @@ class App(QMainWindow):
         self.left_layout.addWidget(QLabel("Maximum output size (MiB):"))
         self.left_layout.addWidget(self.max_output_size_entry)
 
+        self.max_part_tokens_entry = QLineEdit()
+        self.max_part_tokens_entry.setPlaceholderText("Leave empty to keep one part")
+        self.left_layout.addWidget(QLabel("Maximum tokens per part:"))
+        self.left_layout.addWidget(self.max_part_tokens_entry)
+
+        self.python_skeleton_entry = QLineEdit()
+        self.python_skeleton_entry.setPlaceholderText("e.g. */migrations/*, generated_*.py")
+        self.left_layout.addWidget(QLabel("Outline Python files (signatures only, glob patterns):"))
+        self.left_layout.addWidget(self.python_skeleton_entry)
+
         self.left_layout.addSpacing(10)
 
         # Action buttons layout
@@ -791,6 +844,15 @@ class App(QMainWindow):
         self.copy_all_button.clicked.connect(self.copy_text)
         self.text_toolbar_layout.addWidget(self.copy_all_button)
 
+        self.copy_part_button = QToolButton()
+        self.copy_part_button.setText("Part…")
+        self.copy_part_button.setToolTip("Copy one token-bounded part of the analysis to clipboard")
+        self.copy_part_button.setIcon(QIcon.fromTheme("edit-copy"))
+        self.copy_part_button.setToolButtonStyle(Qt.ToolButtonStyle.ToolButtonTextBesideIcon)
+        self.copy_part_button.clicked.connect(self.show_copy_part_menu)
+        self.copy_part_button.setEnabled(False)
+        self.text_toolbar_layout.addWidget(self.copy_part_button)
+
         self.save_full_button = QToolButton()
         self.save_full_button.setText("Save Full")
         self.save_full_button.setToolTip("Save the complete analysis to a UTF-8 text file")
@@ -875,6 +937,7 @@ class App(QMainWindow):
         if self.current_result is None:
             return
         self.text_display.setPlainText(self.current_result.full_text)
+        self.displayed_view = ("all", None)
         self.update_counts()
 
     def setup_search_bar(self):
@@ -975,7 +1038,8 @@ class App(QMainWindow):
             self.update_navigation_buttons()
             return
 
-        search_files = sorted(self.file_contents.items())
+        search_contents = self._contents_snapshot()
+        search_files = sorted(search_contents)
         if not search_files:
             self.search_results = []
             self.search_result_label.setText("No loaded file content to search")
@@ -1005,8 +1069,9 @@ class App(QMainWindow):
         for chunk in chunks:
             worker = SearchWorker(
                 job_id,
-                chunk,
+                search_contents,
                 search_text,
+                paths=chunk,
                 case_sensitive=self.case_sensitive_checkbox.isChecked(),
                 whole_word=whole_word,
                 use_regex=use_regex,
@@ -1117,6 +1182,7 @@ class App(QMainWindow):
             display_sections.append('\n'.join(highlighted_sections))
 
         self.text_display.setPlainText('\n\n'.join(display_sections))
+        self.displayed_view = None
         cursor = self.text_display.textCursor()
         cursor.movePosition(QTextCursor.MoveOperation.Start)
         self.text_display.setTextCursor(cursor)
@@ -1236,31 +1302,55 @@ class App(QMainWindow):
         cursor.clearSelection()
         self.text_display.setTextCursor(cursor)
 
+    def _contents_snapshot(self):
+        """Result contents plus whatever the provider has loaded, for a search worker."""
+        if self.content_provider is None:
+            return self.file_contents
+        return ChainMap(self.content_provider.cached(), self.file_contents)
+
     def _get_file_content(self, file_path):
         content = self.file_contents.get(file_path)
-        if content is not None:
-            return content
+        if content is None and self.content_provider is not None:
+            content = self.content_provider.get(file_path)
+        return content
+
+    def _update_content_provider(self):
+        """Keep one bounded provider for a live structure-only folder, reused across refreshes."""
+        options = self.current_options
+        wanted = (
+            options is not None
+            and options.is_local
+            and not options.concatenate
+            and not options.copy_local_folder
+        )
+        provider = self.content_provider
+        if provider is not None and (
+            not wanted
+            or provider.root != os.path.abspath(options.source_path)
+            or provider.max_file_bytes != options.max_file_bytes
+        ):
+            self._close_content_provider()
+        if wanted and self.content_provider is None:
+            self.content_provider = ContentProvider(
+                options.source_path, options.max_file_bytes, self.content_memory_limit
+            )
 
-        if self.current_options and not self.current_options.concatenate and self.local_folder_path:
-            root = os.path.abspath(self.local_folder_path)
-            abs_path = os.path.abspath(os.path.join(root, file_path))
-            try:
-                inside_root = os.path.commonpath([root, abs_path]) == root
-            except ValueError:
-                inside_root = False
-            if not inside_root or os.path.islink(abs_path) or not os.path.isfile(abs_path):
-                return None
-            if file_path.casefold().endswith('.ipynb'):
-                if os.path.getsize(abs_path) > self.current_options.max_file_bytes:
-                    return None
-                content = convert_notebook_to_markdown(abs_path)
-            else:
-                content = read_text_file(abs_path, self.current_options.max_file_bytes)
+    def _close_content_provider(self):
+        if self.content_provider is not None:
+            self.content_provider.close()
+            self.content_provider = None
 
-            if content is not None:
-                self.file_contents[file_path] = content
-            return content
-        return None
+    def _prefetch_around(self, file_path):
+        """Load the files next to ``file_path`` in tree order before they are clicked."""
+        if self.content_provider is None:
+            return
+        paths = list(self.file_positions)
+        try:
+            index = paths.index(file_path)
+        except ValueError:
+            return
+        radius = self.prefetch_radius
+        self.content_provider.prefetch(paths[max(index - radius, 0):index + radius + 1])
 
     def on_tree_item_clicked(self, item, column):
         # Get the full path of the clicked item
@@ -1326,6 +1416,7 @@ class App(QMainWindow):
             self.text_display.setPlainText("\n\n".join(concatenated_parts))
         else:
             self.text_display.setPlainText("No text files in this folder.")
+        self.displayed_view = ("folder", folder_path)
 
         self.update_counts()
 
@@ -1338,7 +1429,9 @@ class App(QMainWindow):
             self.text_display.setPlainText(content)
         else:
             self.text_display.setPlainText(f"File content not found for {file_path}")
+        self.displayed_view = ("file", file_path)
         self.update_counts()
+        self._prefetch_around(file_path)
 
     def on_item_changed(self, item, column):
         # Ensure we're not triggering recursive updates
@@ -1447,15 +1540,22 @@ class App(QMainWindow):
 
     def closeEvent(self, event):
         """Handle window close event."""
+        self.folder_watcher.stop()
         if self.analysis_thread is not None and self.analysis_thread.isRunning():
-            self.cancel_analysis()
-            self.show_message("Cancellation was requested. Close the window after the analysis stops.")
-            event.ignore()
-            return
+            if self.pending_quiet:
+                self.analysis_thread.request_cancel()
+                self.analysis_thread.wait()
+            else:
+                self.cancel_analysis()
+                self.show_message("Cancellation was requested. Close the window after the analysis stops.")
+                event.ignore()
+                return
         self.cancel_search()
+        self._close_content_provider()
         self.save_history()
         self.settings.setValue("geometry", self.saveGeometry())
         self.settings.setValue("splitter_state", self.splitter.saveState())
+        self.settings.setValue("use_cache", self.use_cache_checkbox.isChecked())
         super().closeEvent(event)
 
     def add_to_history(self, path, is_local):
@@ -1523,8 +1623,29 @@ class App(QMainWindow):
             self.show_message("Refresh is only available for an active local folder analysis.")
             return
 
-        self.paths_to_restore = self._get_checked_item_paths()
-        self.analyze_source()
+        if self.analysis_thread is not None and self.analysis_thread.isRunning():
+            self.show_message("An analysis is already running.")
+            return
+
+        previous = self.current_result
+        if (
+            previous is None
+            or previous.manifest is None
+            or not self.file_positions
+            or self.current_options is None
+            or self.current_options.source_path != self.local_folder_path
+        ):
+            self.paths_to_restore = self._get_checked_item_paths()
+            self.analyze_source()
+            return
+
+        options = self._build_options()
+        if options is None:
+            return
+        try:
+            self.start_analysis(options, previous=previous)
+        except Exception as e:
+            self.show_error(f"An error occurred: {str(e)}")
 
     def _get_checked_item_paths(self):
         paths = set()
@@ -1549,19 +1670,42 @@ class App(QMainWindow):
             self.show_message("An analysis is already running.")
             return
 
+        options = self._build_options()
+        if options is None:
+            return
+
+        self.folder_watcher.stop()
+        self.pending_watch_changes.clear()
+        self._close_content_provider()
+        self.file_contents = {}
+        self.file_positions = {}
+        self.file_token_counts = {}
+        self.current_result = None
+        self.current_options = None
+        self.copy_part_button.setEnabled(False)
+        self.file_tree.clear()
+        self.tree_container.hide()
+        self.refresh_button.hide()
+        self.text_display.setPlainText("Analyzing…")
+        try:
+            self.start_analysis(options)
+        except Exception as e:
+            self.show_error(f"An error occurred: {str(e)}")
+
+    def _build_options(self):
         is_local = self.local_radio.isChecked()
 
         if is_local:
             source_path = self.local_folder_path
             if not source_path or not os.path.isdir(source_path):
                 self.show_error("Please select a valid local folder")
-                return
+                return None
             self.add_to_history(source_path, is_local=True)
         else:
             source_path = self.repo_entry.text().strip()
             if not source_path:
                 self.show_error("Please enter a repository URL")
-                return
+                return None
             self.add_to_history(self._safe_history_source(source_path), is_local=False)
 
         exclude_folders = list(self._parse_rules(self.exclude_folders_entry.text()))
@@ -1588,11 +1732,12 @@ class App(QMainWindow):
         try:
             max_file_bytes = self._parse_size_mib(self.max_file_size_entry.text(), 1)
             max_total_bytes = self._parse_size_mib(self.max_output_size_entry.text(), 20)
+            max_part_tokens = self._parse_part_tokens(self.max_part_tokens_entry.text())
         except ValueError as error:
             self.show_error(str(error))
-            return
+            return None
 
-        options = AnalysisOptions(
+        return AnalysisOptions(
             source_path=source_path,
             is_local=is_local,
             include_extensions=self._parse_rules(self.include_entry.text()),
@@ -1600,27 +1745,28 @@ class App(QMainWindow):
             exclude_patterns=tuple(exclude_folders),
             concatenate=not self.only_structure_checkbox.isChecked(),
             include_git=not self.ignore_git_checkbox.isChecked(),
+            respect_gitignore=self.respect_gitignore_checkbox.isChecked(),
             include_license=not self.ignore_license_checkbox.isChecked(),
             exclude_readme=self.ignore_readme_checkbox.isChecked(),
             copy_local_folder=self.copy_local_folder_checkbox.isChecked() if is_local else False,
+            tracked_only=self.tracked_only_checkbox.isChecked() if is_local else False,
             branch=self.branch_entry.text().strip() or None,
             max_file_bytes=max_file_bytes,
             max_total_bytes=max_total_bytes,
+            max_part_tokens=max_part_tokens,
+            deduplicate=self.deduplicate_checkbox.isChecked(),
+            strip_python=self.strip_python_checkbox.isChecked(),
+            collapse_blank_lines=self.strip_python_checkbox.isChecked(),
+            python_skeleton=self._parse_rules(self.python_skeleton_entry.text()),
+            cache_dir=str(user_cache_dir()) if self.use_cache_checkbox.isChecked() else None,
         )
 
-        self.file_contents = {}
-        self.file_positions = {}
-        self.file_token_counts = {}
-        self.current_result = None
-        self.current_options = None
-        self.file_tree.clear()
-        self.tree_container.hide()
-        self.refresh_button.hide()
-        self.text_display.setPlainText("Analyzing…")
-        try:
-            self.start_analysis(options)
-        except Exception as e:
-            self.show_error(f"An error occurred: {str(e)}")
+    def clear_disk_cache(self):
+        if self.analysis_thread is not None and self.analysis_thread.isRunning():
+            self.show_error("Wait for the analysis to finish before clearing the cache.")
+            return
+        clear_cache(user_cache_dir())
+        self.show_message("The cache was cleared.")
 
     @staticmethod
     def _parse_rules(text):
@@ -1633,6 +1779,18 @@ class App(QMainWindow):
             raise ValueError("Size limits must be greater than 0 and no more than 1024 MiB.")
         return int(value * 1024 * 1024)
 
+    @staticmethod
+    def _parse_part_tokens(text):
+        if not text.strip():
+            return None
+        try:
+            value = int(text.replace(",", "").strip())
+        except ValueError:
+            raise ValueError("Maximum tokens per part must be a whole number.") from None
+        if value < MIN_PART_TOKENS:
+            raise ValueError(f"Parts must allow at least {MIN_PART_TOKENS} tokens.")
+        return value
+
     @staticmethod
     def _safe_history_source(source):
         parsed = urlsplit(source)
@@ -1643,21 +1801,17 @@ class App(QMainWindow):
             netloc = f"{netloc}:{parsed.port}"
         return urlunsplit((parsed.scheme, netloc, parsed.path, parsed.query, ""))
 
-    def start_analysis(self, options):
-        self.progress_dialog = QProgressDialog(
-            "Analyzing...", "Cancel", 0, 100, self
-        )
-        self.progress_dialog.setWindowTitle("Analysis Progress")
-        self.progress_dialog.setMinimumDuration(0)
-        self.progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
-        self.progress_dialog.setMinimumSize(QSize(400, 100))
-        
+    def start_analysis(self, options, previous=None, changed_directories=None, quiet=False):
         pat = None
         if not options.is_local and self.use_pat_checkbox.isChecked():
             pat = self.pat_entry.text().strip() or None
 
         self.pending_options = options
-        self.analysis_thread = AnalysisThread(options, pat)
+        self.pending_refresh = previous is not None
+        self.pending_quiet = quiet
+        self.analysis_thread = AnalysisThread(
+            options, pat, previous=previous, changed_directories=changed_directories
+        )
 
         self.analysis_thread.progress_signal.connect(self.update_progress)
         self.analysis_thread.finished_signal.connect(self.analysis_completed)
@@ -1665,6 +1819,16 @@ class App(QMainWindow):
         self.analysis_thread.cancelled_signal.connect(self.handle_analysis_cancelled)
         self.analysis_thread.finished.connect(self.analysis_thread_finished)
         self.analysis_thread.start()
+        if quiet:
+            return
+
+        self.progress_dialog = QProgressDialog(
+            "Analyzing...", "Cancel", 0, 100, self
+        )
+        self.progress_dialog.setWindowTitle("Analysis Progress")
+        self.progress_dialog.setMinimumDuration(0)
+        self.progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self.progress_dialog.setMinimumSize(QSize(400, 100))
 
         self.analyze_button.setEnabled(False)
         self.refresh_button.setEnabled(False)
@@ -1672,7 +1836,7 @@ class App(QMainWindow):
         self.progress_dialog.show()
 
     def cancel_analysis(self):
-        if self.analysis_thread is not None and self.analysis_thread.isRunning():
+        if self.progress_dialog and self.analysis_thread is not None and self.analysis_thread.isRunning():
             self.progress_dialog.setLabelText("Cancelling after the current operation…")
             self.progress_dialog.setCancelButton(None)
             self.analysis_thread.request_cancel()
@@ -1683,9 +1847,16 @@ class App(QMainWindow):
             self.progress_dialog.setValue(value)
 
     def handle_analysis_error(self, error_message):
+        if self.pending_quiet:
+            self.pending_options = None
+            self.pending_refresh = False
+            self.pending_quiet = False
+            logging.warning("Automatic refresh failed: %s", error_message)
+            return
         self._close_progress_dialog()
         self.analyze_button.setEnabled(True)
         self.pending_options = None
+        self.pending_refresh = False
         self.paths_to_restore = None
         self.refresh_button.setEnabled(self.local_radio.isChecked() and bool(self.file_positions))
         self.show_error(error_message)
@@ -1694,6 +1865,8 @@ class App(QMainWindow):
         self._close_progress_dialog()
         self.analyze_button.setEnabled(True)
         self.pending_options = None
+        self.pending_refresh = False
+        self.pending_quiet = False
         self.paths_to_restore = None
         self.refresh_button.setEnabled(False)
         self.text_display.setPlainText("Analysis cancelled.")
@@ -1708,20 +1881,44 @@ class App(QMainWindow):
         thread = self.sender()
         if thread is self.analysis_thread:
             self.analysis_thread = None
+        if self.pending_watch_changes:
+            QTimer.singleShot(0, self._start_watch_refresh)
 
     def analysis_completed(self, result):
         self._close_progress_dialog()
         self.analyze_button.setEnabled(True)
         self.current_result = result
+        self.copy_part_button.setEnabled(bool(result.parts))
         self.current_options = self.pending_options
         self.pending_options = None
+        self._update_content_provider()
         self.folder_structure = result.folder_structure
+        in_place = self.pending_refresh and result.file_positions and self.file_tree.topLevelItemCount()
+        quiet = self.pending_quiet and in_place
+        self.pending_refresh = False
+        self.pending_quiet = False
+
+        if in_place:
+            self._apply_refresh(result)
+            self.refresh_button.setEnabled(True)
+            self.update_selected_counts()
+            self._update_folder_watch()
+            if quiet:
+                self._refresh_displayed_view()
+            else:
+                self.text_display.setPlainText(result.full_text)
+                self.displayed_view = ("all", None)
+                self.update_counts()
+                self.show_toast_message("Folder refreshed")
+            return
+
         self.text_display.setPlainText(result.full_text)
+        self.displayed_view = ("all", None)
         self.update_counts()
 
         self.file_contents = result.file_contents
         self.file_positions = result.file_positions
-        self.file_token_counts = {}
+        self.file_token_counts = dict(result.token_counts)
 
         if result.file_positions:
             self.update_sidebar(result.file_positions)
@@ -1733,13 +1930,72 @@ class App(QMainWindow):
                 self.refresh_button.show()
                 self.refresh_button.setEnabled(True)
         else:
+            self.file_tree.clear()
+            self.path_to_item_map.clear()
             self.tree_container.hide()
             self.refresh_button.hide()
 
         self.update_selected_counts()
+        self._update_folder_watch()
 
         self.show_toast_message("Analysis completed")
 
+    def _update_folder_watch(self, *_args):
+        """Watch the current live local folder while the watch option is on."""
+        options = self.current_options
+        result = self.current_result
+        if (
+            self.watch_folder_checkbox.isChecked()
+            and options is not None
+            and options.is_local
+            and not options.copy_local_folder
+            and result is not None
+            and result.manifest is not None
+            and self.file_positions
+        ):
+            self.folder_watcher.watch(result.manifest)
+        else:
+            self.folder_watcher.stop()
+            self.pending_watch_changes.clear()
+
+    def _on_folder_changed(self, changed_directories):
+        self.pending_watch_changes.update(changed_directories)
+        self._start_watch_refresh()
+
+    def _start_watch_refresh(self):
+        """Apply watcher changes with an incremental refresh of only the changed directories."""
+        if not self.pending_watch_changes:
+            return
+        if self.analysis_thread is not None and self.analysis_thread.isRunning():
+            return  # analysis_thread_finished retries
+        if self.current_result is None or self.current_options is None:
+            self.pending_watch_changes.clear()
+            return
+        changed_directories = frozenset(self.pending_watch_changes)
+        self.pending_watch_changes.clear()
+        self.start_analysis(
+            self.current_options,
+            previous=self.current_result,
+            changed_directories=changed_directories,
+            quiet=True,
+        )
+
+    def _refresh_displayed_view(self):
+        """Redraw whatever the text panel shows, keeping the scroll position."""
+        if self.displayed_view is None:
+            return
+        kind, path = self.displayed_view
+        scroll_bar = self.text_display.verticalScrollBar()
+        position = scroll_bar.value()
+        if kind == "file":
+            self.display_file_content(path)
+        elif kind == "folder":
+            self.display_folder_contents(path)
+        else:
+            self.text_display.setPlainText(self.current_result.full_text)
+            self.update_counts()
+        scroll_bar.setValue(position)
+
     def _restore_checked_items(self, paths_to_restore):
         try:
             self._updating_items = True
@@ -1760,6 +2016,115 @@ class App(QMainWindow):
             self._updating_items = False
             self.update_selected_counts()
 
+    def _apply_refresh(self, result):
+        """Update contents, positions, and the existing tree in place after a refresh."""
+        old_paths = set(self.file_positions)
+        new_paths = set(result.file_positions)
+        # Counts stay valid for files whose content is unchanged.
+        self.file_token_counts = {
+            path: count
+            for path, count in self.file_token_counts.items()
+            if path in result.file_contents and result.file_contents[path] == self.file_contents.get(path)
+        }
+        self.file_token_counts.update(result.token_counts)
+        self.file_contents = result.file_contents
+        self.file_positions = result.file_positions
+
+        root_item = self.file_tree.topLevelItem(0)
+        parents_to_update = []
+        self._updating_items = True
+        self.file_tree.setUpdatesEnabled(False)
+        try:
+            for path in sorted(old_paths - new_paths):
+                item = self.path_to_item_map.pop(path, None)
+                if item is None:
+                    continue
+                parent = item.parent()
+                parent.removeChild(item)
+                while parent is not root_item and parent.childCount() == 0:
+                    grandparent = parent.parent()
+                    grandparent.removeChild(parent)
+                    parent = grandparent
+                if parent not in parents_to_update:
+                    parents_to_update.append(parent)
+
+            for path in sorted(new_paths - old_paths):
+                parent = root_item
+                *folders, name = path.split("/")
+                for folder in folders:
+                    child = self._find_child(parent, folder, is_folder=True)
+                    if child is None:
+                        child = self._new_folder_item(folder)
+                        self._insert_sorted(parent, child, is_folder=True)
+                        child.setExpanded(True)
+                    parent = child
+                item = self._new_file_item(name)
+                self._insert_sorted(parent, item, is_folder=False)
+                self.path_to_item_map[path] = item
+                if parent not in parents_to_update:
+                    parents_to_update.append(parent)
+
+            for parent in parents_to_update:
+                self.update_parent_check_state(parent)
+        finally:
+            self.file_tree.setUpdatesEnabled(True)
+            self._updating_items = False
+
+    @staticmethod
+    def _tree_sort_key(item):
+        # Sibling order of a tree built from sorted paths: a folder sorts as "name/".
+        return item.text(0) + "/" if item.childCount() else item.text(0)
+
+    @staticmethod
+    def _find_child(parent, name, is_folder):
+        for index in range(parent.childCount()):
+            child = parent.child(index)
+            if child.text(0) == name and bool(child.childCount()) == is_folder:
+                return child
+        return None
+
+    def _insert_sorted(self, parent, item, is_folder):
+        key = item.text(0) + "/" if is_folder else item.text(0)
+        index = 0
+        while index < parent.childCount() and self._tree_sort_key(parent.child(index)) < key:
+            index += 1
+        parent.insertChild(index, item)
+
+    @staticmethod
+    def _new_folder_item(name):
+        item = QTreeWidgetItem([name])
+        item.setCheckState(0, Qt.CheckState.Unchecked)
+        item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+        item.setIcon(0, QIcon.fromTheme("folder"))
+        return item
+
+    @staticmethod
+    def _new_file_item(name):
+        item = QTreeWidgetItem([name])
+        item.setCheckState(0, Qt.CheckState.Unchecked)
+        item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+
+        # Set an icon based on file extension
+        if name.endswith(('.py')):
+            item.setIcon(0, QIcon.fromTheme("text-x-python"))
+        elif name.endswith(('.js')):
+            item.setIcon(0, QIcon.fromTheme("text-x-javascript"))
+        elif name.endswith(('.html', '.htm')):
+            item.setIcon(0, QIcon.fromTheme("text-html"))
+        elif name.endswith(('.css')):
+            item.setIcon(0, QIcon.fromTheme("text-css"))
+        elif name.endswith(('.md')):
+            item.setIcon(0, QIcon.fromTheme("text-x-markdown"))
+        elif name.endswith(('.json')):
+            item.setIcon(0, QIcon.fromTheme("application-json"))
+        elif name.endswith(('.xml')):
+            item.setIcon(0, QIcon.fromTheme("application-xml"))
+        elif name.endswith(('.txt')):
+            item.setIcon(0, QIcon.fromTheme("text-plain"))
+        else:
+            item.setIcon(0, QIcon.fromTheme("text-x-generic"))
+        return item
+
     def update_sidebar(self, file_positions):
         if not file_positions:
             self.tree_container.hide()
@@ -1802,40 +2167,17 @@ class App(QMainWindow):
 
                     if current_path not in tree_items:
                         # Create new directory item
-                        item = QTreeWidgetItem(parent_item, [part])
-                        item.setCheckState(0, Qt.CheckState.Unchecked)
-                        item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
-                        item.setIcon(0, QIcon.fromTheme("folder"))
+                        item = self._new_folder_item(part)
+                        parent_item.addChild(item)
                         tree_items[current_path] = item
 
                     parent_item = tree_items[current_path]
                 else:  # This is a file
                     # Create file item
-                    item = QTreeWidgetItem(parent_item, [part])
-                    item.setCheckState(0, Qt.CheckState.Unchecked)
-                    item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+                    item = self._new_file_item(part)
+                    parent_item.addChild(item)
                     self.path_to_item_map[path] = item
 
-                    # Set an icon based on file extension
-                    if part.endswith(('.py')):
-                        item.setIcon(0, QIcon.fromTheme("text-x-python"))
-                    elif part.endswith(('.js')):
-                        item.setIcon(0, QIcon.fromTheme("text-x-javascript"))
-                    elif part.endswith(('.html', '.htm')):
-                        item.setIcon(0, QIcon.fromTheme("text-html"))
-                    elif part.endswith(('.css')):
-                        item.setIcon(0, QIcon.fromTheme("text-css"))
-                    elif part.endswith(('.md')):
-                        item.setIcon(0, QIcon.fromTheme("text-x-markdown"))
-                    elif part.endswith(('.json')):
-                        item.setIcon(0, QIcon.fromTheme("application-json"))
-                    elif part.endswith(('.xml')):
-                        item.setIcon(0, QIcon.fromTheme("application-xml"))
-                    elif part.endswith(('.txt')):
-                        item.setIcon(0, QIcon.fromTheme("text-plain"))
-                    else:
-                        item.setIcon(0, QIcon.fromTheme("text-x-generic"))
-
         # Expand all items
         self.file_tree.expandAll()
 
@@ -1911,6 +2253,27 @@ class App(QMainWindow):
         clipboard.setText(text)
         self.show_toast_message("Full analysis copied")
 
+    def show_copy_part_menu(self):
+        """Offer each token-bounded part of the analysis for copying."""
+        parts = self.current_result.parts if self.current_result else ()
+        if not parts:
+            self.show_message("Set a maximum number of tokens per part and analyze again")
+            return
+
+        menu = QMenu(self)
+        for index, part in enumerate(parts):
+            action = QAction(f"Part {index + 1} of {len(parts)} ({part.tokens:,} tokens)", self)
+            action.triggered.connect(lambda checked, index=index: self.copy_part(index))
+            menu.addAction(action)
+
+        menu.exec(self.copy_part_button.mapToGlobal(self.copy_part_button.rect().bottomLeft()))
+
+    def copy_part(self, index):
+        parts = self.current_result.parts
+        clipboard = QApplication.clipboard()
+        clipboard.setText(render_part(self.current_result.full_text, parts, index))
+        self.show_toast_message(f"Part {index + 1} of {len(parts)} copied")
+
     def copy_selection(self):
         cursor = self.text_display.textCursor()
         if cursor.hasSelection():
@@ -2040,7 +2403,7 @@ class App(QMainWindow):
         if self._token_encoding is None:
             return 0
         try:
-            return len(self._token_encoding.encode(text))
+            return count_tokens(text, self._token_encoding)
         except Exception as e:
             logging.error(f"Error counting tokens: {str(e)}")
             return 0
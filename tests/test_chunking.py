@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import tiktoken
+
+from chareco import cli
+from chareco.core import service
+from chareco.core.chunking import PartSplitter, part_header, render_part
+from chareco.core.models import AnalysisOptions
+
+
+# One token per UTF-8 byte keeps part sizes easy to check offline.
+BYTES = tiktoken.Encoding(
+    name="bytes",
+    pat_str=r"[\s\S]",
+    mergeable_ranks={bytes([value]): value for value in range(256)},
+    special_tokens={},
+)
+
+
+def _read_untranslated(path: Path) -> str:
+    with path.open(encoding="utf-8", newline="") as handle:
+        return handle.read()
+
+
+class ChunkingTests(unittest.TestCase):
+    def test_blocks_stay_whole_and_oversized_ones_split_at_lines(self) -> None:
+        header = "\n--big.py--\n"
+        big = "".join(f"line {index:03d} {'x' * 40}\n" for index in range(20))
+        long_line = "é" * 700
+        output = io.StringIO()
+        splitter = PartSplitter(300, BYTES, output.write)
+        splitter.write("preamble\n")
+        splitter.write_block("\n--a.py--\n", "a" * 130)
+        splitter.write_block("\n--b.py--\n", "b" * 130)
+        splitter.write_block(header, big)
+        splitter.write(long_line)
+        parts = splitter.finish()
+        text = output.getvalue()
+
+        self.assertEqual("".join(text[part.start:part.end] for part in parts), text)
+        self.assertEqual(parts[0].end, len("preamble\n") + len("\n--a.py--\n") + 130)
+        self.assertTrue(text[parts[1].start:].startswith("\n--b.py--\n"))
+        continued = [part for part in parts if part.continues]
+        self.assertTrue(continued)
+        for part in continued:
+            self.assertEqual(part.continues, "\n--big.py-- (continued)\n")
+            self.assertEqual(text[part.start - 1], "\n")
+        for index, part in enumerate(parts):
+            rendered = render_part(text, parts, index)
+            self.assertTrue(rendered.startswith(part_header(index + 1, len(parts))))
+            self.assertLessEqual(len(rendered.encode("utf-8")), 300)
+
+    def test_cli_writes_part_files_matching_the_analysis(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory) / "project"
+            root.mkdir()
+            for name in ("a.py", "b.py", "c.py"):
+                (root / name).write_text(f"{name}\r\n" * 60, encoding="utf-8")
+            output = Path(directory) / "context.txt"
+            options = AnalysisOptions(
+                source_path=str(root),
+                is_local=True,
+                max_file_bytes=2**20,
+                max_total_bytes=20 * 2**20,
+                max_part_tokens=1_000,
+            )
+            with patch.object(service, "get_encoding", return_value=BYTES):
+                stream = io.StringIO()
+                streamed = service.run_analysis(options, output=stream)
+                arguments = [str(root), "--local", "--max-part-tokens", "1000", "--no-cache", "--output", str(output)]
+                with contextlib.redirect_stderr(io.StringIO()):
+                    cli.main(arguments)
+            part_files = sorted(Path(directory).glob("context.part*.txt"))
+            written, *part_texts = [_read_untranslated(path) for path in (output, *part_files)]
+
+        text = stream.getvalue()
+        self.assertEqual(written, text)
+        self.assertGreater(len(streamed.parts), 1)
+        self.assertEqual(streamed.metadata["Part limit"], "1,000 cl100k_base tokens per part")
+        self.assertEqual(part_texts, [render_part(text, streamed.parts, index) for index in range(len(streamed.parts))])
+        self.assertEqual(part_files[0].name, "context.part01.txt")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import random
+import unittest
+
+from chareco.core.filters import FilterSpec, _matches_glob, _passes_file_filters
+
+_GUI_DEFAULT_PATTERNS = (
+    "__pycache__", "*/__pycache__", "__pycache__/*", "*/__pycache__/*", "*.pyc",
+    "node_modules", "*/node_modules", "node_modules/*", "*/node_modules/*",
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml",
+    "build", "*/build", "build/*", "*/build/*", "dist", "*/dist", "dist/*", "*/dist/*",
+    "*.log", ".env", ".env.*", "*.pem", "*.key", "id_rsa", "credentials*",
+)
+_EDGE_PATTERNS = (
+    "src/*", "./docs/", "a/./b", "**/tests/*", "[ab]*/x?.py", "[!a]*", "x[/]y", "a[!/]b",
+    "[", "lib/[", "*.[ch]", "data/**", "pkg/sub", "?", "*/*/*.md", "[]]x", "[!]",
+)
+_SEGMENTS = (
+    "src", "docs", "a", "b", "x", "lib", "build", "dist", "tests", "node_modules", "__pycache__",
+    "pkg", "sub", "data", "[", "]x", "ax", "bx", ".env", "README.md", "LICENSE",
+)
+_NAMES = (
+    "main.py", "x1.py", "util.c", "util.h", "app.log", "id_rsa", "credentials.json", ".env",
+    ".env.local", "archive.tar.gz", "ARCHIVE.TAR.GZ", "notes.MD", "a.pyc", ".gitignore",
+    "README.md", "license", "Makefile", "axb", "a/b", "x.tar", "pkg.d.ts", "weird.", ".py",
+)
+_EXTENSION_RULES = (
+    ".py", "py", "*.py", ".MD", ".tar.gz", "gz", "*.d.ts", ".d.ts", "*.[ch]", ".", "*", ".c",
+)
+
+
+class FilterSpecEquivalenceTests(unittest.TestCase):
+    def assert_same_verdicts(self, rng: random.Random, *, patterns, include, exclude, flags) -> None:
+        spec = FilterSpec.compile(
+            include=include,
+            exclude=exclude,
+            ignore_git=flags[0],
+            exclude_license=flags[1],
+            exclude_readme=flags[2],
+            exclude_patterns=patterns,
+        )
+        for _ in range(100):
+            parts = [rng.choice(_SEGMENTS) for _ in range(rng.randint(0, 3))]
+            directory = "/".join(parts)
+            name = rng.choice(_NAMES).rpartition("/")[2]
+            relative_path = f"{directory}/{name}" if directory else name
+            expected = _passes_file_filters(
+                relative_path,
+                include=include,
+                exclude=exclude,
+                ignore_git=flags[0],
+                exclude_license=flags[1],
+                exclude_readme=flags[2],
+                exclude_patterns=patterns,
+            )
+            self.assertEqual(spec.includes_file(relative_path), expected, (relative_path, patterns))
+            if directory:
+                self.assertEqual(
+                    spec.excludes_directory(directory, parts[-1]),
+                    (flags[0] and parts[-1] == ".git") or _matches_glob(directory, patterns),
+                    (directory, patterns),
+                )
+
+    def test_compiled_spec_matches_reference_helpers(self) -> None:
+        rng = random.Random(20240611)
+        pool = _GUI_DEFAULT_PATTERNS + _EDGE_PATTERNS
+        for _ in range(100):
+            self.assert_same_verdicts(
+                rng,
+                patterns=tuple(rng.sample(pool, rng.randint(0, 8))),
+                include=tuple(rng.sample(_EXTENSION_RULES, rng.randint(0, 3))),
+                exclude=tuple(rng.sample(_EXTENSION_RULES, rng.randint(0, 2))),
+                flags=(rng.random() < 0.5, rng.random() < 0.5, rng.random() < 0.5),
+            )
+
+    def test_comma_separated_rules_are_split_once_at_compile_time(self) -> None:
+        spec = FilterSpec.compile(include=[".py, .md"], exclude_patterns=["build/* docs"])
+
+        self.assertTrue(spec.includes_file("src/main.py"))
+        self.assertTrue(spec.includes_file("notes.md"))
+        self.assertFalse(spec.includes_file("setup.cfg"))
+        self.assertFalse(spec.includes_file("docs"))
+        self.assertTrue(spec.excludes_directory("build", "build"))
+
+
+if __name__ == "__main__":
+    unittest.main()
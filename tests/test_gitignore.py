@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from chareco.core import utils
+from chareco.core.filters import FilterSpec
+from chareco.core.gitignore import RuleSet, is_ignored, parse_rules
+
+
+def _ignored(lines: str, relative_path: str, is_directory: bool = False) -> bool:
+    stack = (RuleSet.create("", parse_rules(lines.splitlines())),)
+    return is_ignored(stack, relative_path, relative_path.rpartition("/")[2], is_directory)
+
+
+class GitIgnoreRuleTests(unittest.TestCase):
+    def test_pattern_semantics(self) -> None:
+        cases = [
+            ("*.log", "a/b/debug.log", False, True),
+            ("*.log\n!keep.log", "a/keep.log", False, False),
+            ("/build", "build", True, True),
+            ("/build", "src/build", True, False),
+            ("build/", "src/build", True, True),
+            ("build/", "src/build", False, False),
+            ("doc/*.md", "doc/a.md", False, True),
+            ("doc/*.md", "x/doc/a.md", False, False),
+            ("doc/*.md", "doc/sub/a.md", False, False),
+            ("**/tmp", "a/b/tmp", True, True),
+            ("a/**/b", "a/b", True, True),
+            ("a/**/b", "a/x/y/b", True, True),
+            ("a/**", "a", True, False),
+            ("a/**", "a/x/y", False, True),
+            ("[!a]*.txt", "b.txt", False, True),
+            ("[!a]*.txt", "a.txt", False, False),
+            ("\\#hash\n\\!bang", "#hash", False, True),
+            ("\\#hash\n\\!bang", "!bang", False, True),
+            ("# comment\n\n", "# comment", False, False),
+            ("name\\ ", "name ", False, True),
+            ("name ", "name", False, True),
+            ("*\n!*/", "dir", True, False),
+        ]
+        for lines, path, is_directory, expected in cases:
+            with self.subTest(lines=lines, path=path):
+                self.assertEqual(_ignored(lines, path, is_directory), expected)
+
+
+class GitIgnoreScanTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.temporary_directory.name)
+
+    def tearDown(self) -> None:
+        self.temporary_directory.cleanup()
+
+    def write(self, relative_path: str, content: str = "x\n") -> None:
+        path = self.root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+
+    def test_nested_rules_and_info_exclude_prune_before_listing(self) -> None:
+        self.write(".git/info/exclude", "*.secret\n")
+        self.write(".gitignore", "node_modules/\n*.log\n")
+        self.write("node_modules/pkg/index.js")
+        self.write("app/.gitignore", "!important.log\n/generated/\n")
+        self.write("app/important.log")
+        self.write("app/debug.log")
+        self.write("app/generated/out.py")
+        self.write("app/src/generated/keep.py")
+        self.write("app/token.secret")
+        self.write("main.py")
+
+        listed = []
+        original = utils._scandir_sorted
+
+        def record(directory):
+            listed.append(Path(directory).relative_to(self.root).as_posix())
+            return original(directory)
+
+        with patch.object(utils, "_scandir_sorted", side_effect=record):
+            manifest = utils.scan_tree(self.root, FilterSpec.compile(respect_gitignore=True))
+
+        included = [entry.relative_path for entry in manifest.files() if entry.included]
+        self.assertEqual(
+            included,
+            ["main.py", "app/important.log", "app/src/generated/keep.py"],
+        )
+        self.assertNotIn("node_modules", listed)
+        self.assertNotIn("app/generated", listed)
+
+    def test_rules_above_a_subdirectory_root_still_apply(self) -> None:
+        self.write(".git/HEAD", "ref: refs/heads/main\n")
+        self.write(".gitignore", "/project/dist/\n*.tmp\n")
+        self.write("project/dist/bundle.js")
+        self.write("project/scratch.tmp")
+        self.write("project/main.py")
+
+        manifest = utils.scan_tree(self.root / "project", FilterSpec.compile(respect_gitignore=True))
+
+        self.assertEqual([entry.relative_path for entry in manifest.files()], ["main.py"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,8 +2,11 @@ from __future__ import annotations
 
 import os
 import sys
+import tempfile
 import unittest
+from pathlib import Path
 from types import SimpleNamespace
+from unittest.mock import patch
 
 os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
 try:
@@ -16,6 +19,7 @@ except ImportError:
 from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import QApplication
 
+from chareco.core.models import AnalysisResult
 from chareco.gui import App
 
 
@@ -48,10 +52,70 @@ class GuiLogicTests(unittest.TestCase):
         self.assertEqual(root.checkState(0), Qt.CheckState.PartiallyChecked)
         self.assertEqual(root.child(0).checkState(0), Qt.CheckState.PartiallyChecked)
 
+    def test_refresh_updates_tree_in_place_and_keeps_checked_items(self) -> None:
+        paths = ["a/keep.py", "a/old.py", "b/gone.py", "top.py"]
+        self.window.file_contents = {path: path for path in paths}
+        self.window.file_positions = {path: 0 for path in paths}
+        self.window.update_sidebar(self.window.file_positions)
+        keep_item = self.window.path_to_item_map["a/keep.py"]
+        keep_item.setCheckState(0, Qt.CheckState.Checked)
+        self.window.path_to_item_map["b/gone.py"].setCheckState(0, Qt.CheckState.Checked)
+
+        new_paths = ["a.py", "a/keep.py", "a/new.py", "top.py"]
+        result = AnalysisResult(
+            full_text="",
+            folder_structure="",
+            file_positions={path: 0 for path in new_paths},
+            file_contents={path: path for path in new_paths},
+        )
+        self.window._apply_refresh(result)
+
+        self.assertIs(self.window.path_to_item_map["a/keep.py"], keep_item)
+        self.assertEqual(keep_item.checkState(0), Qt.CheckState.Checked)
+        self.assertEqual(sorted(self.window.path_to_item_map), new_paths)
+        rebuilt = App()
+        try:
+            rebuilt.update_sidebar(result.file_positions)
+            self.assertEqual(self._tree_shape(self.window), self._tree_shape(rebuilt))
+        finally:
+            rebuilt.close()
+            rebuilt.deleteLater()
+        root = self.window.file_tree.topLevelItem(0)
+        self.assertEqual(root.checkState(0), Qt.CheckState.PartiallyChecked)
+        self.assertEqual(keep_item.parent().checkState(0), Qt.CheckState.PartiallyChecked)
+
+    @staticmethod
+    def _tree_shape(window):
+        def shape(item):
+            return item.text(0), [shape(item.child(index)) for index in range(item.childCount())]
+
+        return shape(window.file_tree.topLevelItem(0))
+
     def test_line_numbers_include_blank_lines(self) -> None:
         self.window.line_numbers_checkbox.setChecked(True)
         self.assertEqual(self.window._apply_line_numbers("one\n\ntwo"), "1: one\n2: \n3: two")
 
+    def test_cache_can_be_turned_off_and_cleared(self) -> None:
+        self.window.repo_entry.setText("https://example.com/org/repo.git")
+        self.window.use_cache_checkbox.setChecked(True)
+        with patch.object(self.window, "add_to_history"):
+            self.assertIsNotNone(self.window._build_options().cache_dir)
+            self.window.use_cache_checkbox.setChecked(False)
+            self.assertIsNone(self.window._build_options().cache_dir)
+        # Closing the window saves the setting.
+        self.window.use_cache_checkbox.setChecked(True)
+
+        with tempfile.TemporaryDirectory() as directory:
+            repositories = Path(directory) / "repositories"
+            repositories.mkdir()
+            with (
+                patch.dict(os.environ, {"CHARECO_CACHE_DIR": directory}),
+                patch.object(self.window, "show_message") as shown,
+            ):
+                self.window.clear_cache_button.click()
+            self.assertFalse(repositories.exists())
+            shown.assert_called_once()
+
 
 if __name__ == "__main__":
     unittest.main()
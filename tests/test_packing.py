@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from chareco.core import service
+from chareco.core.models import AnalysisOptions, PackingOptions
+from chareco.core.packing import Candidate, pack_files, score_candidates
+
+
+class PackingTests(unittest.TestCase):
+    def test_signals_combine_into_scores(self) -> None:
+        candidates = [
+            Candidate("src/app.py", size=100, mtime_ns=2_000),
+            Candidate("tests/test_app.py", size=100, mtime_ns=1_000),
+            Candidate("docs/guide.md", size=10_000, mtime_ns=1_000, keyword_hits=3),
+        ]
+        packing = PackingOptions(
+            path_weights=(("src/*", 2.0), ("tests/*", -1.0)),
+            keywords=("cache",),
+            recency_weight=0.5,
+        )
+
+        scores = score_candidates(candidates, packing)
+
+        self.assertEqual(scores[0], 2.5)
+        self.assertEqual(scores[1], -1.0)
+        self.assertAlmostEqual(scores[2], 1.3863, places=4)
+
+    def test_knapsack_packs_at_least_as_much_relevance_as_greedy(self) -> None:
+        # Greedy takes the densest file first, which leaves room for only one large file.
+        candidates = [
+            Candidate("dense.py", size=194, mtime_ns=0),
+            Candidate("large_a.py", size=480, mtime_ns=0),
+            Candidate("large_b.py", size=480, mtime_ns=0),
+        ]
+        weights = (("dense.py", 3.0), ("large_*.py", 5.0))
+        greedy = pack_files(candidates, PackingOptions(path_weights=weights), max_total_bytes=1_000)
+        knapsack = pack_files(
+            candidates, PackingOptions(path_weights=weights, strategy="knapsack"), max_total_bytes=1_000
+        )
+
+        self.assertEqual(greedy, {"dense.py", "large_a.py"})
+        self.assertEqual(knapsack, {"large_a.py", "large_b.py"})
+        with self.assertRaises(ValueError):
+            pack_files(candidates, PackingOptions(strategy="random"), max_total_bytes=1_000)
+
+    def test_packed_analysis_keeps_relevant_files_in_path_order(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            for name in ("a_notes.md", "b_helpers.py", "c_main.py", "d_old.py"):
+                (root / name).write_text(name * 10, encoding="utf-8")
+            (root / "b_helpers.py").write_text("cache " * 20, encoding="utf-8")
+            os.utime(root / "d_old.py", ns=(0, 0))
+            options = AnalysisOptions(
+                source_path=directory,
+                is_local=True,
+                max_total_bytes=300,
+                packing=PackingOptions(
+                    path_weights=(("c_main.py", 5.0), ("*.md", -1.0)),
+                    keywords=("CACHE",),
+                    recency_weight=0.1,
+                ),
+            )
+
+            result = service.run_analysis(options)
+
+        self.assertEqual(list(result.file_positions), ["b_helpers.py", "c_main.py"])
+        self.assertEqual(result.metadata["Packing"], "greedy by relevance, 2 of 4 files selected")
+        self.assertTrue(result.full_text.endswith("lower-ranked files were skipped.]\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from chareco.core import provider
+from chareco.core.provider import ContentProvider
+
+
+class ContentProviderTests(unittest.TestCase):
+    def test_contents_are_evicted_least_recently_used_within_the_cap(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            for name in ("a.py", "b.py", "c.py"):
+                (root / name).write_text(name * 100, encoding="utf-8")
+            one_file = sys.getsizeof("a.py" * 100)
+            contents = ContentProvider(directory, max_file_bytes=10_000, max_bytes=2 * one_file)
+            try:
+                self.assertEqual(contents.get("a.py"), "a.py" * 100)
+                contents.get("b.py")
+                contents.get("a.py")
+                contents.get("c.py")
+
+                self.assertEqual(sorted(contents.cached()), ["a.py", "c.py"])
+                self.assertLessEqual(contents.memory_bytes, 2 * one_file)
+            finally:
+                contents.close()
+
+    def test_changed_files_are_read_again_and_unsafe_paths_are_refused(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            (root / "a.py").write_text("old", encoding="utf-8")
+            (root / "link.py").symlink_to(root / "a.py")
+            contents = ContentProvider(directory, max_file_bytes=10_000)
+            try:
+                self.assertEqual(contents.get("a.py"), "old")
+                (root / "a.py").write_text("newer", encoding="utf-8")
+                self.assertEqual(contents.get("a.py"), "newer")
+                self.assertIsNone(contents.get("link.py"))
+                self.assertIsNone(contents.get("../outside.py"))
+                self.assertIsNone(contents.get("missing.py"))
+            finally:
+                contents.close()
+
+    def test_prefetched_files_are_served_without_reading_again(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            names = [f"f{index}.py" for index in range(5)]
+            for name in names:
+                (root / name).write_text(name, encoding="utf-8")
+            contents = ContentProvider(directory, max_file_bytes=10_000)
+            try:
+                contents.prefetch(names)
+                deadline = time.monotonic() + 5
+                while len(contents.cached()) < len(names) and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                with patch.object(provider, "read_text_file") as read:
+                    self.assertEqual([contents.get(name) for name in names], names)
+                read.assert_not_called()
+            finally:
+                contents.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from unittest.mock import patch
+
+from dulwich import porcelain
+from dulwich.object_store import DiskObjectStore
+from dulwich.objects import Blob, Commit
+from dulwich.repo import Repo
+
+from chareco.core import service
+from chareco.core.models import AnalysisOptions
+from chareco.core.repositories import RepositoryCache, _file_lock, normalize_url
+
+
+def _commit(repository: Path, files: dict[str, str], message: str) -> str:
+    for name, text in files.items():
+        (repository / name).write_text(text, encoding="utf-8")
+    porcelain.add(str(repository), [str(repository / name) for name in files])
+    return porcelain.commit(
+        str(repository),
+        message=message.encode("utf-8"),
+        author=b"Test <test@example.com>",
+        committer=b"Test <test@example.com>",
+    ).decode("ascii")
+
+
+def _blob(repository: Repo, commit: Commit, name: str) -> str:
+    _mode, blob_id = repository[commit.tree][name.encode("utf-8")]
+    return repository[blob_id].data.decode("utf-8")
+
+
+def _origin(directory: Path, name: str) -> Path:
+    path = directory / name
+    path.mkdir()
+    porcelain.init(str(path)).close()
+    return path
+
+
+class RepositoryCacheTests(unittest.TestCase):
+    def test_urls_that_name_the_same_repository_share_an_entry(self) -> None:
+        self.assertEqual(
+            normalize_url("https://GitHub.com/org/repo.git/"),
+            normalize_url("https://github.com/org/repo"),
+        )
+        self.assertNotEqual(normalize_url("https://github.com/org/repo"), normalize_url("https://github.com/org/other"))
+
+    def test_repeat_fetches_bring_only_new_objects_of_the_branch(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            origin = _origin(root, "origin")
+            files = {f"module{index}.py": f"value = {index}\n" * 50 for index in range(5)}
+            first_commit = _commit(origin, files, "first")
+            cache = RepositoryCache(root / "cache")
+            url = origin.as_uri()
+
+            with cache.revision(url) as (repository, commit):
+                self.assertEqual(commit.id.decode("ascii"), first_commit)
+                self.assertEqual(_blob(repository, commit, "module0.py"), files["module0.py"])
+                objects_before = set(repository.object_store)
+            second_commit = _commit(origin, {"module0.py": "changed\n"}, "second")
+            with cache.revision(url, branch="master") as (repository, commit):
+                self.assertEqual(commit.id.decode("ascii"), second_commit)
+                self.assertEqual(_blob(repository, commit, "module0.py"), "changed\n")
+                self.assertEqual(_blob(repository, commit, "module4.py"), files["module4.py"])
+                new_objects = set(repository.object_store) - objects_before
+
+            # The new commit, its tree, and the one changed blob.
+            self.assertEqual(len(new_objects), 3)
+            with self.assertRaises(ValueError):
+                with cache.revision(url, branch="missing"):
+                    pass
+
+    def test_least_recently_used_repositories_are_evicted_unless_in_use(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            urls = []
+            for name in ("a", "b", "c"):
+                origin = _origin(root, name)
+                _commit(origin, {"data.txt": name * 10_000}, name)
+                urls.append(origin.as_uri())
+            cache = RepositoryCache(root / "cache", max_bytes=1)
+
+            with cache.revision(urls[0]):
+                pass
+            with _file_lock(cache.path(urls[0]).with_suffix(".lock")):
+                with cache.revision(urls[1]):
+                    pass
+                self.assertTrue(cache.path(urls[0]).is_dir())
+            with cache.revision(urls[2]):
+                pass
+
+            self.assertFalse(cache.path(urls[0]).exists())
+            self.assertFalse(cache.path(urls[1]).exists())
+            self.assertTrue(cache.path(urls[2]).is_dir())
+            self.assertEqual(
+                sorted(path.name for path in cache.directory.glob("*.lock")),
+                [".lock", cache.path(urls[2]).with_suffix(".lock").name],
+            )
+
+    @unittest.skipIf(os.name == "nt", "Windows cannot delete an open lock file")
+    def test_a_lock_deleted_by_its_holder_is_taken_afresh(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            lock_path = Path(directory) / "repository.lock"
+            recreated = []
+
+            def wait_for_lock() -> None:
+                with _file_lock(lock_path):
+                    recreated.append(lock_path.exists())
+
+            with _file_lock(lock_path):
+                waiter = threading.Thread(target=wait_for_lock)
+                waiter.start()
+                time.sleep(0.2)
+                lock_path.unlink()
+            waiter.join()
+
+            self.assertEqual(recreated, [True])
+
+    def test_remote_analysis_uses_the_repository_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            origin = _origin(root, "origin")
+            commit = _commit(origin, {"main.py": "print('hi')\n"}, "first")
+            options = AnalysisOptions(source_path=origin.as_uri(), is_local=False, cache_dir=str(root / "cache"))
+
+            result = service.run_analysis(options, output=io.StringIO())
+
+            self.assertEqual(result.metadata["Revision"], commit)
+            self.assertEqual(list(result.file_positions), ["main.py"])
+            self.assertTrue(RepositoryCache(root / "cache").path(origin.as_uri()).is_dir())
+
+    def test_remote_revisions_are_read_from_the_object_store_without_excluded_blobs(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            origin = _origin(root, "origin")
+            for name in ("pkg", "vendor"):
+                (origin / name).mkdir()
+            files = {
+                "main.py": "print('hi')\n",
+                "pkg/util.py": "VALUE = 1\n",
+                "pkg/data.bin": "\x00" * 100,
+                "notes.log": "skipped by extension\n",
+                "vendor/lib.py": "skipped by glob\n",
+                ".gitignore": "*.tmp\n",
+                "scratch.tmp": "ignored by git\n",
+            }
+            _commit(origin, files, "first")
+            filters = {"exclude_extensions": (".log",), "exclude_patterns": ("vendor/",), "respect_gitignore": True}
+            original_get_raw = DiskObjectStore.get_raw
+            read: set[bytes] = set()
+
+            def get_raw(store: DiskObjectStore, object_id: bytes) -> tuple[int, bytes]:
+                if not Path(store.path).is_relative_to(origin):  # Not the clone being served.
+                    read.add(object_id)
+                return original_get_raw(store, object_id)
+
+            with patch.object(DiskObjectStore, "get_raw", get_raw):
+                remote = service.run_analysis(AnalysisOptions(source_path=origin.as_uri(), is_local=False, **filters))
+            local = service.run_analysis(AnalysisOptions(source_path=str(origin), is_local=True, **filters))
+
+        self.assertEqual(remote.folder_structure, local.folder_structure)
+        self.assertEqual(dict(remote.file_contents), dict(local.file_contents))
+        self.assertEqual(list(remote.file_contents), ["main.py", "pkg/util.py"])
+        for name in ("notes.log", "vendor/lib.py", "scratch.tmp"):
+            self.assertNotIn(Blob.from_string(files[name].encode("utf-8")).id, read)
+        self.assertIn(Blob.from_string(files["main.py"].encode("utf-8")).id, read)
+
+    def test_local_revisions_are_read_from_the_repository_not_the_working_tree(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            repository = _origin(Path(directory), "project")
+            (repository / "src").mkdir()
+            commit = _commit(
+                repository,
+                {".gitignore": "*.tmp\n", "src/app.py": "committed\n", "src/cache.tmp": "ignored\n"},
+                "first",
+            )
+            porcelain.tag_create(str(repository), b"v1", annotated=True, message=b"v1", author=b"Test <test@example.com>")
+            (repository / "src" / "app.py").write_text("edited\n", encoding="utf-8")
+            (repository / "src" / "new.py").write_text("untracked\n", encoding="utf-8")
+            options = AnalysisOptions(
+                source_path=str(repository / "src"), is_local=True, revision="v1", respect_gitignore=True
+            )
+
+            result = service.run_analysis(options)
+            working_tree = service.run_analysis(replace(options, revision=None))
+            with self.assertRaises(ValueError):
+                service.run_analysis(replace(options, revision="missing"))
+
+        self.assertEqual(result.metadata["Revision"], commit)
+        self.assertEqual(dict(result.file_contents), {"app.py": "committed\n"})
+        self.assertEqual(dict(working_tree.file_contents), {"app.py": "edited\n", "new.py": "untracked\n"})
+        self.assertTrue(result.folder_structure.startswith("├── src/"))
+
+
+if __name__ == "__main__":
+    unittest.main()
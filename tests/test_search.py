@@ -7,7 +7,7 @@ from chareco.core.search import SearchWorker
 
 class SearchWorkerTests(unittest.TestCase):
     def test_invalid_regex_still_finishes(self) -> None:
-        worker = SearchWorker(7, [("sample.py", "content")], "[", use_regex=True)
+        worker = SearchWorker(7, {"sample.py": "content"}, "[", use_regex=True)
         events = []
         worker.signals.error.connect(lambda job_id, error: events.append(("error", job_id, error)))
         worker.signals.finished.connect(lambda job_id: events.append(("finished", job_id)))
@@ -20,8 +20,9 @@ class SearchWorkerTests(unittest.TestCase):
     def test_whole_word_search_does_not_match_substrings(self) -> None:
         worker = SearchWorker(
             3,
-            [("sample.py", "cat scatter cat")],
+            {"sample.py": "cat scatter cat", "other.py": "cat"},
             "cat",
+            paths=["sample.py"],
             whole_word=True,
         )
         results = []
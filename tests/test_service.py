@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import io
+import tempfile
 import unittest
+from pathlib import Path
 from unittest.mock import patch
 
+import tiktoken
+
 from chareco.core.models import AnalysisOptions
-from chareco.core import service
+from chareco.core import service, utils
 
 
 class AnalysisServiceTests(unittest.TestCase):
@@ -16,7 +21,8 @@ class AnalysisServiceTests(unittest.TestCase):
 
         with patch.object(service.porcelain, "clone") as clone:
             with self.assertRaises(ValueError):
-                service._clone_repository(options, "unused", "secret-token")
+                with service._remote_revision(options, "secret-token"):
+                    pass
 
         clone.assert_not_called()
 
@@ -26,6 +32,154 @@ class AnalysisServiceTests(unittest.TestCase):
             "https://example.com/project.git",
         )
 
+    def test_local_analysis_scans_and_sniffs_each_file_once(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            (root / "src").mkdir()
+            (root / "src" / "main.py").write_text("main", encoding="utf-8")
+            (root / "notes.md").write_text("notes", encoding="utf-8")
+            (root / "skip.txt").write_text("skip", encoding="utf-8")
+            options = AnalysisOptions(
+                source_path=directory,
+                is_local=True,
+                include_extensions=(".py", ".md"),
+            )
+
+            with patch.object(utils, "_sniff_binary", wraps=utils._sniff_binary) as sniff, \
+                    patch.object(utils, "_read_file", wraps=utils._read_file) as read:
+                result = service.run_analysis(options)
+
+        self.assertEqual(sniff.call_count, 0)
+        self.assertEqual(read.call_count, 2)
+        self.assertEqual(list(result.file_positions), ["notes.md", "src/main.py"])
+        self.assertIn("├── main.py", result.folder_structure)
+        self.assertNotIn("skip.txt", result.folder_structure)
+
+    def test_files_past_the_output_budget_are_still_sniffed_for_the_structure(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            (root / "a.py").write_text("x" * 64, encoding="utf-8")
+            (root / "b.py").write_text("y" * 64, encoding="utf-8")
+            (root / "c.dat").write_bytes(b"\x00binary")
+            options = AnalysisOptions(source_path=directory, is_local=True, max_total_bytes=100)
+
+            result = service.run_analysis(options)
+
+        self.assertEqual(list(result.file_positions), ["a.py"])
+        self.assertIn("├── b.py", result.folder_structure)
+        self.assertNotIn("c.dat", result.folder_structure)
+
+    def test_streamed_output_matches_the_in_memory_text(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            (root / "pkg").mkdir()
+            (root / "pkg" / "a.py").write_text("a = 1\n", encoding="utf-8")
+            (root / "b.md").write_text("# b\n", encoding="utf-8")
+            (root / "c.dat").write_bytes(b"\x00binary")
+            for concatenate in (True, False):
+                options = AnalysisOptions(
+                    source_path=directory, is_local=True, concatenate=concatenate, max_total_bytes=8
+                )
+                stream = io.StringIO()
+                streamed = service.run_analysis(options, output=stream)
+                buffered = service.run_analysis(options)
+
+                self.assertEqual(stream.getvalue(), buffered.full_text)
+                self.assertEqual(streamed.full_text, "")
+                self.assertEqual(streamed.file_contents, {})
+                self.assertEqual(streamed.file_positions, buffered.file_positions)
+
+    def test_token_budget_stops_at_the_limit_and_is_recorded(self) -> None:
+        # One token per UTF-8 byte keeps the expected totals easy to derive offline.
+        encoding = tiktoken.Encoding(
+            name="bytes",
+            pat_str=r"[\s\S]",
+            mergeable_ranks={bytes([value]): value for value in range(256)},
+            special_tokens={},
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            (root / "a.py").write_text("x" * 100, encoding="utf-8")
+            (root / "b.py").write_text("y" * 100, encoding="utf-8")
+            everything = len("\n---/---\n\n--a.py--\n") + 100 + len("\n--b.py--\n") + 100
+            results = {}
+            with patch.object(service, "get_encoding", return_value=encoding):
+                for budget in (everything, everything - 1):
+                    options = AnalysisOptions(source_path=directory, is_local=True, max_total_tokens=budget)
+                    results[budget] = service.run_analysis(options)
+                stream = io.StringIO()
+                service.run_analysis(options, output=stream)
+
+        complete, cut = results[everything], results[everything - 1]
+        self.assertEqual(list(complete.file_positions), ["a.py", "b.py"])
+        self.assertEqual(complete.metadata["Tokens"], f"{everything} in concatenated content")
+        self.assertEqual(complete.token_counts, {"a.py": 100, "b.py": 100})
+        self.assertEqual(list(cut.file_positions), ["a.py"])
+        content = cut.full_text.partition("Concatenated content:\n")[2]
+        self.assertLessEqual(len(content), everything - 1)
+        self.assertEqual(cut.metadata["Tokens"], f"{len(content)} in concatenated content")
+        self.assertTrue(stream.getvalue().endswith(f"- Tokens: {len(content)} in concatenated content\n"))
+
+    def test_identical_files_are_written_once_and_the_savings_recorded(self) -> None:
+        encoding = tiktoken.Encoding(
+            name="bytes",
+            pat_str=r"[\s\S]",
+            mergeable_ranks={bytes([value]): value for value in range(256)},
+            special_tokens={},
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            for package in ("one", "two", "three"):
+                (root / package).mkdir()
+                (root / package / "__init__.py").write_text("", encoding="utf-8")
+                (root / package / "stub.py").write_text("x = 1\n" * 20, encoding="utf-8")
+            (root / "three" / "stub.py").write_text("y = 2\n" * 20, encoding="utf-8")
+            options = AnalysisOptions(
+                source_path=directory,
+                is_local=True,
+                max_total_tokens=10_000,
+                deduplicate=True,
+            )
+            with patch.object(service, "get_encoding", return_value=encoding):
+                result = service.run_analysis(options)
+                stream = io.StringIO()
+                service.run_analysis(options, output=stream)
+
+        reference = "[Identical to one/stub.py]\n"
+        saved = 120 - len(reference)
+        self.assertEqual(result.full_text.count(reference), 1)
+        self.assertIn("\n--two/stub.py--\n" + reference, result.full_text)
+        self.assertEqual(result.file_contents["two/stub.py"], "x = 1\n" * 20)
+        self.assertEqual(result.file_contents["two/__init__.py"], "")
+        self.assertEqual(result.token_counts["two/stub.py"], 120)
+        self.assertEqual(
+            result.metadata["Duplicates"],
+            f"1 file identical to an earlier one, {saved} bytes and {saved} tokens saved",
+        )
+        self.assertTrue(stream.getvalue().endswith(f"- Duplicates: {result.metadata['Duplicates']}\n"))
+
+    def test_refresh_reads_only_added_and_changed_files(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            for name in ("same.py", "changed.py", "removed.py"):
+                (root / name).write_text(f"{name}\n", encoding="utf-8")
+            options = AnalysisOptions(source_path=directory, is_local=True)
+            first = service.run_analysis(options)
+
+            (root / "changed.py").write_text("changed, and longer\n", encoding="utf-8")
+            (root / "removed.py").unlink()
+            (root / "pkg").mkdir()
+            (root / "pkg" / "added.py").write_text("added\n", encoding="utf-8")
+            with patch.object(utils, "_read_file", wraps=utils._read_file) as read:
+                refreshed = service.run_analysis(options, previous=first)
+            cold = service.run_analysis(options)
+
+        expected = sorted(str(root / name) for name in ("changed.py", "pkg/added.py"))
+        self.assertEqual(sorted(call.args[0] for call in read.call_args_list), expected)
+        self.assertEqual(refreshed.file_contents["same.py"], first.file_contents["same.py"])
+        self.assertEqual(refreshed.full_text, cold.full_text)
+        self.assertEqual(refreshed.file_positions, cold.file_positions)
+
 
 if __name__ == "__main__":
     unittest.main()
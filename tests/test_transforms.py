@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import ast
+import tempfile
+import unittest
+from dataclasses import replace
+from pathlib import Path
+from unittest.mock import patch
+
+from chareco.core import service, transforms
+from chareco.core.models import AnalysisOptions
+from chareco.core.transforms import python_skeleton, strip_python
+
+
+SOURCE = '''#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Module docstring."""
+
+import os  # trailing comment
+
+
+# A comment block
+
+def documented(value):
+    """Return the value."""
+    return value  # done
+
+
+class Empty:
+    """Only a docstring."""
+
+
+def inline(): """Inline."""; return 1
+
+
+TEMPLATE = """first
+
+
+last"""
+'''
+
+
+class StripPythonTests(unittest.TestCase):
+    def test_comments_and_docstrings_are_removed_without_breaking_code(self) -> None:
+        stripped = strip_python(SOURCE, collapse_blank_lines=True)
+
+        self.assertEqual(
+            stripped,
+            '#!/usr/bin/env python\n'
+            '# -*- coding: utf-8 -*-\n'
+            '\n'
+            'import os\n'
+            '\n'
+            'def documented(value):\n'
+            '    return value\n'
+            '\n'
+            'class Empty:\n'
+            '    ...\n'
+            '\n'
+            'def inline(): ...; return 1\n'
+            '\n'
+            'TEMPLATE = """first\n'
+            '\n'
+            '\n'
+            'last"""\n',
+        )
+        self.assertEqual(ast.dump(ast.parse(strip_python(SOURCE))), ast.dump(ast.parse(stripped)))
+        self.assertEqual(strip_python(stripped, collapse_blank_lines=True), stripped)
+
+    def test_source_that_does_not_parse_is_kept(self) -> None:
+        broken = "def broken(:\n    # comment\n    pass\n"
+        self.assertEqual(strip_python(broken), broken)
+
+    def test_analysis_strips_python_on_a_process_pool_and_reports_the_reduction(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory)
+            for index in range(4):
+                (root / f"module{index}.py").write_text(SOURCE, encoding="utf-8")
+            (root / "notes.md").write_text("# Not Python\n", encoding="utf-8")
+            options = AnalysisOptions(
+                source_path=directory,
+                is_local=True,
+                strip_python=True,
+                collapse_blank_lines=True,
+                read_workers=2,
+            )
+            with patch.object(service, "PARALLEL_TRANSFORM_BYTES", 0):
+                result = service.run_analysis(options)
+
+        stripped = strip_python(SOURCE, collapse_blank_lines=True)
+        self.assertEqual(result.file_contents["module3.py"], stripped)
+        self.assertEqual(result.file_contents["notes.md"], "# Not Python\n")
+        before, after = 4 * len(SOURCE), 4 * len(stripped)
+        self.assertEqual(
+            result.metadata["Python stripping"],
+            f"4 Python files, {before:,} → {after:,} bytes ({1 - after / before:.1%} smaller)",
+        )
+
+    def test_refresh_after_stripping_reads_the_original_source_again(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            (Path(directory) / "module.py").write_text(SOURCE, encoding="utf-8")
+            plain = AnalysisOptions(source_path=directory, is_local=True)
+            stripped = service.run_analysis(replace(plain, strip_python=True))
+            refreshed = service.run_analysis(plain, previous=stripped)
+
+        self.assertEqual(stripped.file_contents["module.py"], strip_python(SOURCE))
+        self.assertEqual(refreshed.file_contents["module.py"], SOURCE)
+
+    def test_skeleton_keeps_signatures_and_docstring_first_lines(self) -> None:
+        source = (
+            'import os\n'
+            'from typing import Protocol\n'
+            'if os.name == "nt":\n'
+            '    def native() -> None:\n'
+            '        pass\n'
+            '\n'
+            'class Store(Protocol):\n'
+            '    """Persist records.\n'
+            '\n'
+            '    Longer explanation.\n'
+            '    """\n'
+            '    name: str = "store"\n'
+            '\n'
+            '    @property\n'
+            '    def size(self) -> int:\n'
+            '        return len(self.records)\n'
+            '\n'
+            'async def load(path: str, *, retries: int = 3) -> Store:\n'
+            '    """Load a store."""\n'
+            '    return await open_store(path, retries)\n'
+        )
+
+        self.assertEqual(
+            python_skeleton(source),
+            '# Outline only: function bodies are elided.\n'
+            'import os\n'
+            'from typing import Protocol\n'
+            '\n'
+            'def native() -> None:\n'
+            '    ...\n'
+            '\n'
+            'class Store(Protocol):\n'
+            '    """Persist records."""\n'
+            '    name: str\n'
+            '\n'
+            '    @property\n'
+            '    def size(self) -> int:\n'
+            '        ...\n'
+            '\n'
+            'async def load(path: str, *, retries: int=3) -> Store:\n'
+            '    """Load a store."""\n'
+            '    ...\n',
+        )
+        self.assertEqual(python_skeleton("def broken(:\n"), "def broken(:\n")
+
+    def test_matching_files_are_outlined_and_cached_by_content(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            root = Path(directory) / "project"
+            (root / "plugins").mkdir(parents=True)
+            (root / "core.py").write_text(SOURCE, encoding="utf-8")
+            (root / "plugins" / "heavy.py").write_text(SOURCE, encoding="utf-8")
+            options = AnalysisOptions(
+                source_path=str(root),
+                is_local=True,
+                python_skeleton=("plugins/*",),
+                cache_dir=str(Path(directory) / "cache"),
+            )
+            first = service.run_analysis(options)
+            with patch.object(transforms, "_transform") as transform:
+                second = service.run_analysis(options)
+
+        transform.assert_not_called()
+        self.assertEqual(second.full_text, first.full_text)
+        self.assertEqual(first.file_contents["core.py"], SOURCE)
+        self.assertEqual(first.file_contents["plugins/heavy.py"], python_skeleton(SOURCE))
+        self.assertNotIn("Python stripping", first.metadata)
+        self.assertTrue(first.metadata["Python outlines"].startswith("1 Python file, "))
+
+    def test_refresh_after_outlining_reads_files_in_full_again(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            (Path(directory) / "plugins").mkdir()
+            (Path(directory) / "plugins" / "heavy.py").write_text(SOURCE, encoding="utf-8")
+            plain = AnalysisOptions(source_path=directory, is_local=True)
+            outlined = service.run_analysis(replace(plain, python_skeleton=("plugins/*",)))
+            refreshed = service.run_analysis(plain, previous=outlined)
+
+        self.assertEqual(outlined.file_contents["plugins/heavy.py"], python_skeleton(SOURCE))
+        self.assertEqual(refreshed.file_contents["plugins/heavy.py"], SOURCE)
+
+
+if __name__ == "__main__":
+    unittest.main()
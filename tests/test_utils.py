@@ -2,10 +2,15 @@ from __future__ import annotations
 
 import tempfile
 import unittest
+from concurrent.futures import Future
 from pathlib import Path
 from unittest.mock import patch
 
+from dulwich import porcelain
+
 from chareco.core import utils
+from chareco.core.cache import ContentCache, ConversionCache
+from chareco.core.filters import FilterSpec
 
 
 class UtilsTests(unittest.TestCase):
@@ -53,6 +58,21 @@ class UtilsTests(unittest.TestCase):
         self.assertNotIn("node_modules", structure)
         self.assertEqual(list(positions), ["src/main.py"])
 
+    def test_symlinked_files_and_directories_are_not_followed(self) -> None:
+        self.write("real/main.py", "main")
+        try:
+            (self.root / "linked").symlink_to(self.root / "real", target_is_directory=True)
+            (self.root / "alias.py").symlink_to(self.root / "real" / "main.py")
+        except OSError:
+            self.skipTest("symlinks are not available")
+
+        structure = utils.get_structure(self.root)
+        _content, positions, _files = utils.concatenate_files(self.root)
+
+        self.assertNotIn("linked", structure)
+        self.assertNotIn("alias.py", structure)
+        self.assertEqual(list(positions), ["real/main.py"])
+
     def test_limits_skip_oversized_content(self) -> None:
         self.write("small.py", "small")
         self.write("large.py", "x" * 64)
@@ -74,6 +94,243 @@ class UtilsTests(unittest.TestCase):
         self.assertEqual(list(positions), ["a.py"])
         self.assertIn("[Output limit reached; remaining files were skipped.]", content)
 
+    def test_parallel_reads_match_serial_output_and_cutoff(self) -> None:
+        for index in range(40):
+            self.write(f"pkg{index % 3}/file{index:02d}.py", f"value = {index}\n" * (index + 1))
+
+        for max_total_bytes in (10_000_000, 2_000):
+            serial = utils.concatenate_files(self.root, max_total_bytes=max_total_bytes, read_workers=1)
+            parallel = utils.concatenate_files(self.root, max_total_bytes=max_total_bytes, read_workers=8)
+            self.assertEqual(parallel, serial)
+
+    def test_notebook_pool_matches_serial_output_and_reuses_cache(self) -> None:
+        notebook = (
+            '{"cells": [{"cell_type": "code", "execution_count": null, "metadata": {}, '
+            '"outputs": [], "source": ["print(%d)"]}], "metadata": {}, '
+            '"nbformat": 4, "nbformat_minor": 5}'
+        )
+        for index in range(3):
+            self.write(f"notebooks/n{index}.ipynb", notebook % index)
+        cache = ConversionCache(self.root / ".cache", "notebooks")
+
+        serial = utils.concatenate_files(self.root, include=[".ipynb"])
+        with patch.object(utils, "PARALLEL_NOTEBOOK_BYTES", 0):
+            with patch.object(utils, "ProcessPoolExecutor", wraps=utils.ProcessPoolExecutor) as pool:
+                pooled = utils.concatenate_files(
+                    self.root, include=[".ipynb"], notebook_workers=2, notebook_cache=cache
+                )
+            self.assertEqual(pool.call_count, 1)
+            self.assertEqual(pooled, serial)
+            self.assertIn("print(2)", serial[2]["notebooks/n2.ipynb"])
+
+            import jupytext
+
+            with (
+                patch.object(jupytext, "reads", side_effect=AssertionError("cache miss")),
+                patch.object(utils, "ProcessPoolExecutor", side_effect=AssertionError("pool started")),
+            ):
+                cached = utils.concatenate_files(
+                    self.root, include=[".ipynb"], notebook_workers=2, notebook_cache=cache
+                )
+            self.assertEqual(cached, serial)
+
+    def test_notebooks_are_converted_in_process_when_the_pool_fails(self) -> None:
+        self.write("a.ipynb", '{"cells": [], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}')
+        self.write("b.ipynb", '{"cells": [], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}')
+
+        class BrokenPool:
+            def __init__(self, **_options: object) -> None:
+                pass
+
+            def submit(self, *_arguments: object) -> Future[str | None]:
+                future: Future[str | None] = Future()
+                future.set_exception(RuntimeError("broken pool"))
+                return future
+
+            def shutdown(self, **_options: object) -> None:
+                pass
+
+        serial = utils.concatenate_files(self.root, include=[".ipynb"])
+        with (
+            patch.object(utils, "PARALLEL_NOTEBOOK_BYTES", 0),
+            patch.object(utils, "ProcessPoolExecutor", BrokenPool),
+            self.assertLogs(utils.logger, "WARNING"),
+        ):
+            pooled = utils.concatenate_files(self.root, include=[".ipynb"], notebook_workers=2)
+
+        self.assertEqual(pooled, serial)
+        self.assertEqual(list(pooled[1]), ["a.ipynb", "b.ipynb"])
+
+    def test_each_file_is_opened_once_to_sniff_and_read(self) -> None:
+        self.write("a.py", "a = 1\n")
+        self.write("big.txt", "line\n" * 5_000)
+        (self.root / "blob.dat").write_bytes(b"\x00" * 64)
+
+        with patch.object(utils, "open", create=True, wraps=open) as opened:
+            content, positions, _files = utils.concatenate_files(self.root)
+            self.assertEqual(utils.read_text_file(self.root / "big.txt"), "line\n" * 5_000)
+
+        self.assertEqual(list(positions), ["a.py", "big.txt"])
+        self.assertIn("line\n" * 5_000, content)
+        self.assertEqual(
+            sorted(Path(call.args[0]).name for call in opened.call_args_list),
+            ["a.py", "big.txt", "big.txt", "blob.dat"],
+        )
+
+    def test_output_budget_counts_utf8_bytes_of_decoded_text(self) -> None:
+        text = "café ✓\n"
+        for encoding in ("utf-8", "utf-8-sig", "utf-16", "utf-32"):
+            path = self.root / f"{encoding}.txt"
+            path.write_text(text, encoding=encoding)
+            loaded = utils._load_text(path, 1_000, None, None)
+            self.assertEqual((loaded.text, loaded.size), (text, len(text.encode("utf-8"))), encoding)
+
+        budget = len(text.encode("utf-8")) * 4
+        _content, positions, _files = utils.concatenate_files(self.root, max_total_bytes=budget)
+        self.assertEqual(len(positions), 4)
+        _content, positions, _files = utils.concatenate_files(self.root, max_total_bytes=budget - 1)
+        self.assertEqual(len(positions), 3)
+
+    def test_content_cache_serves_unchanged_files_and_evicts_old_entries(self) -> None:
+        self.write("a.py", "a = 1\n")
+        self.write("b.py", "b = 2\n")
+        with tempfile.TemporaryDirectory() as cache_directory:
+            with ContentCache(cache_directory) as cache:
+                first = utils.concatenate_files(self.root, content_cache=cache)
+
+            self.write("b.py", "b = 3  # changed\n")
+            with ContentCache(cache_directory) as cache:
+                with patch.object(utils, "_read_file", wraps=utils._read_file) as read:
+                    second = utils.concatenate_files(self.root, content_cache=cache)
+                    self.assertEqual(utils.read_text_file(self.root / "a.py", cache=cache), "a = 1\n")
+            self.assertEqual(second[2]["a.py"], first[2]["a.py"])
+            self.assertEqual(second[2]["b.py"], "b = 3  # changed\n")
+            self.assertEqual([call.args[0] for call in read.call_args_list], [str(self.root / "b.py")])
+
+            # Two rows with their per-row overhead exceed 200 bytes; evicting the older one suffices.
+            with ContentCache(cache_directory, max_bytes=200) as cache:
+                utils.concatenate_files(self.root, exclude_folders=["a.py"], content_cache=cache)
+            with ContentCache(cache_directory) as cache:
+                with patch.object(utils, "_read_file", wraps=utils._read_file) as read:
+                    utils.concatenate_files(self.root, content_cache=cache)
+            self.assertEqual([call.args[0] for call in read.call_args_list], [str(self.root / "a.py")])
+
+    def test_rows_holding_only_a_verdict_count_toward_the_cache_size(self) -> None:
+        with tempfile.TemporaryDirectory() as cache_directory:
+            with ContentCache(cache_directory, max_bytes=ContentCache._ROW_OVERHEAD_BYTES * 10) as cache:
+                for inode in range(1, 101):
+                    cache.put_binary((1, inode, 2, 1), True)
+                cache.flush()
+                self.assertIsNone(cache.get((1, 1, 2, 1)))
+                self.assertTrue(cache.get((1, 100, 2, 1)).binary)
+                rows = cache._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            self.assertLessEqual(rows, 10)
+
+    def test_two_processes_can_write_to_one_content_cache_at_once(self) -> None:
+        with tempfile.TemporaryDirectory() as cache_directory:
+            with ContentCache(cache_directory) as first, ContentCache(cache_directory) as second:
+                first.put_content((1, 1, 2, 1), "a1", 2)
+                first.flush()
+                second.put_content((1, 2, 2, 1), "b1", 2)
+                second.flush()
+                with patch.object(ContentCache, "_COMMIT_AFTER_SECONDS", 0):
+                    first.put_content((1, 3, 2, 1), "a2", 2)
+                    second.put_content((1, 4, 2, 1), "b2", 2)
+
+                    self.assertEqual(first.get((1, 2, 2, 1)).content, "b1")
+                    self.assertEqual(first.get((1, 4, 2, 1)).content, "b2")
+                    self.assertEqual(second.get((1, 3, 2, 1)).content, "a2")
+
+    def test_files_read_without_sniffing_keep_a_verdict_for_the_folder_structure(self) -> None:
+        self.write("a.py", "a = 1\n")
+        self.write("n.ipynb", '{"cells": [], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}')
+        manifest = utils.scan_tree(self.root, FilterSpec.compile(), sniff_binary=False)
+        with tempfile.TemporaryDirectory() as cache_directory, ContentCache(cache_directory) as cache:
+            cache.put_binary(utils._entry_key(manifest.by_path()["a.py"]), False)
+            _content, positions, _files = utils.serialize_manifest(manifest, content_cache=cache)
+            with patch.object(utils, "_sniff_binary", side_effect=AssertionError("sniffed again")):
+                utils.resolve_binary_flags(manifest, cache)
+
+        self.assertEqual(list(positions), ["a.py", "n.ipynb"])
+        self.assertEqual([entry.binary for entry in manifest.eligible_files()], [False, False])
+
+    def test_rescanning_changed_directories_matches_a_fresh_scan(self) -> None:
+        for relative_path in ("a/one.py", "a/deep/two.py", "b/three.py", "b/c/four.py", "top.py"):
+            self.write(relative_path, "x = 1\n")
+        filters = utils.FilterSpec.compile()
+        previous = utils.scan_tree(self.root, filters)
+
+        self.write("a/one.py", "x = 22\n")
+        self.write("a/deep/new/five.py", "x = 5\n")
+        self.write("a.b/six.py", "x = 6\n")
+        (self.root / "b" / "c" / "four.py").unlink()
+        (self.root / "b" / "c").rmdir()
+        (self.root / "top.py").unlink()
+
+        rescanned = utils.rescan_tree(previous, filters, {"", "a", "a/deep", "b", "b/c"})
+        fresh = utils.scan_tree(self.root, filters)
+        self.assertEqual(rescanned, fresh)
+
+    def test_index_scan_lists_tracked_files_without_walking_directories(self) -> None:
+        tracked = ("a/one.py", "a/deep/two.py", "a.b/three.py", "b/four.py", "top.py", "gone.py")
+        for relative_path in tracked:
+            self.write(relative_path, "x = 1\n")
+        porcelain.init(str(self.root)).close()
+        porcelain.add(str(self.root), [str(self.root / relative_path) for relative_path in tracked])
+        (self.root / "gone.py").unlink()
+        self.write("node_modules/pkg/index.js", "untracked\n")
+        self.write("a/untracked.py", "untracked\n")
+        filters = utils.FilterSpec.compile(exclude_patterns=("b/",))
+
+        with patch.object(utils, "_scandir_sorted") as scandir:
+            indexed = utils.scan_index(self.root / "a", filters)
+            everything = utils.scan_index(self.root, filters)
+        scandir.assert_not_called()
+
+        self.assertEqual([entry.relative_path for entry in indexed.files()], ["one.py", "deep/two.py"])
+        for relative_path in ("node_modules/pkg/index.js", "a/untracked.py"):
+            (self.root / relative_path).unlink()
+        (self.root / "node_modules" / "pkg").rmdir()
+        (self.root / "node_modules").rmdir()
+        self.assertEqual(everything, utils.scan_tree(self.root, filters))
+
+    def test_snapshot_copies_only_files_the_scan_can_read(self) -> None:
+        source = self.root / "source"
+        for relative_path in ("main.py", "pkg/util.py", "pkg/.git/config", "build/out.py", "notes.log"):
+            self.write(f"source/{relative_path}", "x = 1\n")
+        self.write("source/big.py", "x" * 100)
+        (source / "image.gif").write_bytes(b"GIF89a")
+        (source / "empty").mkdir()
+        filters = utils.FilterSpec.compile(exclude=[".log"], exclude_patterns=["build/"])
+        reports: list[tuple[int, int]] = []
+
+        copied = utils.copy_snapshot(
+            source,
+            self.root / "copy",
+            filters,
+            max_file_bytes=50,
+            workers=2,
+            progress=lambda *report: reports.append(report),
+        )
+
+        copied_files = sorted(path.relative_to(self.root / "copy").as_posix() for path in (self.root / "copy").rglob("*"))
+        self.assertEqual(copied_files, ["empty", "main.py", "pkg", "pkg/util.py"])
+        self.assertEqual(copied, 12)
+        self.assertEqual(reports, [(6, 12), (12, 12)])
+        self.assertEqual(
+            (self.root / "copy" / "pkg" / "util.py").stat().st_mtime_ns,
+            (source / "pkg" / "util.py").stat().st_mtime_ns,
+        )
+        with patch.object(utils._SnapshotCopier, "_clone", return_value=False), patch.object(
+            utils._SnapshotCopier, "_copy_range", return_value=False
+        ):
+            utils.copy_snapshot(source, self.root / "plain", filters, max_file_bytes=50)
+        self.assertEqual((self.root / "plain" / "main.py").read_text(encoding="utf-8"), "x = 1\n")
+        self.assertEqual(
+            utils.render_structure(utils.scan_tree(self.root / "copy", filters, 50)).splitlines()[1:],
+            utils.render_structure(utils.scan_tree(source, filters, 50)).splitlines()[1:],
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
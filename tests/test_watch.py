@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QCoreApplication, QElapsedTimer
+
+from chareco.core.filters import FilterSpec
+from chareco.core.utils import scan_tree
+from chareco.core.watch import FolderWatcher
+
+
+class FolderWatcherTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.qt_app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self) -> None:
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.temporary_directory.name)
+        for relative_path in ("a/one.py", "a/two.py", "b/three.py", "top.py"):
+            path = self.root / relative_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("x = 1\n", encoding="utf-8")
+        self.manifest = scan_tree(self.root, FilterSpec.compile())
+
+    def tearDown(self) -> None:
+        self.temporary_directory.cleanup()
+
+    def test_burst_of_events_is_reported_once_per_settled_batch(self) -> None:
+        watcher = FolderWatcher(delay_ms=100, max_delay_ms=1_000)
+        batches = []
+        watcher.changed.connect(batches.append)
+        watcher.watch(self.manifest)
+
+        (self.root / "a" / "one.py").write_text("x = 2\n", encoding="utf-8")
+        (self.root / "a" / "new.py").write_text("x = 3\n", encoding="utf-8")
+        (self.root / "b" / "three.py").unlink()
+
+        elapsed = QElapsedTimer()
+        elapsed.start()
+        while not batches and elapsed.elapsed() < 3_000:
+            QCoreApplication.processEvents()
+        elapsed.start()
+        while elapsed.elapsed() < 300:  # a second, late batch would arrive within this window
+            QCoreApplication.processEvents()
+        watcher.stop()
+
+        self.assertEqual(batches, [frozenset({"a", "b"})])
+
+    def test_watch_budget_prefers_shallow_directories(self) -> None:
+        watcher = FolderWatcher(max_watches=2)
+        watcher.watch(self.manifest)
+        watched = watcher._watcher.directories() + watcher._watcher.files()
+        truncated = watcher.truncated
+        watcher.stop()
+
+        self.assertTrue(truncated)
+        self.assertEqual(len(watched), 2)
+        self.assertIn(str(self.root.resolve()), watched)
+        self.assertTrue(all(os.path.isdir(path) for path in watched))
+
+
+if __name__ == "__main__":
+    unittest.main()